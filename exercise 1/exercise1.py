@@ -1,6 +1,22 @@
+import os
+import sys
 import tkinter as tk
 import random
 
+# ---------------- GRADING SCHEME ----------------
+# Grade boundaries live in grading_schemes.json and are read by the grading
+# module shared with the Student Manager (exercise 3). The shared folder goes
+# last on the path, so nothing in it can shadow a module of this one.
+SHARED_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared"))
+if SHARED_DIR not in sys.path:
+    sys.path.append(SHARED_DIR)
+from student_grading import load_schemes
+
+GRADING_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grading_schemes.json")
+GRADING_SCHEME = "math-quiz"
+MAX_SCORE = 100
+GRADE_TABLE = load_schemes(GRADING_CONFIG)[GRADING_SCHEME].compile(MAX_SCORE)  # Grade of every possible score
+
 class MathQuiz:
     def __init__(self, root):
         # Initialize the main window and quiz variables
@@ -165,7 +181,7 @@ class MathQuiz:
         grade = self.calculateGrade()
 
         tk.Label(main_frame, text="Quiz Completed!", font=("Arial", 22, "bold"), bg="#f0f8ff", fg="#2e8b57").pack(pady=20)
-        tk.Label(main_frame, text=f"Final Score: {self.score}/100", font=("Arial", 18), bg="#f0f8ff", fg="#000080").pack(pady=10)
+        tk.Label(main_frame, text=f"Final Score: {self.score}/{MAX_SCORE}", font=("Arial", 18), bg="#f0f8ff", fg="#000080").pack(pady=10)
         tk.Label(main_frame, text=f"Rank: {grade}", font=("Arial", 18, "bold"), bg="#f0f8ff", fg="#ff4500").pack(pady=10)
 
         play_again_btn = tk.Button(main_frame, text="Play Again", font=("Arial", 14), bg="#32cd32", fg="white", command=self.displayMenu)
@@ -180,18 +196,7 @@ class MathQuiz:
 
     # ---------------- GRADE CALCULATOR ----------------
     def calculateGrade(self):
-        if self.score >= 90:
-            return "A+"
-        elif self.score >= 80:
-            return "A"
-        elif self.score >= 70:
-            return "B"
-        elif self.score >= 60:
-            return "C"
-        elif self.score >= 50:
-            return "D"
-        else:
-            return "F"
+        return GRADE_TABLE.grade[self.score]
 
 
 # ---------------- RUN APP ----------------
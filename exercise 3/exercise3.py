@@ -1,7 +1,21 @@
 import tkinter as tk
-from tkinter import messagebox, simpledialog
+from tkinter import messagebox, simpledialog, filedialog
 from tkinter import ttk # Import ttk for themed widgets and structured data display
 import os
+import queue
+import threading
+import contextlib
+from collections.abc import Sequence
+from virtual_treeview import VirtualTreeview
+from student_metrics import METRICS
+from student_storage import StorageError, open_store
+from student_saver import SAVED, UNSAVED, SAVING, FAILED
+from student_changes import ChangeFileError, read_change_file, plan_changes
+from student_history import EditHistory
+from student_fuzzy import suggested_distance
+from student_export import export_graded
+from student_query import QueryError, compile_query
+from student_engine import MAX_TOTAL_MARK, process_record, validate_name, iter_column_batches
 # NOTE on Images: To use common formats (like PNG or JPG) for button backgrounds 
 # or images, you MUST install the Pillow library: pip install Pillow.
 # Then, you would use 'from PIL import Image, ImageTk' and load the image 
@@ -9,63 +23,38 @@ import os
 
 # --- Configuration and File Setup ---
 
-FILE_NAME = "studentMarks.txt" 
-MAX_CW_MARK = 60    # Total max mark for the 3 Courseworks (3 * 20)
-MAX_EXAM_MARK = 100
-MAX_TOTAL_MARK = 160 # Overall total possible mark (60 + 100)
-
-# --- Data Processing Functions ---
-
-def calculate_grade(percentage):
-    """Calculates the student grade based on overall percentage."""
-    if percentage >= 70:
-        return 'A'
-    elif percentage >= 60:
-        return 'B'
-    elif percentage >= 50:
-        return 'C'
-    elif percentage >= 40:
-        return 'D'
-    else:
-        return 'F'
-
-def process_record(parts):
-    """
-    Processes raw data parts into a fully calculated student dictionary, 
-    including total mark, percentage, and grade.
-    """
-    try:
-        # Data Extraction and Conversion
-        code = int(parts[0].strip())
-        name = parts[1].strip()
-        cw_marks = [int(m.strip()) for m in parts[2:5]]
-        exam_mark = int(parts[5].strip())
-
-        # Validation (Ensures marks are within defined bounds)
-        if not (0 <= exam_mark <= MAX_EXAM_MARK and all(0 <= m <= 20 for m in cw_marks)):
-             raise ValueError("Mark out of defined range (CW max 20, Exam max 100).")
-
-        # Core Calculations
-        total_coursework = sum(cw_marks)
-        total_mark = total_coursework + exam_mark
-        percentage = (total_mark / MAX_TOTAL_MARK) * 100
-        grade = calculate_grade(percentage)
-
-        return {
-            'code': code,
-            'name': name,
-            'cw1': cw_marks[0],
-            'cw2': cw_marks[1],
-            'cw3': cw_marks[2],
-            'exam': exam_mark,
-            'total_coursework': total_coursework,
-            'total_mark': total_mark,
-            'percentage': round(percentage, 2),
-            'grade': grade
-        }
-    except (ValueError, IndexError) as e:
-        print(f"Error processing record: {parts}. Skipping record. Error: {e}")
-        return None
+FILE_NAME = "studentMarks.txt"  # A marks file, a SQLite database (.db) made by 'student_engine.py import', or a shard manifest (.shards.json) made by 'student_engine.py shard'
+USE_JOURNAL = True  # Append each edit to a change journal instead of rewriting FILE_NAME
+LOAD_POLL_MS = 50            # How often the Tk loop collects parsed batches from the loader thread
+LOAD_ROWS_PER_TICK = 20000   # Most rows merged into the table per poll, to keep the window responsive
+LOAD_QUEUE_BATCHES = 8       # Parsed batches the loader thread may run ahead by
+# Timing instrumentation is off unless STUDENT_METRICS=1 is set (see student_metrics.py)
+METRICS_DUMP_PATH = FILE_NAME + ".metrics.json"
+METRICS_DUMP_MS = 60_000            # How often timings are dumped to METRICS_DUMP_PATH
+METRICS_PANEL_REFRESH_MS = 1000     # How often an open Timings panel refreshes
+FOLLOW_FILE = True           # Pick up students other programs append to FILE_NAME while it is open
+FOLLOW_POLL_MS = 1000        # How often FILE_NAME is checked for changes (one stat() call)
+FUZZY_MAX_DISTANCE = 2       # Most typing mistakes (edits) tolerated when suggesting similar names (at most 2)
+FUZZY_MAX_RESULTS = 50       # Most similar names listed
+EXPORT_POLL_MS = 200         # How often the Tk loop checks whether a background export has finished
+INDEX_POLL_MS = 200          # How often the Tk loop checks whether the name search indexes have been built
+INDEX_BUILDING_TEXT = " | Building name search index..."
+SAVE_STATUS_POLL_MS = 250    # How often the save status (edits written behind, see student_saver.py) is refreshed
+SAVE_STATUS_TEXT = {SAVED: "All changes saved", UNSAVED: "Unsaved changes", SAVING: "Saving...", FAILED: "Save failed"}
+
+# --- Display Helpers ---
+# (Grading, parsing and file I/O live in student_engine.py, which runs without tkinter)
+
+def format_treeview_row(student):
+    """Returns the Treeview column values for a student record."""
+    return (
+        student['code'],
+        student['name'],
+        student['total_coursework'],
+        student['exam'],
+        f"{student['percentage']:.2f}",
+        student['grade']
+    )
 
 # --- Main Application Class ---
 
@@ -99,8 +88,16 @@ class StudentManagerApp:
         master.title("Student Manager (File: studentMarks.txt)")
         master.config(menu=tk.Menu(master, tearoff=0)) 
 
-        self.student_data = []
-        self.load_data() 
+        # The storage backend (see student_storage.py) holds the roster and persists every edit
+        self.store = open_store(FILE_NAME, use_journal=USE_JOURNAL)
+        self.history = EditHistory(self.store)
+        self.last_query = ""  # Offered again the next time the query dialog opens
+        self.export_thread = None
+        self.index_thread = None
+        self.indexes_ready = False  # Partial and fuzzy name searches wait for the index build they start
+        self.save_state = None  # Save status last shown
+        self.loading = False
+        self.load_complete = False
         
         # --- NEW: Add Heading ---
         self.create_heading_label()
@@ -108,26 +105,25 @@ class StudentManagerApp:
         # UI Setup
         self.create_buttons()
         self.create_treeview_area() 
-        
-        if not self.student_data:
-             self.display_message("Error: Could not load any student data. Check your file format.")
-        else:
-             self.view_all_records()
+
+        # The window is up before any parsing starts; records stream in behind it
+        self.start_background_load()
+
+        self.master.bind('<Control-z>', lambda e: self.undo_edit())
+        self.master.bind('<Control-y>', lambda e: self.redo_edit())
+        if FOLLOW_FILE:
+            self.master.after(FOLLOW_POLL_MS, self.follow_file)
+        self.poll_save_status()
+        if METRICS.enabled:
+            self.master.bind('<F12>', lambda e: self.show_metrics_panel())
+            self.master.after(METRICS_DUMP_MS, self.dump_metrics)
 
     def load_data(self):
-        """Loads student data from the file, processes it, and stores it in memory."""
-        self.student_data = []
+        """Loads student data through the storage backend, ready for queries."""
         try:
-            with open(FILE_NAME, 'r') as f:
-                f.readline() # Read and discard the student count
-                
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        parts = line.split(',')
-                        record = process_record(parts)
-                        if record:
-                            self.student_data.append(record)
+            # FILE_NAME may hold the text format, the binary format or a database
+            self.store.load()
+            self.load_complete = True
             return True
         except FileNotFoundError:
             messagebox.showerror("File Error", f"The data file '{FILE_NAME}' was not found. Please ensure it is uploaded.")
@@ -136,24 +132,315 @@ class StudentManagerApp:
             messagebox.showerror("Error", f"An unexpected error occurred while loading data: {e}")
             return False
 
-    def save_data(self):
-        """Writes the current in-memory data back to the file, ensuring persistence."""
+    # --- Background Loading ---
+
+    def start_background_load(self):
+        """Starts parsing FILE_NAME on a worker thread; poll_loader merges the batches in."""
+        if not self.store.loads_in_background:
+            # Nothing to stream in: the backend answers queries straight from disk
+            self.progress_frame.pack_forget()
+            if self.load_data():
+                self.view_all_records()
+            return
+
+        self.store.begin_load()
+        self.history.clear()  # Edits made before a reload no longer apply to what is on disk
+        self.loading = True
+        self.load_complete = False
+        self.indexes_ready = False
+        self.load_queue = queue.Queue(maxsize=LOAD_QUEUE_BATCHES)
+        self.load_cancelled = threading.Event()
+        self.progress['value'] = 0
+        self.progress_frame.pack(fill='x', pady=(0, 5), before=self.view.scrollbar)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.summary_label.config(text="Current Status: Loading student records...")
+
+        threading.Thread(target=self._load_worker, name="marks-loader", daemon=True).start()
+        self.master.after(LOAD_POLL_MS, self.poll_loader)
+
+    def _load_worker(self):
+        """Runs on the loader thread: parses batches and queues them, never touching Tk or the table."""
+        try:
+            # Leaving the block closes the parser, which stops the worker processes before 'done' is queued
+            with contextlib.closing(iter_column_batches(FILE_NAME, end=self.store.load_end())) as batches:
+                for columns, errors, fraction in batches:
+                    self.load_queue.put(('batch', (columns, errors, fraction)))
+                    # Checked after the (possibly blocking) put, so a cancel never waits for another batch
+                    if self.load_cancelled.is_set():
+                        break
+            self.load_queue.put(('done', None))
+        except Exception as e:
+            self.load_queue.put(('error', e))
+
+    def poll_loader(self):
+        """Merges queued batches into the table (within a per-tick budget) and refreshes the view."""
+        merged = 0
+        fraction = None
+        while merged < LOAD_ROWS_PER_TICK:
+            try:
+                kind, payload = self.load_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind != 'batch':
+                self.finish_loading(error=payload)
+                return
+            columns, errors, fraction = payload
+            if errors:
+                print(errors, end='')
+            if not self.load_cancelled.is_set():
+                self.store.table.extend_columns(*columns)
+                merged += len(columns[0])
+
+        if fraction is not None:
+            self.progress['value'] = fraction * 100
+        if merged:
+            self.view_all_records(keep_position=True)
+            self.summary_label.config(text=f"{self.summary_label.cget('text')} | Loading... {self.progress['value']:.0f}%")
+        self.master.after(LOAD_POLL_MS, self.poll_loader)
+
+    def cancel_loading(self):
+        """Stops the background load, keeping the students loaded so far (read-only)."""
+        self.load_cancelled.set()
+        self.cancel_button.config(state=tk.DISABLED)
+
+    def finish_loading(self, error=None):
+        """Called once the loader thread has finished, failed or been cancelled."""
+        self.loading = False
+        self.progress_frame.pack_forget()
+
+        if isinstance(error, FileNotFoundError):
+            messagebox.showerror("File Error", f"The data file '{FILE_NAME}' was not found. Please ensure it is uploaded.")
+        elif error is not None:
+            messagebox.showerror("Error", f"An unexpected error occurred while loading data: {error}")
+        if error is None and not self.load_cancelled.is_set():
+            # Edits made since the last full save live in the change journal
+            self.store.replay_journal()
+            self.load_complete = True
+        else:
+            self.store.abandon_load()
+
+        if not len(self.store):
+            self.display_message("Error: Could not load any student data. Check your file format.")
+        else:
+            self.view_all_records(keep_position=True)
+            if self.load_cancelled.is_set():
+                self.summary_label.config(text=f"{self.summary_label.cget('text')} | Loading cancelled: partial roster (read-only)")
+
+    def start_index_build(self):
+        """
+        Builds the indexes partial and fuzzy name searches need on a worker
+        thread (a few seconds per million names), so that no search has to
+        build them on the Tk thread. They cost several times the roster itself,
+        so only the first such search starts the build (see
+        ensure_name_search_ready); until they are in, those searches ask the
+        user to wait. Code lookups and exact names work throughout.
+        """
+        if self.index_thread is not None and self.index_thread.is_alive():
+            return  # poll_index_build starts again if the roster changed too much meanwhile
+        build = self.store.search_index_builder()
+        if build is None:
+            self.indexes_ready = True
+            return
+        self.indexes_ready = False
+        outcome = queue.Queue(maxsize=1)
+
+        def work():
+            try:
+                outcome.put(('done', build()))
+            except Exception as e:
+                outcome.put(('error', e))
+
+        self.index_thread = threading.Thread(target=work, name="index-builder", daemon=True)
+        self.index_thread.start()
+        self.summary_label.config(text=self.summary_label.cget('text') + INDEX_BUILDING_TEXT)
+        self.master.after(INDEX_POLL_MS, lambda: self.poll_index_build(outcome))
+
+    def poll_index_build(self, outcome):
+        """Installs the background-built indexes once their thread has finished."""
         try:
-            with open(FILE_NAME, 'w') as f:
-                # 1. Write the count of students (required file format)
-                f.write(f"{len(self.student_data)}\n")
-                
-                # 2. Write each student record in the original comma-separated format
-                for student in self.student_data:
-                    line = (
-                        f"{student['code']},{student['name']},{student['cw1']},"
-                        f"{student['cw2']},{student['cw3']},{student['exam']}\n"
-                    )
-                    f.write(line)
+            kind, payload = outcome.get_nowait()
+        except queue.Empty:
+            self.master.after(INDEX_POLL_MS, lambda: self.poll_index_build(outcome))
+            return
+        if self.loading:
+            return  # A reload started meanwhile; the next name search builds the index again
+        if kind == 'error':
+            # Searches then build the indexes themselves, as they would without a background build
+            print(f"Could not build the name search index: {payload}")
+        elif not self.store.install_search_indexes(payload):
+            self.start_index_build()
+            return
+        self.indexes_ready = True
+        text = self.summary_label.cget('text')
+        if text.endswith(INDEX_BUILDING_TEXT):
+            self.summary_label.config(text=text[:-len(INDEX_BUILDING_TEXT)])
+
+    def ensure_name_search_ready(self):
+        """
+        Partial and fuzzy name searches wait until their indexes are built,
+        starting the build the first time one is needed (see start_index_build).
+        """
+        if not self.indexes_ready:
+            self.start_index_build()
+        if self.indexes_ready:
+            return True
+        self.display_message("The name search index is still being built. Try again in a moment, or search by student code.")
+        return False
+
+    def follow_file(self):
+        """
+        Runs every FOLLOW_POLL_MS: asks the backend for changes other programs
+        made on disk. Appended students are merged in place; a rewritten file
+        is reloaded from scratch.
+        """
+        if self.load_complete and not self.loading:
+            try:
+                change = self.store.poll_changes()
+            except (OSError, StorageError) as e:
+                print(f"Could not check {FILE_NAME} for changes: {e}")
+                change = None
+            if change is not None and change.reload:
+                try:
+                    self.start_background_load()
+                except StorageError as e:
+                    # Pending edits must reach the journal before it is replayed: try again next time
+                    print(f"Could not reload {FILE_NAME}: {e}")
+            elif change is not None:
+                self.view_all_records(keep_position=True)
+                if change.merged:
+                    self.summary_label.config(text=f"{self.summary_label.cget('text')} | "
+                                                   f"{change.merged} record(s) picked up from disk")
+                # A backend that had to drop its indexes (a database changed by someone else) rebuilds them when next searched
+                self.indexes_ready = False
+        self.master.after(FOLLOW_POLL_MS, self.follow_file)
+
+    def ensure_editable(self):
+        """Edits are only allowed once the whole file (and its journal) has been loaded."""
+        if self.load_complete:
             return True
-        except IOError:
-            messagebox.showerror("File Error", f"Could not write to file: {FILE_NAME}. Changes not saved.")
+        if self.loading:
+            messagebox.showwarning("Please Wait", "Student records are still loading. Try again once loading has finished.")
+        else:
+            messagebox.showwarning("Read-Only", "Only part of the file was loaded, so records cannot be changed. Restart the application to edit.")
+        return False
+
+    def persist_changes(self, puts=(), deletes=(), description="Edit"):
+        """
+        Applies and persists one edit through the storage backend (a journal
+        append or a file rewrite for marks files, written behind on a
+        background thread; one transaction for a database), recording it for
+        undo. Returns False, after telling the user, if it was rejected; a
+        background write that fails later shows in the save status instead.
+        """
+        try:
+            self.history.apply(puts=puts, deletes=deletes, description=description)
+        except StorageError as e:
+            messagebox.showerror("File Error", f"{e} Changes not saved.")
             return False
+        self.refresh_save_status()
+        return True
+
+    # --- Undo / Redo ---
+
+    def undo_edit(self):
+        """Reverts the latest add, delete, update or bulk update (Ctrl+Z)."""
+        self._step_history(self.history.undo, "Undid", "Nothing to undo.")
+
+    def redo_edit(self):
+        """Re-applies the latest undone edit (Ctrl+Y)."""
+        self._step_history(self.history.redo, "Redid", "Nothing to redo.")
+
+    def _step_history(self, step, verb, nothing_message):
+        if not self.ensure_editable():
+            return
+        try:
+            description = step()
+        except StorageError as e:
+            messagebox.showerror("File Error", f"{e} Changes not saved.")
+            return
+        except ValueError as e:
+            # An edit that can no longer be replayed (see student_history._records); the stacks are left as they were
+            messagebox.showerror("Undo Error", f"Could not replay the edit: {e}")
+            return
+        if description is None:
+            self.display_message(nothing_message)
+            return
+        self.refresh_save_status()
+        self.view_all_records(keep_position=True)
+        self.summary_label.config(text=f"{self.summary_label.cget('text')} | {verb}: {description}")
+
+    # --- Save Status ---
+
+    def refresh_save_status(self):
+        """Shows whether edits are waiting to be written, being written or safely on disk."""
+        status, error = self.store.save_status()
+        if status == self.save_state:
+            return
+        self.save_state = status
+        text = SAVE_STATUS_TEXT[status]
+        if error is not None:
+            text = f"{text}: {error} Retrying..."
+        self.save_label.config(text=text, fg='#C62828' if status == FAILED else '#607D8B')
+        if status == FAILED:
+            messagebox.showerror("File Error", f"{error} Your edits are kept and saving will be retried.")
+
+    def poll_save_status(self):
+        """Runs every SAVE_STATUS_POLL_MS: edits are written in the background, so their status changes on its own."""
+        self.refresh_save_status()
+        self.master.after(SAVE_STATUS_POLL_MS, self.poll_save_status)
+
+    # --- Instrumentation ---
+
+    def menu_action(self, name, command):
+        """
+        Returns a menu button command, timed as 'menu.<name>' when instrumentation
+        is on. The time includes any dialogs the handler opens; the 'validate',
+        'save' and 'render' phases inside it measure the work alone.
+        """
+        if not METRICS.enabled:
+            return command
+        return METRICS.timed(f"menu.{name}")(command)
+
+    def dump_metrics(self, reschedule=True):
+        """Writes the current timings to METRICS_DUMP_PATH (periodically while running)."""
+        try:
+            METRICS.dump(METRICS_DUMP_PATH)
+        except OSError as e:
+            print(f"Could not write timings to {METRICS_DUMP_PATH}: {e}")
+        if reschedule:
+            self.master.after(METRICS_DUMP_MS, self.dump_metrics)
+
+    def show_metrics_panel(self):
+        """Opens (or raises) a debug window listing every timer's latency distribution."""
+        if getattr(self, 'metrics_window', None) is not None and self.metrics_window.winfo_exists():
+            self.metrics_window.lift()
+            return
+
+        window = self.metrics_window = tk.Toplevel(self.master)
+        window.title("Timings (ms)")
+        columns = ('timer', 'count', 'mean', 'p50', 'p90', 'p99', 'max')
+        tree = ttk.Treeview(window, columns=columns, show='headings', height=16)
+        for column in columns:
+            tree.heading(column, text=column.upper(), anchor=tk.W if column == 'timer' else tk.CENTER)
+            tree.column(column, width=200 if column == 'timer' else 80,
+                        anchor=tk.W if column == 'timer' else tk.CENTER, stretch=column == 'timer')
+        tree.pack(fill='both', expand=True, padx=10, pady=10)
+
+        buttons = tk.Frame(window)
+        buttons.pack(fill='x', padx=10, pady=(0, 10))
+        ttk.Button(buttons, text="Reset", command=METRICS.reset).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Dump JSON", command=lambda: self.dump_metrics(reschedule=False)).pack(side=tk.LEFT, padx=5)
+
+        def refresh():
+            if not window.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            fmt = lambda ms: "-" if ms is None else f"{ms:.3f}"
+            for name, timer in METRICS.snapshot().items():
+                tree.insert('', tk.END, values=(name, timer['count'], fmt(timer['mean_ms']), fmt(timer['p50_ms']),
+                                                fmt(timer['p90_ms']), fmt(timer['p99_ms']), fmt(timer['max_ms'])))
+            window.after(METRICS_PANEL_REFRESH_MS, refresh)
+        refresh()
     
     def create_heading_label(self):
         """Creates the main heading label for the application."""
@@ -187,19 +474,19 @@ class StudentManagerApp:
         row1 = tk.Frame(button_frame, bg='#F0F4F8')
         row1.pack(fill='x', pady=5)
         
-        ttk.Button(row1, text="1. View All Records", command=self.view_all_records).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
-        ttk.Button(row1, text="2. View Individual Record", command=self.view_individual_record).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
-        ttk.Button(row1, text="3. Highest Score", command=lambda: self.show_extreme_mark(highest=True)).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
-        ttk.Button(row1, text="4. Lowest Score", command=lambda: self.show_extreme_mark(highest=False)).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
+        ttk.Button(row1, text="1. View All Records", command=self.menu_action('view_all_records', self.view_all_records)).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
+        ttk.Button(row1, text="2. View Individual Record", command=self.menu_action('view_individual_record', self.view_individual_record)).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
+        ttk.Button(row1, text="3. Highest Score", command=self.menu_action('highest_score', lambda: self.show_extreme_mark(highest=True))).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
+        ttk.Button(row1, text="4. Lowest Score", command=self.menu_action('lowest_score', lambda: self.show_extreme_mark(highest=False))).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
 
         # --- Row 2: Extension/Modification Functions (5-8) ---
         row2 = tk.Frame(button_frame, bg='#F0F4F8')
         row2.pack(fill='x', pady=5)
         
-        ttk.Button(row2, text="5. Sort Records", command=self.sort_records).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
-        ttk.Button(row2, text="6. Add Record", command=self.add_record).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
-        ttk.Button(row2, text="7. Delete Record", command=self.delete_record).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
-        ttk.Button(row2, text="8. Update Record", command=self.update_record).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
+        ttk.Button(row2, text="5. Sort Records", command=self.menu_action('sort_records', self.sort_records)).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
+        ttk.Button(row2, text="6. Add Record", command=self.menu_action('add_record', self.add_record)).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
+        ttk.Button(row2, text="7. Delete Record", command=self.menu_action('delete_record', self.delete_record)).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
+        ttk.Button(row2, text="8. Update Record", command=self.menu_action('update_record', self.update_record)).pack(side=tk.LEFT, expand=True, fill='x', padx=5)
 
         # --- Row 3: Exit Button ---
         row3 = tk.Frame(button_frame, bg='#F0F4F8')
@@ -207,6 +494,13 @@ class StudentManagerApp:
         # Configure a distinctive style for the Exit button (Red)
         self.style.configure('Exit.TButton', background='#D32F2F', bordercolor='#D32F2F')
         self.style.map('Exit.TButton', background=[('active', '#B71C1C'), ('pressed', '#9A0007')])
+        ttk.Button(row3, text="Undo", command=self.menu_action('undo', self.undo_edit)).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Button(row3, text="Redo", command=self.menu_action('redo', self.redo_edit)).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Button(row3, text="9. Bulk Update from File", command=self.menu_action('bulk_update', self.bulk_update_records)).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Button(row3, text="10. Query Records", command=self.menu_action('query_records', self.query_records)).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Button(row3, text="11. Export Graded Records", command=self.menu_action('export_records', self.export_records)).pack(side=tk.LEFT, padx=5, pady=5)
+        if METRICS.enabled:
+            ttk.Button(row3, text="Timings (F12)", command=self.show_metrics_panel).pack(side=tk.LEFT, padx=5, pady=5)
         ttk.Button(row3, text="Exit Application", command=self.master.quit, style='Exit.TButton').pack(fill='x', padx=5, pady=5)
 
     def create_treeview_area(self):
@@ -215,6 +509,14 @@ class StudentManagerApp:
         data_frame = tk.Frame(self.master, bg='#F0F4F8')
         data_frame.pack(padx=20, pady=(10, 20), fill="both", expand=True)
 
+        # --- Loading Progress (hidden once the background load finishes) ---
+        self.progress_frame = tk.Frame(data_frame, bg='#F0F4F8')
+        self.progress_frame.pack(fill='x', pady=(0, 5))
+        self.progress = ttk.Progressbar(self.progress_frame, mode='determinate', maximum=100)
+        self.progress.pack(side=tk.LEFT, fill='x', expand=True, padx=(0, 5))
+        self.cancel_button = ttk.Button(self.progress_frame, text="Cancel Loading", command=self.cancel_loading)
+        self.cancel_button.pack(side=tk.RIGHT)
+
         # --- Treeview Setup ---
         columns = ('code', 'name', 'cw_total', 'exam', 'percentage', 'grade')
         self.tree = ttk.Treeview(data_frame, columns=columns, show='headings', selectmode='browse')
@@ -235,9 +537,10 @@ class StudentManagerApp:
         self.tree.column('percentage', width=120, anchor=tk.CENTER, stretch=tk.NO)
         self.tree.column('grade', width=70, anchor=tk.CENTER, stretch=tk.NO)
 
-        # Add a scrollbar
-        yscrollbar = ttk.Scrollbar(data_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=yscrollbar.set)
+        # Add a scrollbar (driven by the virtual view rather than the Treeview itself,
+        # since only the visible window of rows ever exists as Treeview items)
+        yscrollbar = ttk.Scrollbar(data_frame, orient="vertical")
+        self.view = VirtualTreeview(self.tree, yscrollbar)
         
         # Packing the Treeview and Scrollbar
         yscrollbar.pack(side=tk.RIGHT, fill='y')
@@ -254,27 +557,50 @@ class StudentManagerApp:
                                      anchor='w')
         self.summary_label.pack(side=tk.BOTTOM, fill='x')
 
-    def display_data_in_treeview(self, title, records, summary_text=""):
-        """Utility to clear the Treeview and display structured data."""
-        # 1. Clear existing items in Treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        # 2. Insert new records
-        if records:
-            for student in records:
-                self.tree.insert('', tk.END, values=(
-                    student['code'],
-                    student['name'],
-                    student['total_coursework'],
-                    student['exam'],
-                    f"{student['percentage']:.2f}",
-                    student['grade']
-                ))
+        # --- Save Status ---
+        self.save_label = tk.Label(data_frame,
+                                   text="",
+                                   font=('Helvetica', 9),
+                                   bg='#F0F4F8',
+                                   fg='#607D8B',
+                                   anchor='e')
+        self.save_label.pack(side=tk.BOTTOM, fill='x', before=self.summary_label)
+
+    def display_data_in_treeview(self, title, records, summary_text="", keep_position=False):
+        """
+        Utility to display structured data. 'records' is any sequence of student
+        dictionaries (a list, or a lazy StudentTable view); only the rows in the
+        visible window are ever rendered into the Treeview.
+        """
+        # 1. Point the virtual view at the new records (renders the visible window only)
+        if not isinstance(records, Sequence):
+            records = list(records)
+        self.view.set_source(records, format_treeview_row, keep_position=keep_position)
         
-        # 3. Update the summary label
+        # 2. Update the summary label
         self.summary_label.config(text=f"Current View: {title}. {summary_text}")
         
+    def show_similar_names(self, name):
+        """
+        Lists the students whose names (or surnames, etc.) are closest to a name
+        that matched nobody, by edit distance: 'Ferdinad' finds 'Les Ferdinand'.
+        Returns False if none is close.
+        """
+        if not self.indexes_ready:
+            self.start_index_build()
+        if not self.indexes_ready:
+            self.display_message(f"No student named '{name}'. Similar names can be suggested once the name search index is built.")
+            return True
+        max_distance = min(FUZZY_MAX_DISTANCE, suggested_distance(name))
+        matches = self.store.find_names_fuzzy(name, max_distance, FUZZY_MAX_RESULTS)
+        if not matches:
+            return False
+        self.display_data_in_treeview(
+            f"No student named '{name}'. Closest names", [record for _, record in matches],
+            f"Similar Names: {len(matches)} (closest first) - use the student code to select one"
+        )
+        return True
+
     def display_message(self, message):
         """Utility to display non-tabular messages in the summary area."""
         self.display_data_in_treeview("Message/Error", [])
@@ -282,23 +608,23 @@ class StudentManagerApp:
 
 
     # --- Menu 1: View all student records ---
-    def view_all_records(self):
+    def view_all_records(self, keep_position=False):
         """Displays all student records and class summary."""
-        if not self.student_data:
+        num_students, total_marks_sum, median_total = self.store.summary()
+        if not num_students:
             self.display_message("No student data available.")
             return
 
-        total_marks_sum = sum(s['total_mark'] for s in self.student_data)
-        num_students = len(self.student_data)
-        
         avg_overall_percentage = (total_marks_sum / (num_students * MAX_TOTAL_MARK)) * 100
+        median_percentage = median_total / MAX_TOTAL_MARK * 100
 
         summary_text = (
             f"Total Students: {num_students} | "
-            f"Average Overall Percentage: {avg_overall_percentage:.2f}%"
+            f"Average Overall Percentage: {avg_overall_percentage:.2f}% | "
+            f"Median Overall Percentage: {median_percentage:.2f}%"
         )
         
-        self.display_data_in_treeview("All Student Records", self.student_data, summary_text)
+        self.display_data_in_treeview("All Student Records", self.store.records(), summary_text, keep_position)
 
     # --- Menu 2: View individual student record ---
     def view_individual_record(self):
@@ -307,35 +633,32 @@ class StudentManagerApp:
         if not query:
             return
 
-        found_student = None
-        
         # 1. Try to find by code first
         try:
             code_query = int(query)
-            found_student = next((s for s in self.student_data if s['code'] == code_query), None)
+            found_student = self.store.get(code_query)
         except ValueError:
             # 2. Search by name (partial and case-insensitive)
-            name_query = query.lower()
-            found_student = next((s for s in self.student_data if name_query in s['name'].lower()), None)
+            if not self.ensure_name_search_ready():
+                return
+            found_student = self.store.find_name(query, partial=True)
 
-        if found_student:
+        if found_student is not None:
             self.display_data_in_treeview(f"Individual Record: {found_student['name']}", [found_student])
-        else:
+        elif not self.show_similar_names(query):
             self.display_message(f"Error: No student found matching '{query}'.")
 
     # --- Menu 3 & 4: Show extreme mark (Highest/Lowest) ---
     def show_extreme_mark(self, highest=True):
         """Identifies and displays the student with the highest or lowest overall mark."""
-        if not self.student_data:
+        best_student = self.store.extreme(highest)
+        if best_student is None:
             self.display_message("No student data available to find extremes.")
             return
 
-        key = 'total_mark'
         if highest:
-            best_student = max(self.student_data, key=lambda s: s[key])
             title = "Highest Overall Mark"
         else:
-            best_student = min(self.student_data, key=lambda s: s[key])
             title = "Lowest Overall Mark"
 
         summary_text = f"Student: {best_student['name']} | Score: {best_student['total_mark']}"
@@ -354,8 +677,9 @@ class StudentManagerApp:
 
         reverse_order = sort_choice.strip().lower() == 'd'
         
-        # Use Python's built-in sorting on the total_mark key
-        sorted_records = sorted(self.student_data, key=lambda s: s['total_mark'], reverse=reverse_order)
+        # The backend ranks by total (ties by code) without a full re-sort;
+        # only the rows scrolled into view are ever fetched
+        sorted_records = self.store.ranked(descending=reverse_order)
         
         order_text = "Descending" if reverse_order else "Ascending"
         self.display_data_in_treeview(f"Records Sorted ({order_text} by Total Mark)", sorted_records)
@@ -364,15 +688,18 @@ class StudentManagerApp:
     # --- Menu 6: Add a student record ---
     def add_record(self):
         """Prompts for and adds a new student record, then saves the file."""
+        if not self.ensure_editable():
+            return
+
         code = simpledialog.askinteger("Add Student", "Enter new Student Code (1000-9999):", parent=self.master, minvalue=1000, maxvalue=9999)
         if code is None: return
 
-        if any(s['code'] == code for s in self.student_data):
+        if self.store.get(code) is not None:
             messagebox.showwarning("Input Error", f"Student code {code} already exists. Please use a unique code.")
             return
 
         name = simpledialog.askstring("Add Student", "Enter Student Name:", parent=self.master)
-        if not name: return
+        if not name or not self.check_name(name): return
 
         # Gather marks with max limits
         cw1 = simpledialog.askinteger("Add Student", "Enter Coursework 1 Mark (Max 20):", parent=self.master, minvalue=0, maxvalue=20); 
@@ -386,61 +713,72 @@ class StudentManagerApp:
 
         # Create the new record and calculate derived fields
         raw_parts = [str(code), name, str(cw1), str(cw2), str(cw3), str(exam)]
-        new_record = process_record(raw_parts)
+        with METRICS.phase('validate'):
+            new_record = process_record(raw_parts)
 
         if new_record:
-            self.student_data.append(new_record)
-            if self.save_data():
+            if self.persist_changes(puts=[new_record], description=f"Add {name} ({code})"):
                 messagebox.showinfo("Success", f"Student {name} (Code: {code}) added successfully and file updated.")
-            self.view_all_records()
+            self.view_all_records(keep_position=True)
+
+    def check_name(self, name):
+        """Warns and returns False if a name can't be stored in the comma-separated marks file."""
+        try:
+            validate_name(name)
+        except ValueError:
+            messagebox.showwarning("Input Error", "Student names may not contain commas or line breaks.")
+            return False
+        return True
 
     # --- Menu 7: Delete a student record ---
     def delete_record(self):
         """Allows user to select and delete a record, then saves the file."""
+        if not self.ensure_editable():
+            return
+
         query = simpledialog.askstring("Delete Student", "Enter Student Code or exact Name to DELETE:", parent=self.master)
         if not query:
             return
 
-        initial_count = len(self.student_data)
-        
         try:
             # 1. Try to delete by code
             code_query = int(query)
-            self.student_data = [s for s in self.student_data if s['code'] != code_query]
+            deleted_codes = [] if self.store.get(code_query) is None else [code_query]
             deleted_by = "Code"
         except ValueError:
             # 2. Delete by exact name match
             name_query = query.strip()
-            self.student_data = [s for s in self.student_data if s['name'] != name_query]
+            deleted_codes = self.store.codes_with_name(name_query)
             deleted_by = "Name"
 
-        final_count = len(self.student_data)
-        
-        if final_count < initial_count:
-            if self.save_data():
+        if deleted_codes:
+            if self.persist_changes(deletes=deleted_codes, description=f"Delete '{query}'"):
                 messagebox.showinfo("Success", f"Student record(s) matching '{query}' deleted successfully and file updated.")
-            self.view_all_records()
-        else:
+            self.view_all_records(keep_position=True)
+        elif deleted_by == "Code" or not self.show_similar_names(query.strip()):
             self.display_message(f"Not Found: No student found with matching {deleted_by}: '{query}'.")
 
     # --- Menu 8: Update a student record ---
     def update_record(self):
         """Allows user to select a record and update specific fields, then saves the file."""
+        if not self.ensure_editable():
+            return
+
         query = simpledialog.askstring("Update Student", "Enter Student Code or Name to UPDATE:", parent=self.master)
         if not query:
             return
 
         # Find the student record
-        student_to_update = None
         try:
             code_query = int(query)
-            student_to_update = next((s for s in self.student_data if s['code'] == code_query), None)
+            student_to_update = self.store.get(code_query)
         except ValueError:
-            name_query = query.lower()
-            student_to_update = next((s for s in self.student_data if s['name'].lower() == name_query), None)
+            code_query = None
+            student_to_update = self.store.find_name(query)
             
-        if not student_to_update:
-            self.display_message(f"Not Found: No student found matching '{query}'.")
+        if student_to_update is None:
+            if isinstance(code_query, int) or not self.show_similar_names(query):
+                self.display_message(f"Not Found: No student found matching '{query}'.")
             return
 
         # Prompt for which field to update
@@ -458,6 +796,7 @@ class StudentManagerApp:
         # Get new value based on field type
         if choice == 'name':
             new_value = simpledialog.askstring("Update Name", "Enter new Name:", parent=self.master)
+            if new_value is not None and not self.check_name(new_value): return
         elif choice in ['cw1', 'cw2', 'cw3']:
             new_value = simpledialog.askinteger(f"Update {choice.upper()}", f"Enter new mark (Max 20):", parent=self.master, minvalue=0, maxvalue=20)
         elif choice == 'exam':
@@ -482,23 +821,135 @@ class StudentManagerApp:
                 str(student_to_update['exam'])
             ]
             
-            updated_record = process_record(raw_parts)
+            with METRICS.phase('validate'):
+                updated_record = process_record(raw_parts)
             
             if updated_record:
-                index = self.student_data.index(student_to_update)
-                self.student_data[index] = updated_record
                 student_to_update = updated_record 
-            
-        if self.save_data():
+
+        if self.persist_changes(puts=[student_to_update],
+                                description=f"Update {student_to_update['name']}'s {choice}"):
             messagebox.showinfo("Success", f"Student {student_to_update['name']}'s {choice} updated successfully and file saved.")
         
         self.display_data_in_treeview(f"Updated Record for {student_to_update['name']}", [student_to_update])
 
 
+    # --- Menu 9: Bulk update from a change file ---
+    def bulk_update_records(self):
+        """Applies a change file of code,field,value rows to many students as one edit."""
+        if not self.ensure_editable():
+            return
+
+        path = filedialog.askopenfilename(
+            title="Choose Change File (code,field,value)",
+            filetypes=[("CSV files", "*.csv"), ("Text files", "*.txt"), ("All files", "*")],
+            parent=self.master
+        )
+        if not path:
+            return
+
+        # The whole file is validated first; nothing changes unless all of it is valid
+        try:
+            with METRICS.phase('validate'):
+                changes = read_change_file(path)
+                updated = plan_changes(self.store, changes)
+        except ChangeFileError as e:
+            messagebox.showerror("Invalid Change File", f"{e}\n\nNo changes were applied.")
+            return
+        except OSError as e:
+            messagebox.showerror("File Error", f"Could not read change file: {e}")
+            return
+
+        applied = sum(map(len, changes.values()))
+        if self.persist_changes(puts=updated, description=f"Bulk update of {len(updated)} student(s)"):
+            messagebox.showinfo("Success", f"Applied {applied} change(s) to {len(updated)} student(s) and file updated.")
+        self.view_all_records(keep_position=True)
+
+    # --- Menu 10: Filter records with a query ---
+    def query_records(self):
+        """Shows the students matching a query such as: grade in (A, B) and exam >= 80 and name ~ "sc"."""
+        text = simpledialog.askstring(
+            "Query Records",
+            "Enter a query (fields: code, name, cw1, cw2, cw3, exam, coursework, total, percentage, grade),\n"
+            "e.g.  grade in (A, B) and exam >= 80 and name ~ \"sc\"",
+            initialvalue=self.last_query,
+            parent=self.master
+        )
+        if not text or not text.strip():
+            return
+
+        try:
+            query = compile_query(text.strip())
+        except QueryError as e:
+            messagebox.showerror("Invalid Query", str(e))
+            return
+        self.last_query = query.text
+
+        with METRICS.phase('query'):
+            matches = self.store.select(query)
+        self.display_data_in_treeview(f"Query: {query.text}", matches, f"Matching Students: {len(matches)}")
+
+
+    # --- Menu 11: Export graded records ---
+    def export_records(self):
+        """Writes every student with total, percentage and grade to CSV, JSON Lines or a columnar file."""
+        if not self.load_complete:
+            messagebox.showwarning("Please Wait", "The whole roster must be loaded before it can be exported.")
+            return
+        if self.export_thread is not None and self.export_thread.is_alive():
+            messagebox.showwarning("Please Wait", "An export is already running.")
+            return
+
+        path = filedialog.asksaveasfilename(
+            title="Export Graded Records",
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("Columnar", "*.sgrd"),
+                       ("Gzipped CSV", "*.csv.gz"), ("Gzipped JSON Lines", "*.jsonl.gz"), ("All files", "*")],
+            parent=self.master
+        )
+        if not path:
+            return
+
+        # The batches come from a snapshot taken now, so edits made while the file is written don't leak in
+        batches = self.store.export_batches()
+        outcome = queue.Queue(maxsize=1)
+
+        def work():
+            try:
+                outcome.put(('done', export_graded(batches, path)))
+            except Exception as e:
+                outcome.put(('error', e))
+
+        self.export_thread = threading.Thread(target=work, name="exporter", daemon=True)
+        self.export_thread.start()
+        self.summary_label.config(text=f"{self.summary_label.cget('text')} | Exporting to {os.path.basename(path)}...")
+        self.master.after(EXPORT_POLL_MS, lambda: self.poll_export(outcome, path))
+
+    def poll_export(self, outcome, path):
+        """Reports the background export once its thread has finished."""
+        try:
+            kind, payload = outcome.get_nowait()
+        except queue.Empty:
+            self.master.after(EXPORT_POLL_MS, lambda: self.poll_export(outcome, path))
+            return
+        if kind == 'done':
+            messagebox.showinfo("Export Complete", f"Exported {payload} student(s) to {path}.")
+        else:
+            messagebox.showerror("Export Failed", f"Could not export to {path}: {payload}")
+
+
 if __name__ == "__main__":
     try:
         root = tk.Tk()
         app = StudentManagerApp(root)
         root.mainloop()
+        if app.export_thread is not None:
+            app.export_thread.join()  # Let a running export finish rather than leave a temporary file behind
+        try:
+            app.store.close()  # Writes any edits the write-behind saver still holds
+        except StorageError as e:
+            print(f"{e} Recent changes were not saved.")
+        if METRICS.enabled:
+            app.dump_metrics(reschedule=False)
     except Exception as e:
         print(f"Application failed to start: {e}")
\ No newline at end of file
@@ -0,0 +1,363 @@
+import os
+import gc
+import sys
+import json
+import math
+import time
+import random
+import string
+import argparse
+import tempfile
+import platform
+import contextlib
+import tracemalloc
+from student_table import StudentTable
+from student_engine import (
+    load_marks_file, write_marks_file, process_record, text_to_binary,
+)
+
+# 'resource' (peak RSS) only exists on Unix; elsewhere only traced memory is reported
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+# --- Scalability Benchmarks ---
+#
+# Times the engine operations behind each Student Manager menu item against
+# synthetic rosters of increasing size, and reports the results as JSON:
+#
+#     python student_bench.py --sizes 1000 100000 1000000 -o results.json
+#     python student_bench.py --baseline results.json      # fails on regressions
+#
+# Every operation is timed per student, so its cost should stay roughly flat
+# as the roster grows; a run also fails when an operation's scaling exponent
+# between two sizes of at least SCALING_MIN_SIZE exceeds --max-exponent (an
+# edit that went O(n) shows up as ~1), with or without a baseline. Searches
+# whose answer itself grows with the roster also have a latency budget
+# (LATENCY_BUDGETS_US), met at every size up to a million students:
+#
+#     python student_bench.py --sizes 100000 1000000 -n 200 --no-memory
+#
+# Rosters are generated deterministically from a seed, so two runs on the same
+# machine time exactly the same work and can be compared.
+
+DEFAULT_SIZES = (10, 100, 1_000, 10_000, 100_000)
+MIN_SIZE = 10
+MAX_SIZE = 10_000_000
+DEFAULT_OPS = 1000              # Repetitions of each per-student operation
+DEFAULT_TOLERANCE = 0.25        # Allowed ops/sec drop against a baseline
+DEFAULT_MAX_EXPONENT = 0.5      # Steepest allowed growth of time per operation with size
+SCALING_MIN_SIZE = 10_000       # Smaller rosters are too noisy to judge scaling by
+LATENCY_BUDGETS_US = {'lookup_name_fuzzy': 10_000}  # Microseconds per operation allowed ...
+LATENCY_BUDGET_MAX_SIZE = 1_000_000                 # ... on rosters up to this size
+FIRST_CODE = 1000               # Generated codes run FIRST_CODE .. FIRST_CODE + size - 1
+
+FIRST_NAMES = ("Amara", "Ben", "Chloe", "Dev", "Elif", "Farah", "George", "Hana", "Isaac", "Jade",
+               "Kofi", "Lena", "Mateo", "Nadia", "Omar", "Priya", "Quinn", "Rahim", "Sofia", "Tariq")
+LAST_NAMES = ("Ahmed", "Brown", "Chen", "Diaz", "Evans", "Fischer", "Garcia", "Hughes", "Ibrahim",
+              "Jones", "Khan", "Lopez", "Moreau", "Nowak", "Okafor", "Patel", "Rossi", "Smith")
+# Random letters appended to each surname: 360 name pairs alone would hide
+# what the name indexes cost on a real roster, where nearly every name is distinct
+NAME_SUFFIX_LETTERS = 4
+
+OPERATIONS = ('process_record', 'load', 'save', 'index_names', 'lookup_code', 'lookup_name',
+              'lookup_name_partial', 'lookup_name_fuzzy', 'sort', 'add', 'update', 'delete')
+
+
+# --- Roster Generation ---
+
+def _code_stride(size):
+    """A stride coprime to size, so i -> i * stride % size visits every code once, shuffled."""
+    stride = max(1, int(size * 0.618))
+    while math.gcd(stride, size) != 1:
+        stride += 1
+    return stride
+
+def generate_record(rng, code):
+    """One random (but seed-determined) record in the raw marks-file field layout."""
+    suffix = ''.join(rng.choices(string.ascii_lowercase, k=NAME_SUFFIX_LETTERS))
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}{suffix}"
+    return [str(code), name, str(rng.randint(0, 20)), str(rng.randint(0, 20)),
+            str(rng.randint(0, 20)), str(rng.randint(0, 100))]
+
+def generate_roster(path, size, seed=0):
+    """
+    Writes a marks file of 'size' students in the existing text format. Codes
+    are unique but not in order, and names are almost all distinct (about
+    one in 330 repeats at a million students), as in a real roster. The
+    same (size, seed) always produces the same file.
+    """
+    if not MIN_SIZE <= size <= MAX_SIZE:
+        raise ValueError(f"Roster size must be between {MIN_SIZE} and {MAX_SIZE}.")
+    rng = random.Random(seed)
+    stride = _code_stride(size)
+    with open(path, 'w') as f:
+        f.write(f"{size}\n")
+        for i in range(size):
+            f.write(','.join(generate_record(rng, FIRST_CODE + i * stride % size)) + "\n")
+
+
+# --- Timing ---
+
+def _result(seconds, ops):
+    return {
+        'seconds': seconds,
+        'ops': ops,
+        'ops_per_sec': ops / seconds if seconds > 0 else None,
+        'us_per_op': seconds / ops * 1e6 if ops else None,
+    }
+
+def _timed(ops, function, *args):
+    """Runs function(*args) once and returns its result dict, counting 'ops' operations."""
+    gc.collect()
+    start = time.perf_counter()
+    function(*args)
+    return _result(time.perf_counter() - start, ops)
+
+def _load(path):
+    table = StudentTable()
+    with contextlib.redirect_stdout(sys.stderr):
+        load_marks_file(path, table)
+    return table
+
+def _index_names(table):
+    """Builds the partial and fuzzy name search indexes the way the app does for its first name search."""
+    build = table.search_index_builder()
+    if build is not None:
+        table.install_search_indexes(build())
+
+def measure_load_memory(path):
+    """
+    Bytes allocated (and still held) by a freshly loaded table, and then by
+    its name search indexes, via tracemalloc, with the table's own count of
+    where its bytes go per student.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        table = _load(path)
+        current, peak = tracemalloc.get_traced_memory()
+        _index_names(table)
+        indexed = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    students = max(1, len(table))
+    parts = {part: size / students for part, size in table.memory_usage().items()}
+    return {'table_bytes': current, 'load_peak_bytes': peak, 'bytes_per_student': current / students,
+            'search_index_bytes': indexed - current, 'search_index_bytes_per_student': (indexed - current) / students,
+            'bytes_per_student_by_part': parts}
+
+def bench_size(size, directory, ops=DEFAULT_OPS, seed=0, binary=False, memory=True):
+    """
+    Times every operation against one generated roster and returns
+    {'size', 'operations': {name: result}, 'memory': {...}}. Per-student
+    operations run min(ops, size) times each on randomly chosen students.
+    """
+    path = os.path.join(directory, f"roster_{size}.txt")
+    generate_roster(path, size, seed)
+    if binary:
+        text_path, path = path, path[:-len(".txt")] + ".smrk"
+        text_to_binary(text_path, path)
+        os.remove(text_path)
+
+    results = _time_operations(path, size, min(ops, size), random.Random(seed + 1), directory, binary)
+    # The timed table went with _time_operations, so the memory measurement starts from a clean heap
+    report = {'size': size, 'operations': results}
+    if memory:
+        report['memory'] = measure_load_memory(path)
+    os.remove(path)
+    return report
+
+def _time_operations(path, size, reps, rng, directory, binary):
+    """Loads the roster at 'path' and times every operation on it, 'reps' times for per-student ones."""
+    results = {}
+
+    # Raw records for the parse/validate/grade step, and for adds and updates
+    raw = [generate_record(rng, FIRST_CODE + size + i) for i in range(reps)]
+    results['process_record'] = _timed(reps, lambda: [process_record(parts) for parts in raw])
+    new_records = [process_record(parts) for parts in raw]
+
+    gc.collect()
+    start = time.perf_counter()
+    table = _load(path)
+    results['load'] = _result(time.perf_counter() - start, size)
+
+    save_path = os.path.join(directory, f"saved_{size}")
+    results['save'] = _timed(size, write_marks_file, save_path, table, False, binary)
+    os.remove(save_path)
+
+    codes = [FIRST_CODE + rng.randrange(size) for _ in range(reps)]
+    names = [table.record(table.find_code(code))['name'] for code in codes]
+    fragments = [name[1:4] for name in names]
+    results['lookup_code'] = _timed(reps, lambda: [table.find_code(code) for code in codes])
+    results['lookup_name'] = _timed(reps, lambda: [table.find_name(name) for name in names])
+    results['index_names'] = _timed(size, _index_names, table)
+    results['lookup_name_partial'] = _timed(reps, lambda: [table.find_name(f, partial=True) for f in fragments])
+    # One letter dropped from each name
+    typos = [name[:-2] + name[-1] for name in names]
+    results['lookup_name_fuzzy'] = _timed(reps, lambda: [table.find_names_fuzzy(t, limit=10) for t in typos])
+
+    # Sorting builds the ranking once; the view then pages through it lazily
+    def sort():
+        records = table.view(table.ranked_rows(descending=True))
+        [records[i] for i in range(min(20, len(records)))]
+    results['sort'] = _timed(size, sort)
+
+    results['add'] = _timed(reps, lambda: [table.append(record) for record in new_records])
+
+    updates = [dict(record, code=code) for record, code in zip(new_records, codes)]
+    def update():
+        for record in updates:
+            table.update(table.find_code(record['code']), record)
+    results['update'] = _timed(reps, update)
+
+    def delete():
+        for code in codes:
+            row = table.find_code(code)
+            if row is not None:  # codes may repeat
+                table.delete(row)
+    results['delete'] = _timed(reps, delete)
+    return results
+
+
+# --- Reporting ---
+
+def scaling_curves(runs):
+    """
+    For each operation, the empirical exponent k in time-per-op ~ size**k
+    between consecutive sizes: ~0 means constant per operation, ~1 linear.
+    """
+    curves = {}
+    runs = sorted(runs, key=lambda run: run['size'])
+    for op in OPERATIONS:
+        points = [(run['size'], run['operations'][op]['us_per_op']) for run in runs if op in run['operations']]
+        curve = []
+        for (n1, t1), (n2, t2) in zip(points, points[1:]):
+            if t1 and t2 and n2 > n1:
+                curve.append({'from': n1, 'to': n2, 'exponent': math.log(t2 / t1) / math.log(n2 / n1)})
+        curves[op] = {'us_per_op': [{'size': n, 'us_per_op': t} for n, t in points], 'exponents': curve}
+    return curves
+
+def scaling_violations(curves, max_exponent=DEFAULT_MAX_EXPONENT):
+    """
+    Returns the steps of the scaling curves, between sizes of at least
+    SCALING_MIN_SIZE, where time per operation grew faster than size**max_exponent.
+    """
+    return [{'operation': op, **step}
+            for op, curve in curves.items() for step in curve['exponents']
+            if step['from'] >= SCALING_MIN_SIZE and step['exponent'] > max_exponent]
+
+def latency_violations(runs, budgets=LATENCY_BUDGETS_US):
+    """Returns the operations that took longer than their budget per operation, at sizes the budgets cover."""
+    return [{'operation': op, 'size': run['size'], 'us_per_op': run['operations'][op]['us_per_op'], 'budget_us': budget}
+            for run in runs if run['size'] <= LATENCY_BUDGET_MAX_SIZE
+            for op, budget in budgets.items()
+            if op in run['operations'] and run['operations'][op]['us_per_op'] > budget]
+
+def run_benchmarks(sizes=DEFAULT_SIZES, ops=DEFAULT_OPS, seed=0, binary=False, memory=True, directory=None):
+    """Benchmarks every size and returns the full JSON-ready report."""
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        runs = []
+        for size in sorted(sizes):
+            print(f"Benchmarking {size} students...", file=sys.stderr)
+            runs.append(bench_size(size, scratch, ops, seed, binary, memory))
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'settings': {'sizes': sorted(sizes), 'ops': ops, 'seed': seed,
+                     'format': 'binary' if binary else 'text'},
+        'runs': runs,
+        'scaling': scaling_curves(runs),
+    }
+    if HAS_RESOURCE:
+        # ru_maxrss is in KiB on Linux but bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        report['environment']['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return report
+
+def compare_to_baseline(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Returns a list of regressions: operations (at sizes present in both
+    reports) whose ops/sec fell by more than 'tolerance' against the baseline.
+    """
+    baseline_runs = {run['size']: run['operations'] for run in baseline.get('runs', ())}
+    regressions = []
+    for run in report['runs']:
+        before = baseline_runs.get(run['size'], {})
+        for op, result in run['operations'].items():
+            old, new = before.get(op, {}).get('ops_per_sec'), result['ops_per_sec']
+            if old and new and new < old * (1 - tolerance):
+                regressions.append({'size': run['size'], 'operation': op, 'baseline_ops_per_sec': old,
+                                    'ops_per_sec': new, 'change': new / old - 1})
+    return regressions
+
+
+# --- Command Line ---
+
+def roster_size(text):
+    size = int(text)
+    if not MIN_SIZE <= size <= MAX_SIZE:
+        raise argparse.ArgumentTypeError(f"sizes must be between {MIN_SIZE} and {MAX_SIZE}")
+    return size
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="student_bench", description="Scalability benchmarks for the student engine.")
+    parser.add_argument('-s', '--sizes', type=roster_size, nargs='+', default=list(DEFAULT_SIZES),
+                        help=f"roster sizes to benchmark ({MIN_SIZE}-{MAX_SIZE})")
+    parser.add_argument('-n', '--ops', type=int, default=DEFAULT_OPS, help="repetitions of each per-student operation")
+    parser.add_argument('--seed', type=int, default=0, help="roster generator seed")
+    parser.add_argument('-f', '--format', choices=('text', 'binary'), default='text', help="roster file format")
+    parser.add_argument('--no-memory', action='store_true', help="skip the (slower) traced memory measurement")
+    parser.add_argument('-o', '--output', default='-', help="JSON report file (default: stdout)")
+    parser.add_argument('-b', '--baseline', help="earlier JSON report to check for regressions")
+    parser.add_argument('-t', '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed fractional ops/sec drop against the baseline")
+    parser.add_argument('-x', '--max-exponent', type=float, default=DEFAULT_MAX_EXPONENT,
+                        help="steepest allowed scaling exponent of time per operation")
+    parser.add_argument('--generate', metavar='PATH',
+                        help="only write a roster of the first size to PATH and exit")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.generate:
+        generate_roster(args.generate, args.sizes[0], args.seed)
+        return 0
+
+    report = run_benchmarks(args.sizes, args.ops, args.seed, args.format == 'binary', not args.no_memory)
+
+    report['scaling_violations'] = scaling_violations(report['scaling'], args.max_exponent)
+    for violation in report['scaling_violations']:
+        print(f"Scaling: {violation['operation']} grows as size**{violation['exponent']:.2f} per operation "
+              f"from {violation['from']} to {violation['to']} students.", file=sys.stderr)
+    report['latency_violations'] = latency_violations(report['runs'])
+    for violation in report['latency_violations']:
+        print(f"Latency: {violation['operation']} takes {violation['us_per_op'] / 1000:.1f} ms per operation at "
+              f"{violation['size']} students, over its {violation['budget_us'] / 1000:g} ms budget.", file=sys.stderr)
+    status = 1 if report['scaling_violations'] or report['latency_violations'] else 0
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        report['regressions'] = compare_to_baseline(report, baseline, args.tolerance)
+        for regression in report['regressions']:
+            print(f"Regression: {regression['operation']} at {regression['size']} students is "
+                  f"{-regression['change']:.0%} slower than the baseline.", file=sys.stderr)
+        if report['regressions']:
+            status = 1
+
+    with (open(args.output, 'w') if args.output != '-' else contextlib.nullcontext(sys.stdout)) as out:
+        json.dump(report, out, indent=2)
+        out.write("\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import os
+import sys
+import mmap
+import struct
+import operator
+import tempfile
+import shutil
+from array import array
+
+# --- Binary Marks File Layout ---
+#
+#   header       MAGIC, version, record count and the offsets of the sections below
+#   records      one fixed-width RECORD per student, in file order
+#   name heap    UTF-8 names, addressed by (offset, length) from each record
+#   code index   (code, record number) pairs sorted by code, for binary search
+#
+# Everything is little-endian and read straight out of an mmap, so a single
+# student can be fetched by code without reading the rest of the file.
+
+MAGIC = b'SMRK'
+VERSION = 1
+HEADER = struct.Struct('<4sHxxQQQQ')    # magic, version, count, records/heap/index offsets
+RECORD = struct.Struct('<iIHBBBBxx')    # code, name offset, name length, cw1, cw2, cw3, exam
+INDEX_ENTRY = struct.Struct('<iI')      # code, record number
+MIN_CODE, MAX_CODE = -(1 << 31), (1 << 31) - 1
+MAX_NAME_BYTES = (1 << 16) - 1          # RECORD's name length field
+MAX_HEAP_BYTES = (1 << 32) - 1          # RECORD's name offset field
+BINARY_SUFFIX = ".smrk"
+
+
+def is_binary_marks_file(path):
+    """True if the file starts with the binary marks file magic."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _check_widths(code, name, heap_size):
+    """Raises ValueError if a code or UTF-8 name (at heap_size into the heap) overflows its RECORD field."""
+    if not MIN_CODE <= code <= MAX_CODE:
+        raise ValueError("code does not fit in 32 bits")
+    if len(name) > MAX_NAME_BYTES:
+        raise ValueError(f"name is longer than {MAX_NAME_BYTES} UTF-8 bytes")
+    if heap_size + len(name) > MAX_HEAP_BYTES:
+        raise ValueError(f"names take more than {MAX_HEAP_BYTES} bytes in all")
+
+def write_binary_marks_file(path, records, sync=False):
+    """
+    Writes student records (dicts with code, name, cw1-3 and exam) in the
+    binary format. Records are streamed: the name heap is spooled to a
+    temporary file, and only the (code, record number) index is held in memory.
+    Raises ValueError, leaving no file behind, if a record does not fit its
+    fields or has a name the text format could not hold.
+    """
+    # Imported here: student_engine itself builds on this module
+    from student_engine import validate_name
+
+    keys = array('Q')
+    count = 0
+    try:
+        with open(path, 'wb') as f, tempfile.TemporaryFile() as heap:
+            f.write(bytes(HEADER.size))  # Placeholder, rewritten once the sizes are known
+            records_offset = f.tell()
+            heap_size = 0
+
+            for student in records:
+                name = student['name'].encode('utf-8')
+                try:
+                    validate_name(student['name'])
+                    _check_widths(student['code'], name, heap_size)
+                except ValueError as e:
+                    raise ValueError(f"cannot write student {student['code']} to a binary marks file: {e}") from None
+                f.write(RECORD.pack(student['code'], heap_size, len(name),
+                                    student['cw1'], student['cw2'], student['cw3'], student['exam']))
+                heap.write(name)
+                heap_size += len(name)
+                # Same packing as RankIndex keys: sorts by code, then record number
+                keys.append((student['code'] + (1 << 31)) << 32 | count)
+                count += 1
+
+            heap_offset = f.tell()
+            heap.seek(0)
+            shutil.copyfileobj(heap, f)
+
+            index_offset = f.tell()
+            for key in sorted(keys):
+                f.write(INDEX_ENTRY.pack((key >> 32) - (1 << 31), key & 0xFFFFFFFF))
+
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, count, records_offset, heap_offset, index_offset))
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)  # A half-written file would not even have its header
+        raise
+
+
+def _field(body, typecode, offset):
+    """One RECORD field of every record in 'body', as a typed array built without a Python loop."""
+    size = array(typecode).itemsize
+    # Records are RECORD.size bytes apart, so each byte of the field is one strided slice
+    packed = bytearray(len(body) // RECORD.size * size)
+    for i in range(size):
+        packed[i::size] = body[offset + i::RECORD.size]
+    column = array(typecode)
+    column.frombytes(packed)
+    if sys.byteorder == 'big':
+        column.byteswap()  # The file is little-endian
+    return column
+
+
+class BinaryMarksFile:
+    """Read-only, memory-mapped view of a binary marks file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self.count, self._records, self._heap, self._index = HEADER.unpack_from(self._mm)
+        except struct.error as e:
+            self.close()
+            raise ValueError(f"{path} is truncated: its header is incomplete.") from e
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} binary marks file.")
+        if not (self._records + self.count * RECORD.size <= self._heap <= self._index
+                and self._index + self.count * INDEX_ENTRY.size <= len(self._mm)):
+            self.close()
+            raise ValueError(f"{path} is truncated: its sections end past the end of the file.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._mm.close()
+
+    def __len__(self):
+        return self.count
+
+    def raw(self, number):
+        """Returns record 'number' as (code, name, cw1, cw2, cw3, exam)."""
+        code, name_offset, name_length, cw1, cw2, cw3, exam = RECORD.unpack_from(
+            self._mm, self._records + number * RECORD.size)
+        start = self._heap + name_offset
+        return code, self._mm[start:start + name_length].decode('utf-8'), cw1, cw2, cw3, exam
+
+    def __iter__(self):
+        return map(self.raw, range(self.count))
+
+    def find_code(self, code):
+        """Binary-searches the code index; returns the raw record or None."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX_ENTRY.unpack_from(self._mm, self._index + middle * INDEX_ENTRY.size)[0] < code:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            found, number = INDEX_ENTRY.unpack_from(self._mm, self._index + low * INDEX_ENTRY.size)
+            if found == code:
+                return self.raw(number)
+        return None
+
+    def columns(self):
+        """
+        Returns the whole file as columns (codes, names, cw1, cw2, cw3, exam)
+        for bulk loading: typed arrays plus a list of names. Each column is
+        cut from the map in bulk, so loading costs C-speed copies, not a
+        Python loop over the records.
+        """
+        body = self._mm[self._records:self._records + self.count * RECORD.size]
+        code = _field(body, 'i', 0)
+        starts = _field(body, 'I', 4)
+        lengths = _field(body, 'H', 8)
+        cw1, cw2, cw3, exam = (_field(body, 'B', offset) for offset in (10, 11, 12, 13))
+
+        heap = self._mm[self._heap:self._index]
+        slices = map(slice, starts, map(operator.add, starts, lengths))
+        text = heap.decode('utf-8')
+        if len(text) == len(heap):
+            # All ASCII: byte offsets are character offsets, so names are cut from the decoded heap
+            names = list(map(text.__getitem__, slices))
+        else:
+            names = list(map(bytes.decode, map(heap.__getitem__, slices)))
+        return code, names, cw1, cw2, cw3, exam
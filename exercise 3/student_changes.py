@@ -0,0 +1,108 @@
+import csv
+from student_metrics import METRICS
+from student_engine import MAX_EXAM_MARK, process_record, validate_name
+
+# --- Change Files ---
+#
+# A change file lists edits to apply in one batch, one per row:
+#
+#     code,field,value
+#     8439,exam,51
+#     8439,cw2,14
+#     2345,name,Sam Sturtivant-Jones
+#
+# The header row is optional and 'field' is one of CHANGE_FIELDS. Later rows
+# win when the same field of the same student is changed twice. The whole
+# file is validated before anything is applied: one bad row rejects the batch.
+
+FIELD_LIMITS = {'cw1': 20, 'cw2': 20, 'cw3': 20, 'exam': MAX_EXAM_MARK}  # Highest valid mark
+CHANGE_FIELDS = ('name',) + tuple(FIELD_LIMITS)
+MAX_REPORTED_ERRORS = 20  # Problems listed in a ChangeFileError message
+
+
+class ChangeFileError(ValueError):
+    """A change file failed validation; 'errors' lists every problem found (as strings)."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        shown = "\n".join(errors[:MAX_REPORTED_ERRORS])
+        more = len(errors) - MAX_REPORTED_ERRORS
+        super().__init__(f"{len(errors)} problem(s) in change file:\n{shown}" + (f"\n... and {more} more" if more > 0 else ""))
+
+
+def _parse_value(field, value):
+    """Converts and range-checks one value, raising ValueError with the reason."""
+    if field == 'name':
+        value = value.strip()
+        if not value:
+            raise ValueError("name is empty")
+        validate_name(value)
+        return value
+    mark = int(value.strip())
+    if not 0 <= mark <= FIELD_LIMITS[field]:
+        raise ValueError(f"{field} must be between 0 and {FIELD_LIMITS[field]}")
+    return mark
+
+def read_change_file(path):
+    """
+    Reads and validates a change file, returning {code: {field: value}} with
+    typed values in file order. Raises ChangeFileError listing every bad row.
+    """
+    changes = {}
+    errors = []
+    with open(path, 'r', newline='') as f:
+        for line_no, row in enumerate(csv.reader(f), start=1):
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            if line_no == 1 and row[0].strip().lower() == 'code':
+                continue  # Header
+            if len(row) != 3:
+                errors.append(f"line {line_no}: expected code,field,value but got {len(row)} column(s)")
+                continue
+            code, field, value = row
+            field = field.strip().lower()
+            try:
+                code = int(code.strip())
+            except ValueError:
+                errors.append(f"line {line_no}: student code {code.strip()!r} is not a number")
+                continue
+            if field not in CHANGE_FIELDS:
+                errors.append(f"line {line_no}: unknown field {field!r} (expected one of {', '.join(CHANGE_FIELDS)})")
+                continue
+            try:
+                changes.setdefault(code, {})[field] = _parse_value(field, value)
+            except ValueError as e:
+                errors.append(f"line {line_no}: {e}")
+    if errors:
+        raise ChangeFileError(errors)
+    return changes
+
+def plan_changes(store, changes):
+    """
+    Builds the updated record of every affected student, recomputing derived
+    fields once per student. Raises ChangeFileError (changing nothing) if any
+    code is not in the store.
+    """
+    current = store.get_many(changes)
+    missing = [code for code in changes if code not in current]
+    if missing:
+        raise ChangeFileError([f"no student with code {code}" for code in missing])
+
+    updated = []
+    for code, fields in changes.items():
+        record = dict(current[code], **fields)
+        parts = [str(code), record['name'], str(record['cw1']), str(record['cw2']), str(record['cw3']), str(record['exam'])]
+        updated.append(process_record(parts))  # Every value was range-checked, so this cannot fail
+    return updated
+
+def apply_change_file(store, path):
+    """
+    Validates a whole change file against the store and then applies it as
+    one edit (a single journal write, file rewrite or transaction). Returns
+    (changes applied, students updated).
+    """
+    with METRICS.phase('validate'):
+        changes = read_change_file(path)
+        updated = plan_changes(store, changes)
+    store.apply(puts=updated)
+    return sum(map(len, changes.values())), len(updated)
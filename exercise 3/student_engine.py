@@ -0,0 +1,767 @@
+import os
+import io
+import sys
+import csv
+import json
+import mmap
+import locale
+import heapq
+import shutil
+import argparse
+import tempfile
+import contextlib
+from array import array
+from collections import deque, namedtuple
+from itertools import compress, islice
+from student_table import GRADE_INDEX, SCHEME
+from student_journal import PUT, DELETE, INSERT, has_pending_edits
+from student_binary import BinaryMarksFile, is_binary_marks_file, write_binary_marks_file
+from student_metrics import METRICS
+
+# NumPy is optional: with it, grade_columns validates and grades whole columns
+# as array operations; without it the same function runs as plain Python.
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# Headless grading engine: everything needed to parse, grade, load and save
+# marks files, with no dependency on tkinter. The Student Manager window
+# (exercise3.py) is built on top of this module, and it can also be run from
+# the command line:
+#
+#     python student_engine.py grade studentMarks.txt --format jsonl > graded.jsonl
+
+# --- Configuration ---
+
+MAX_CW_MARK = 60    # Total max mark for the 3 Courseworks (3 * 20)
+MAX_EXAM_MARK = 100
+MAX_TOTAL_MARK = 160 # Overall total possible mark (60 + 100)
+PARALLEL_LOAD_MIN_BYTES = 8 * 1024 * 1024  # Files at least this big are parsed by a process pool
+PARALLEL_CHUNK_BYTES = 4 * 1024 * 1024     # Target size of each newline-aligned chunk
+PARALLEL_CHUNKS_PER_WORKER = 2             # Chunks submitted ahead of the consumer, per worker
+LOAD_BATCH_BYTES = 256 * 1024  # Text bytes per batch when loading progressively
+LOAD_BATCH_ROWS = 10_000        # Binary rows per batch when loading progressively
+MERGE_RUN_RECORDS = 200_000  # Records held in memory per sorted run when merging files
+MERGE_FAN_IN = 64            # Most run files merged (and held open) at once
+MERGE_POLICIES = ('last-wins', 'max-exam', 'error')
+
+# --- Data Processing Functions ---
+
+GRADE_TABLE = SCHEME.compile(MAX_TOTAL_MARK)  # Grade of every possible total mark
+
+def calculate_grade(percentage):
+    """Calculates the student grade based on overall percentage."""
+    return SCHEME.grade(percentage)
+
+def validate_name(name):
+    """Raises ValueError if a name can't be one field of a comma-separated marks-file line."""
+    if ',' in name or '\n' in name or '\r' in name:
+        raise ValueError("name may not contain commas or line breaks")
+
+def process_record(parts):
+    """
+    Processes raw data parts into a fully calculated student dictionary, 
+    including total mark, percentage, and grade.
+    """
+    try:
+        # Data Extraction and Conversion
+        code = int(parts[0].strip())
+        name = parts[1].strip()
+        validate_name(name)
+        cw_marks = [int(m.strip()) for m in parts[2:5]]
+        exam_mark = int(parts[5].strip())
+
+        # Validation (Ensures marks are within defined bounds)
+        if not (0 <= exam_mark <= MAX_EXAM_MARK and all(0 <= m <= 20 for m in cw_marks)):
+             raise ValueError("Mark out of defined range (CW max 20, Exam max 100).")
+
+        # Core Calculations
+        total_coursework = sum(cw_marks)
+        total_mark = total_coursework + exam_mark
+        percentage = (total_mark / MAX_TOTAL_MARK) * 100
+        grade = GRADE_TABLE.grade[total_mark]
+
+        return {
+            'code': code,
+            'name': name,
+            'cw1': cw_marks[0],
+            'cw2': cw_marks[1],
+            'cw3': cw_marks[2],
+            'exam': exam_mark,
+            'total_coursework': total_coursework,
+            'total_mark': total_mark,
+            'percentage': round(percentage, 2),
+            'grade': grade
+        }
+    except (ValueError, IndexError) as e:
+        print(f"Error processing record: {parts}. Skipping record. Error: {e}")
+        return None
+
+def iter_marks_file(path, end=None):
+    """Serially parses a text marks file (its first 'end' bytes, if given), yielding every valid record in file order."""
+    with open(path, 'rb') as raw:
+        f = io.TextIOWrapper(raw if end is None else io.BytesIO(raw.read(end)))
+        f.readline() # Read and discard the student count
+
+        for line in f:
+            line = line.strip()
+            if line:
+                parts = line.split(',')
+                record = process_record(parts)
+                if record:
+                    yield record
+
+def read_marks_file(path, table, end=None):
+    """Serially parses a marks file (up to byte 'end'), appending every valid record to the table."""
+    # Reading and parsing are interleaved line by line here, so both count as 'parse'
+    with METRICS.phase('parse'):
+        for record in iter_marks_file(path, end):
+            table.append(record)
+
+# Percentage and grade for every possible total mark, computed exactly as
+# process_record does, so bulk loaders can derive them by lookup
+PERCENTAGE_BY_TOTAL = [round(t / MAX_TOTAL_MARK * 100, 2) for t in range(MAX_TOTAL_MARK + 1)]
+PCT100_BY_TOTAL = [round(p * 100) for p in PERCENTAGE_BY_TOTAL]
+GRADE_BY_TOTAL = list(GRADE_TABLE.index)
+
+# --- Batch Grading ---
+
+GradedColumns = namedtuple('GradedColumns', 'valid total percentage grade')
+
+def grade_columns(cw1, cw2, cw3, exam):
+    """
+    Batch counterpart of process_record for whole columns of marks.
+
+    Range validation runs as boolean masks, totals as array sums and grading
+    as one lookup per total in the compiled GRADE_TABLE. Returns GradedColumns:
+    'valid' is a mask over the input rows, while total, percentage and grade
+    (indices into GRADES) cover only the valid rows. Percentages are looked up
+    per total, so they round exactly as in process_record.
+    """
+    if HAS_NUMPY:
+        cw1, cw2, cw3, exam = (np.asarray(column, dtype=np.int64) for column in (cw1, cw2, cw3, exam))
+        valid = (exam >= 0) & (exam <= MAX_EXAM_MARK)
+        for marks in (cw1, cw2, cw3):
+            valid &= (marks >= 0) & (marks <= 20)
+
+        total = (cw1 + cw2 + cw3 + exam)[valid]
+        percentage = np.asarray(PERCENTAGE_BY_TOTAL)[total]
+        grade = np.frombuffer(GRADE_TABLE.index, dtype=np.uint8)[total]
+        return GradedColumns(valid, total, percentage, grade)
+
+    valid = [0 <= e <= MAX_EXAM_MARK and 0 <= m1 <= 20 and 0 <= m2 <= 20 and 0 <= m3 <= 20
+             for m1, m2, m3, e in zip(cw1, cw2, cw3, exam)]
+    total = [m1 + m2 + m3 + e for m1, m2, m3, e in compress(zip(cw1, cw2, cw3, exam), valid)]
+    percentage = [PERCENTAGE_BY_TOTAL[t] for t in total]
+    grade = [GRADE_BY_TOTAL[t] for t in total]
+    return GradedColumns(valid, total, percentage, grade)
+
+def as_column(typecode, values):
+    """Converts grade_columns output (NumPy array or list) into a typed 'array' column."""
+    column = array(typecode)
+    if HAS_NUMPY and isinstance(values, np.ndarray):
+        column.frombytes(values.astype(np.dtype(typecode)).tobytes())
+    else:
+        column.extend(values)
+    return column
+
+def binary_columns(path):
+    """
+    Reads a binary marks file as table columns (code, names, cw1, cw2, cw3,
+    exam, total, pct100, grade). Numeric columns come straight out of the
+    memory map and are validated and graded in one batch by grade_columns.
+    Rows breaking the process_record mark ranges are skipped.
+    """
+    with METRICS.phase('read'), BinaryMarksFile(path) as marks:
+        code, names, cw1, cw2, cw3, exam = marks.columns()
+
+    with METRICS.phase('validate'):
+        graded = grade_columns(cw1, cw2, cw3, exam)
+    valid = graded.valid.tolist() if HAS_NUMPY else graded.valid
+    if not all(valid):
+        print(f"Error processing {valid.count(False)} binary record(s) in {path}: mark out of defined range. Skipping.")
+        code, cw1, cw2, cw3, exam = (array(c.typecode, compress(c, valid)) for c in (code, cw1, cw2, cw3, exam))
+        names = list(compress(names, valid))
+
+    total = as_column('B', graded.total)
+    pct100 = array('H', map(PCT100_BY_TOTAL.__getitem__, total))
+    grade = as_column('B', graded.grade)
+    return code, names, cw1, cw2, cw3, exam, total, pct100, grade
+
+def read_binary_marks_file(path, table):
+    """Bulk-loads a binary marks file into the table (see binary_columns)."""
+    table.extend_columns(*binary_columns(path))
+
+def iter_binary_marks_file(path):
+    """Streams a binary marks file as fully calculated records, one at a time."""
+    with BinaryMarksFile(path) as marks:
+        for code, name, cw1, cw2, cw3, exam in marks:
+            record = process_record([str(code), name, str(cw1), str(cw2), str(cw3), str(exam)])
+            if record:
+                yield record
+
+def iter_records(path):
+    """Streams the valid records of a marks file in either format."""
+    if is_binary_marks_file(path):
+        return iter_binary_marks_file(path)
+    return iter_marks_file(path)
+
+def text_to_binary(text_path, binary_path):
+    """Converts a text marks file to the binary format (streaming; invalid lines are dropped)."""
+    write_binary_marks_file(binary_path, iter_marks_file(text_path))
+
+def binary_to_text(binary_path, text_path):
+    """Converts a binary marks file back to the text format, record for record."""
+    with BinaryMarksFile(binary_path) as marks, open(text_path, 'w') as f:
+        f.write(f"{len(marks)}\n")
+        for code, name, cw1, cw2, cw3, exam in marks:
+            f.write(f"{code},{name},{cw1},{cw2},{cw3},{exam}\n")
+
+def _parse_chunk(path, start, end):
+    """
+    Worker for read_marks_file_parallel: parses bytes [start, end) of a marks
+    file with process_record and returns the valid records as typed columns,
+    plus any error messages process_record printed (so the parent can print
+    them in file order).
+    """
+    code, cw1, cw2, cw3 = array('i'), array('B'), array('B'), array('B')
+    exam, total, pct100, grade = array('B'), array('B'), array('H'), array('B')
+    names = []
+    errors = io.StringIO()
+
+    with METRICS.phase('read'):
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = mm[start:end].decode(locale.getpreferredencoding(False))
+        # Match text-mode universal newlines so lines split exactly as in read_marks_file
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+    # process_record validates as it parses, so text validation is timed as part of 'parse'
+    with METRICS.phase('parse'), contextlib.redirect_stdout(errors):
+        for line in text.split('\n'):
+            line = line.strip()
+            if line:
+                record = process_record(line.split(','))
+                if record:
+                    code.append(record['code'])
+                    names.append(record['name'])
+                    cw1.append(record['cw1'])
+                    cw2.append(record['cw2'])
+                    cw3.append(record['cw3'])
+                    exam.append(record['exam'])
+                    total.append(record['total_mark'])
+                    pct100.append(round(record['percentage'] * 100))
+                    grade.append(GRADE_INDEX[record['grade']])
+
+    return (code, names, cw1, cw2, cw3, exam, total, pct100, grade), errors.getvalue()
+
+def chunk_boundaries(path, chunk_bytes=PARALLEL_CHUNK_BYTES, end=None):
+    """
+    Memory-maps a marks file and returns (start, end) byte ranges covering
+    every line after the count line (up to byte 'end', if given), each range
+    ending just past a newline.
+    """
+    if os.path.getsize(path) == 0:
+        return []  # mmap cannot map an empty file
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        limit = len(mm) if end is None else min(end, len(mm))
+        start = mm.find(b'\n', 0, limit) + 1 or limit  # Skip the student count line
+        bounds = []
+        while start < limit:
+            cut = mm.find(b'\n', min(start + chunk_bytes, limit) - 1, limit)
+            stop = limit if cut == -1 else cut + 1
+            bounds.append((start, stop))
+            start = stop
+    return bounds
+
+def iter_chunk_columns(path, bounds, workers=None, parallel=True):
+    """
+    Parses the given byte ranges of a text marks file with _parse_chunk,
+    across a process pool when parallel is set, yielding (columns, errors)
+    for each range in file order.
+
+    Only PARALLEL_CHUNKS_PER_WORKER chunks per worker are in flight at once,
+    so a slow consumer holds back the parse instead of the whole file piling
+    up parsed in memory. Closing the generator early cancels the chunks not
+    yet started.
+    """
+    if not parallel:
+        for start, end in bounds:
+            yield _parse_chunk(path, start, end)
+        return
+
+    # Imported here so that headless start-up does not pay for multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    chunks = iter(bounds)
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = deque(pool.submit(_parse_chunk, path, start, end)
+                        for start, end in islice(chunks, PARALLEL_CHUNKS_PER_WORKER * workers))
+        # Collect in submission order so rows land in file order
+        while pending:
+            # Workers time their phases in their own process; here the wait is what counts
+            with METRICS.phase('parse'):
+                columns, errors = pending.popleft().result()
+            # Top the window up before handing the chunk over, so workers stay busy meanwhile
+            for start, end in islice(chunks, 1):
+                pending.append(pool.submit(_parse_chunk, path, start, end))
+            yield columns, errors
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+def read_marks_file_parallel(path, table, workers=None, end=None):
+    """
+    Parses a marks file (up to byte 'end') across a process pool. The file is
+    split into newline-aligned chunks, each chunk is validated with
+    process_record in a worker, and the results are merged into the table in
+    file order, giving the same table as read_marks_file.
+    """
+    for columns, errors in iter_chunk_columns(path, chunk_boundaries(path, end=end), workers):
+        if errors:
+            print(errors, end='')
+        table.extend_columns(*columns)
+
+def iter_column_batches(path, batch_bytes=LOAD_BATCH_BYTES, batch_rows=LOAD_BATCH_ROWS, end=None):
+    """
+    Parses a marks file of either format in small batches for progressive
+    loading, yielding (columns, errors, fraction_done) where columns suit
+    StudentTable.extend_columns. A text file is read up to byte 'end' if
+    given, and in parallel when large; close() the generator to abandon a
+    load part-way.
+    """
+    if is_binary_marks_file(path):
+        errors = io.StringIO()
+        with contextlib.redirect_stdout(errors):
+            columns = binary_columns(path)
+        count = len(columns[0])
+        for start in range(0, count, batch_rows):
+            batch = tuple(column[start:start + batch_rows] for column in columns)
+            yield batch, errors.getvalue() if start == 0 else "", min(count, start + batch_rows) / count
+        return
+
+    size = os.path.getsize(path) if end is None else end
+    bounds = chunk_boundaries(path, batch_bytes, end)
+    parallel = size >= PARALLEL_LOAD_MIN_BYTES
+    # Closing this generator closes the parser too, which cancels the chunks not yet started
+    with contextlib.closing(iter_chunk_columns(path, bounds, parallel=parallel)) as chunks:
+        for (_, stop), (columns, errors) in zip(bounds, chunks):
+            yield columns, errors, stop / size
+
+def format_record_line(student):
+    """Formats a student record as one line of the marks file (without newline)."""
+    return (
+        f"{student['code']},{student['name']},{student['cw1']},"
+        f"{student['cw2']},{student['cw3']},{student['exam']}"
+    )
+
+@METRICS.timed('save')
+def write_marks_file(path, table, sync=False, binary=False):
+    """Writes a complete marks file (count line, then one line per student) to path."""
+    if binary:
+        write_binary_marks_file(path, table.records(), sync)
+        return
+
+    with open(path, 'w') as f:
+        # 1. Write the count of students (required file format)
+        f.write(f"{len(table)}\n")
+
+        # 2. Write each student record in the original comma-separated format
+        for student in table.records():
+            f.write(format_record_line(student) + "\n")
+
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+
+# --- Loading and Saving ---
+
+def load_marks_file(path, table, end=None):
+    """
+    Loads a marks file of either format into the table, picking the fastest
+    loader for it. A text file is read up to byte 'end' if given. Returns True
+    if the file is in the binary format.
+    """
+    if is_binary_marks_file(path):
+        read_binary_marks_file(path, table)
+        return True
+    # Large files are parsed in parallel across processes
+    if os.path.getsize(path) >= PARALLEL_LOAD_MIN_BYTES:
+        read_marks_file_parallel(path, table, end=end)
+    else:
+        read_marks_file(path, table, end)
+    return False
+
+def replay_journal(table, journal):
+    """Applies journaled puts, deletes and inserts on top of the records loaded from the base file."""
+    for op, payload in journal.replay():
+        if op == PUT:
+            record = process_record(payload)
+            if not record:
+                continue
+            row = table.find_code(record['code'])
+            if row is None:
+                table.append(record)
+            else:
+                table.update(row, record)
+        elif op == DELETE:
+            row = table.find_code(payload)
+            if row is not None:
+                table.delete(row)
+        elif op == INSERT:
+            position, fields = payload
+            record = process_record(fields)
+            if record:
+                table.insert(position, record)
+
+# --- Merging ---
+#
+# merge_marks_files consolidates several marks files (which together may not
+# fit in memory) into one file sorted by student code. Each input is streamed
+# into sorted runs of at most run_records records, spilled to temporary files,
+# and the runs are k-way merged. Run lines carry (code, input number, line
+# number) so that duplicates arrive together and in input order.
+
+class MergeConflictError(ValueError):
+    """Raised by the 'error' merge policy when a student code appears more than once."""
+
+def _write_run(run, directory):
+    """Sorts one run by (code, input, position) and spills it to a temporary file."""
+    run.sort()
+    with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.run', delete=False) as f:
+        for code, source, position, line in run:
+            f.write(f"{code},{source},{position},{line}\n")
+    return f.name
+
+def _read_run(path):
+    with open(path, 'r') as f:
+        for line in f:
+            code, source, position, rest = line.rstrip('\n').split(',', 3)
+            yield int(code), int(source), int(position), rest
+
+def _merge_runs(paths, directory, fan_in):
+    """Merges run files down to at most fan_in, then returns one merged iterator."""
+    while len(paths) > fan_in:
+        merged = []
+        for i in range(0, len(paths), fan_in):
+            group = paths[i:i + fan_in]
+            with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.run', delete=False) as f:
+                for code, source, position, line in heapq.merge(*map(_read_run, group)):
+                    f.write(f"{code},{source},{position},{line}\n")
+            for path in group:
+                os.remove(path)
+            merged.append(f.name)
+        paths = merged
+    return heapq.merge(*map(_read_run, paths))
+
+def _resolve(code, candidates, policy):
+    """Picks the surviving record line among duplicates (given in input order)."""
+    if len(candidates) == 1:
+        return candidates[0]
+    if policy == 'error':
+        raise MergeConflictError(f"Student code {code} appears {len(candidates)} times.")
+    if policy == 'max-exam':
+        # Highest exam mark wins; among equal marks the latest input wins
+        return max(reversed(candidates), key=lambda line: int(line.rsplit(',', 1)[1]))
+    return candidates[-1]
+
+def iter_merged(inputs, policy='last-wins', run_records=MERGE_RUN_RECORDS, fan_in=MERGE_FAN_IN):
+    """
+    Yields the de-duplicated records of several marks files (either format)
+    in student code order. Memory use is bounded by run_records, however
+    large the inputs are, except that an input with pending journal edits is
+    loaded whole so that they can be replayed (see roster_records).
+    """
+    from student_storage import roster_records  # student_storage itself builds on this module
+
+    if policy not in MERGE_POLICIES:
+        raise ValueError(f"Unknown merge policy '{policy}'. Choose from {', '.join(MERGE_POLICIES)}.")
+
+    with tempfile.TemporaryDirectory(prefix="marks-merge-") as directory:
+        runs, run = [], []
+        for source, path in enumerate(inputs):
+            for position, record in enumerate(roster_records(path)):
+                run.append((record['code'], source, position, format_record_line(record)))
+                if len(run) >= run_records:
+                    runs.append(_write_run(run, directory))
+                    run = []
+        if run:
+            runs.append(_write_run(run, directory))
+            run = []
+
+        group_code, group = None, []
+        for code, _, _, line in _merge_runs(runs, directory, fan_in):
+            if code != group_code and group:
+                yield process_record(_resolve(group_code, group, policy).split(','))
+                group = []
+            group_code = code
+            group.append(line)
+        if group:
+            yield process_record(_resolve(group_code, group, policy).split(','))
+
+def merge_marks_files(inputs, output, policy='last-wins', run_records=MERGE_RUN_RECORDS, binary=False):
+    """
+    Merges several marks files into one consolidated file in the existing
+    format (text by default, or binary), sorted by student code. Returns the
+    number of students written.
+    """
+    records = iter_merged(inputs, policy, run_records)
+    if binary:
+        # Written aside first so a conflict part-way through leaves no partial output
+        temp_path = output + ".tmp"
+        try:
+            write_binary_marks_file(temp_path, records)
+        except BaseException:
+            # The write may have failed before creating the file: keep its error, not a FileNotFoundError
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        os.replace(temp_path, output)
+        with BinaryMarksFile(output) as merged:
+            return len(merged)
+
+    # The count line comes first, so spool the body and prepend it at the end
+    count = 0
+    with tempfile.TemporaryFile('w+') as body:
+        for record in records:
+            body.write(format_record_line(record) + "\n")
+            count += 1
+        body.seek(0)
+        with open(output, 'w') as f:
+            f.write(f"{count}\n")
+            shutil.copyfileobj(body, f)
+    return count
+
+# --- Graded Output ---
+
+GRADED_FIELDS = ('code', 'name', 'cw1', 'cw2', 'cw3', 'exam',
+                 'total_coursework', 'total_mark', 'percentage', 'grade')
+
+def write_graded(records, out, output_format='csv'):
+    """Streams graded records to a text stream as CSV (with header) or JSON Lines."""
+    if output_format == 'jsonl':
+        for record in records:
+            out.write(json.dumps(record) + "\n")
+        return
+
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(GRADED_FIELDS)
+    for record in records:
+        row = [record[field] for field in GRADED_FIELDS]
+        row[8] = f"{record['percentage']:.2f}"
+        writer.writerow(row)
+
+# --- Command Line ---
+
+def grade_command(args):
+    """
+    Grades a roster into CSV or JSON Lines, one record at a time. Journal
+    edits not yet folded into a marks file are included, as in the app.
+    """
+    from student_storage import roster_records  # student_storage itself builds on this module
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        # process_record reports bad lines on stdout; keep them out of the output stream
+        with contextlib.redirect_stdout(sys.stderr):
+            write_graded(roster_records(args.input), out, args.format)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+def percentile(text):
+    """argparse type for a percentile: a number from 0 to 100."""
+    value = float(text)
+    if not 0 <= value <= 100:
+        raise argparse.ArgumentTypeError(f"percentiles must be between 0 and 100, not {text}")
+    return value
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="student_engine", description="Headless student marks engine.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    grade = commands.add_parser('grade', help="grade a roster (text, binary or database) into CSV or JSON Lines")
+    grade.add_argument('input', help="marks file or SQLite database to grade")
+    grade.add_argument('-o', '--output', default='-', help="output file (default: stdout)")
+    grade.add_argument('-f', '--format', choices=('csv', 'jsonl'), default='csv', help="output format")
+    grade.set_defaults(handler=grade_command)
+
+    convert = commands.add_parser('convert', help="convert between the text and binary marks formats")
+    convert.add_argument('direction', choices=('to-binary', 'to-text'))
+    convert.add_argument('source')
+    convert.add_argument('destination')
+    convert.set_defaults(handler=convert_command)
+
+    merge = commands.add_parser('merge', help="merge several marks files, de-duplicating by student code")
+    merge.add_argument('output', help="consolidated marks file to write")
+    merge.add_argument('inputs', nargs='+', help="marks files to merge (later files are newer)")
+    merge.add_argument('-p', '--policy', choices=MERGE_POLICIES, default='last-wins',
+                       help="which record survives when a code is repeated")
+    merge.add_argument('--run-records', type=int, default=MERGE_RUN_RECORDS,
+                       help="records held in memory per sorted run (bounds peak memory)")
+    merge.add_argument('-f', '--format', choices=('text', 'binary'), default='text', help="output format")
+    merge.set_defaults(handler=merge_command)
+
+    stats = commands.add_parser('stats', help="mean, variance, percentiles and grade distribution in one pass")
+    stats.add_argument('inputs', nargs='+', help="marks files or databases (statistics are combined across them)")
+    stats.add_argument('-p', '--percentiles', type=percentile, nargs='+', default=[10, 25, 50, 75, 90],
+                       help="percentiles to report (0-100)")
+    stats.set_defaults(handler=stats_command)
+
+    to_sqlite = commands.add_parser('import', help="import a marks file into a SQLite database (replacing its contents)")
+    to_sqlite.add_argument('source', help="marks file (text or binary)")
+    to_sqlite.add_argument('database', help="SQLite database to create or overwrite")
+    to_sqlite.set_defaults(handler=import_command)
+
+    changes = commands.add_parser('apply-changes', help="apply a code,field,value change file as one batch")
+    changes.add_argument('roster', help="marks file or SQLite database to update")
+    changes.add_argument('changes', help="change file (CSV rows: code,field,value)")
+    changes.set_defaults(handler=apply_changes_command)
+
+    query = commands.add_parser('query', help="print the students matching a query, e.g. \"grade in (A,B) and exam >= 80\"")
+    query.add_argument('input', help="marks file or SQLite database")
+    query.add_argument('expression', help="query (see student_query.py for the syntax)")
+    query.add_argument('-o', '--output', default='-', help="output file (default: stdout)")
+    query.add_argument('-f', '--format', choices=('csv', 'jsonl'), default='csv', help="output format")
+    query.set_defaults(handler=query_command)
+
+    export = commands.add_parser('export', help="export graded records as CSV, JSON Lines or a columnar file")
+    export.add_argument('input', help="marks file or SQLite database")
+    export.add_argument('output', help="file to write, or - for stdout (.csv, .jsonl or .sgrd, plus .gz to compress)")
+    export.add_argument('-f', '--format', choices=('csv', 'jsonl', 'columnar'),
+                        help="output format (default: from the output file's suffix, else csv)")
+    export.add_argument('-z', '--gzip', action='store_true', help="gzip the output whatever its name")
+    export.set_defaults(handler=export_command)
+
+    shard = commands.add_parser('shard', help="split a roster into shard files listed in a manifest, loaded lazily")
+    shard.add_argument('input', help="marks file or SQLite database")
+    shard.add_argument('manifest', help="manifest to write (a name ending in .shards.json); shards go next to it")
+    cut = shard.add_mutually_exclusive_group()
+    cut.add_argument('--rows', type=int, default=100_000, help="students per shard, cut at code boundaries (default: 100000)")
+    cut.add_argument('--width', type=int, help="one shard per cohort of codes in blocks of this width instead, e.g. 1000")
+    shard.set_defaults(handler=shard_command)
+
+    return parser
+
+def convert_command(args):
+    convert = text_to_binary if args.direction == 'to-binary' else binary_to_text
+    convert(args.source, args.destination)
+    return 0
+
+def stats_command(args):
+    """Prints single-pass statistics for one or more rosters (merged) as JSON, pending journal edits included."""
+    from student_stats import MarkStatistics  # student_stats itself builds on this module
+
+    stats = MarkStatistics()
+    with contextlib.redirect_stdout(sys.stderr):
+        for path in args.inputs:
+            stats.merge(MarkStatistics.from_file(path))
+    json.dump(stats.summary(tuple(args.percentiles)), sys.stdout, indent=2)
+    print()
+    return 0
+
+def import_command(args):
+    from student_storage import import_marks_file  # student_storage itself builds on this module
+
+    with contextlib.redirect_stdout(sys.stderr):
+        count = import_marks_file(args.source, args.database)
+    print(f"Imported {count} students from {args.source} into {args.database}.", file=sys.stderr)
+    return 0
+
+def apply_changes_command(args):
+    from student_storage import StorageError, open_store  # Both build on this module
+    from student_changes import ChangeFileError, apply_change_file
+
+    store = open_store(args.roster)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            store.load()
+        applied, students = apply_change_file(store, args.changes)
+        store.flush()
+    except (ChangeFileError, StorageError) as e:
+        print(f"No changes applied. {e}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    print(f"Applied {applied} change(s) to {students} student(s) in {args.roster}.", file=sys.stderr)
+    return 0
+
+def query_command(args):
+    """
+    Writes the students matching a query as graded CSV or JSON Lines. A marks
+    file is streamed through the compiled predicate without being loaded,
+    unless it has pending journal edits, which need it loaded through its
+    store; a database answers the query itself, using its indexes, and a
+    sharded roster loads only the shards that might match.
+    """
+    from student_query import QueryError, compile_query  # student_query itself builds on this module
+    from student_storage import is_sqlite_file, is_sharded_roster, open_store
+
+    try:
+        query = compile_query(args.expression)
+    except QueryError as e:
+        print(f"Invalid query: {e}", file=sys.stderr)
+        return 2
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            if is_sqlite_file(args.input) or is_sharded_roster(args.input) or has_pending_edits(args.input):
+                store = open_store(args.input)
+                try:
+                    store.load()
+                    write_graded(store.select(query), out, args.format)
+                finally:
+                    store.close()
+            else:
+                write_graded(filter(query.matches, iter_records(args.input)), out, args.format)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+def export_command(args):
+    """Streams a roster into a graded export; see student_export.py for the formats."""
+    from student_export import export_graded, roster_batches  # student_export itself builds on this module
+
+    count = export_graded(roster_batches(args.input), args.output, args.format, args.gzip or None)
+    print(f"Exported {count} students from {args.input} to {args.output}.", file=sys.stderr)
+    return 0
+
+def shard_command(args):
+    from student_shards import write_sharded_roster  # student_shards itself builds on this module
+
+    if (args.width or args.rows) <= 0:
+        print("Shard sizes must be positive.", file=sys.stderr)
+        return 2
+    with contextlib.redirect_stdout(sys.stderr):
+        count = write_sharded_roster(args.input, args.manifest, args.rows, args.width)
+    print(f"Split {args.input} into {count} shard(s) listed in {args.manifest}.", file=sys.stderr)
+    return 0
+
+def merge_command(args):
+    try:
+        count = merge_marks_files(args.inputs, args.output, args.policy, args.run_records, args.format == 'binary')
+    except MergeConflictError as e:
+        print(f"Merge aborted: {e}", file=sys.stderr)
+        return 1
+    print(f"Merged {len(args.inputs)} file(s) into {args.output}: {count} students.", file=sys.stderr)
+    return 0
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except BrokenPipeError:
+        # The reader went away (e.g. '| head'): stop quietly. Python flushes
+        # stdout again on exit, so point it at devnull to avoid a second error.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+import os
+import sys
+import gzip
+import json
+import struct
+import contextlib
+import operator
+from array import array
+from itertools import accumulate, repeat
+from student_table import GRADES
+from student_journal import has_pending_edits
+from student_metrics import METRICS
+from student_engine import GRADED_FIELDS, PERCENTAGE_BY_TOTAL, iter_column_batches
+
+# --- Graded Export ---
+#
+# Streams graded records (marks plus total, percentage and grade) out of the
+# roster in one of three formats:
+#
+#   csv        the same header and rows as 'student_engine.py grade'
+#   jsonl      one JSON object per student, as 'grade --format jsonl' writes
+#   columnar   a compact binary file of column blocks (layout below)
+#
+# Records travel as column batches, the (code, names, cw1, cw2, cw3, exam,
+# total, pct100, grade) tuples StudentTable.extend_columns takes. Each batch is
+# formatted with one C-level string operation per row and written with a
+# single call, so memory stays at one batch and no Python code runs per
+# field. A '.gz' suffix (or compress=True) gzips the output.
+#
+# Columnar layout (little-endian):
+#
+#   header      COLUMNAR_MAGIC, version
+#   blocks      BLOCK_HEADER (rows, name bytes), then the columns: code int32,
+#               name end offsets uint32, cw1, cw2, cw3, exam and total uint8,
+#               pct100 uint16, grade uint8 (index into GRADES), UTF-8 names
+#   trailer     BLOCK_HEADER (0, 0), then the total row count as uint64
+#
+# The count goes last so that the file can be written in one pass, even
+# through gzip or to a pipe.
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'columnar')
+EXPORT_SUFFIXES = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.sgrd': 'columnar'}
+GZIP_SUFFIX = ".gz"
+GZIP_MAGIC = b'\x1f\x8b'
+GZIP_LEVEL = 6                  # zlib's default: most of the saving for a fraction of level 9's time
+EXPORT_BUFFER_BYTES = 1 << 20
+
+COLUMNAR_MAGIC = b'SGRD'
+COLUMNAR_VERSION = 1
+COLUMNAR_HEADER = struct.Struct('<4sH')
+BLOCK_HEADER = struct.Struct('<II')      # rows, bytes of UTF-8 names
+COLUMNAR_TRAILER = struct.Struct('<Q')   # total rows
+COLUMN_TYPES = (('code', 'i'), ('cw1', 'B'), ('cw2', 'B'), ('cw3', 'B'), ('exam', 'B'),
+                ('total', 'B'), ('pct100', 'H'), ('grade', 'B'))
+
+# The end of each row (total mark, percentage, grade) is looked up by
+# total * len(GRADES) + grade rather than formatted field by field
+CSV_TAILS = [f"{total},{percentage:.2f},{grade}\n"
+             for total, percentage in enumerate(PERCENTAGE_BY_TOTAL) for grade in GRADES]
+JSON_TAILS = [f'"total_mark": {total}, "percentage": {json.dumps(percentage)}, "grade": {json.dumps(grade)}}}\n'
+              for total, percentage in enumerate(PERCENTAGE_BY_TOTAL) for grade in GRADES]
+
+CSV_HEADER = ",".join(GRADED_FIELDS) + "\n"
+CSV_ROW = "%d,%s,%d,%d,%d,%d,%d,%s"
+JSON_ROW = ('{"code": %d, "name": %s, "cw1": %d, "cw2": %d, "cw3": %d, "exam": %d, '
+            '"total_coursework": %d, %s')
+CSV_SPECIAL = (',', '"', '\r', '\n')
+
+
+def format_for_path(path):
+    """Export format implied by a file name ('.gz' ignored); CSV if the suffix says nothing."""
+    if path.endswith(GZIP_SUFFIX):
+        path = path[:-len(GZIP_SUFFIX)]
+    return EXPORT_SUFFIXES.get(os.path.splitext(path)[1].lower(), 'csv')
+
+
+# --- Batch Formatting ---
+
+def _plain_columns(batch):
+    """The batch's marks as lists (iterating an array boxes every value; tolist does it in C) plus coursework totals."""
+    code, names, cw1, cw2, cw3, exam, total, pct100, grade = batch
+    code, cw1, cw2, cw3, exam = code.tolist(), cw1.tolist(), cw2.tolist(), cw3.tolist(), exam.tolist()
+    coursework = list(map(operator.add, map(operator.add, cw1, cw2), cw3))
+    tail_keys = list(map(operator.add, map(operator.mul, total.tolist(), repeat(len(GRADES))), grade.tolist()))
+    return code, cw1, cw2, cw3, exam, coursework, tail_keys
+
+def _csv_field(name):
+    """Quotes a name the way csv.writer would (only when it holds a comma, quote or line break)."""
+    if any(char in name for char in CSV_SPECIAL):
+        return '"' + name.replace('"', '""') + '"'
+    return name
+
+def _csv_rows(batch):
+    code, cw1, cw2, cw3, exam, coursework, tail_keys = _plain_columns(batch)
+    names = batch[1]
+    # Marks files cannot hold commas in names, so quoting is normally checked once per batch
+    joined = "\0".join(names)
+    if any(char in joined for char in CSV_SPECIAL):
+        names = map(_csv_field, names)
+    rows = zip(code, names, cw1, cw2, cw3, exam, coursework, map(CSV_TAILS.__getitem__, tail_keys))
+    return "".join(map(CSV_ROW.__mod__, rows)).encode('utf-8')
+
+def _jsonl_rows(batch):
+    code, cw1, cw2, cw3, exam, coursework, tail_keys = _plain_columns(batch)
+    rows = zip(code, map(json.encoder.encode_basestring_ascii, batch[1]), cw1, cw2, cw3, exam,
+               coursework, map(JSON_TAILS.__getitem__, tail_keys))
+    return "".join(map(JSON_ROW.__mod__, rows)).encode('ascii')
+
+def _little_endian(typecode, values):
+    column = values if isinstance(values, array) and values.typecode == typecode else array(typecode, values)
+    if sys.byteorder == 'big' and column.itemsize > 1:
+        column = array(typecode, column)
+        column.byteswap()
+    return column
+
+def _columnar_block(batch):
+    code, names, cw1, cw2, cw3, exam, total, pct100, grade = batch
+    encoded = [name.encode('utf-8') for name in names]
+    heap = b"".join(encoded)
+    parts = [BLOCK_HEADER.pack(len(code), len(heap)),
+             _little_endian('i', code), _little_endian('I', accumulate(map(len, encoded)))]
+    parts.extend(_little_endian(typecode, column)
+                 for (_, typecode), column in zip(COLUMN_TYPES[1:], (cw1, cw2, cw3, exam, total, pct100, grade)))
+    parts.append(heap)
+    return b"".join(parts)
+
+FORMATTERS = {'csv': _csv_rows, 'jsonl': _jsonl_rows, 'columnar': _columnar_block}
+
+
+# --- Writing ---
+
+def write_export(batches, out, output_format='csv'):
+    """Writes column batches to a binary stream in the given format. Returns the number of students."""
+    if output_format not in FORMATTERS:
+        raise ValueError(f"unknown export format {output_format!r} (expected one of {', '.join(EXPORT_FORMATS)})")
+    format_batch = FORMATTERS[output_format]
+    if output_format == 'csv':
+        out.write(CSV_HEADER.encode('ascii'))
+    elif output_format == 'columnar':
+        out.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION))
+
+    count = 0
+    for batch in batches:
+        if len(batch[0]):
+            out.write(format_batch(batch))
+            count += len(batch[0])
+
+    if output_format == 'columnar':
+        out.write(BLOCK_HEADER.pack(0, 0) + COLUMNAR_TRAILER.pack(count))
+    return count
+
+@METRICS.timed('export')
+def export_graded(batches, path, output_format=None, compress=None):
+    """
+    Exports column batches to path ('-' for stdout), inferring the format and
+    gzip from the file name unless given. A file is written under a temporary
+    name and renamed into place, so a failed export never leaves half a file.
+    Returns the number of students written.
+    """
+    if output_format is None:
+        output_format = format_for_path(path)
+    if compress is None:
+        compress = path.endswith(GZIP_SUFFIX)
+
+    if path == '-':
+        out = gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb', compresslevel=GZIP_LEVEL) if compress else sys.stdout.buffer
+        count = write_export(batches, out, output_format)
+        if compress:
+            out.close()
+        sys.stdout.buffer.flush()
+        return count
+
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, 'wb', buffering=EXPORT_BUFFER_BYTES) as f:
+            if compress:
+                with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=GZIP_LEVEL) as out:
+                    count = write_export(batches, out, output_format)
+            else:
+                count = write_export(batches, f, output_format)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return count
+
+
+# --- Sources ---
+
+def roster_batches(path):
+    """
+    Column batches of a roster on disk, in file order. A marks file is parsed
+    as it streams (in parallel when large) unless it has pending journal edits,
+    which need the whole roster loaded; a database or sharded roster is read
+    through its store.
+    """
+    # Imported here: student_storage pulls in sqlite3, which a plain marks file does not need
+    from student_storage import is_sqlite_file, is_sharded_roster, open_store
+
+    if not is_sqlite_file(path) and not is_sharded_roster(path) and not has_pending_edits(path):
+        for columns, errors, _ in iter_column_batches(path):
+            if errors:
+                print(errors, end='', file=sys.stderr)
+            yield columns
+        return
+
+    store = open_store(path)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):  # Journal replay reports bad lines on stdout
+            store.load()
+        yield from store.export_batches()
+    finally:
+        store.close()
+
+
+# --- Reading Columnar Files ---
+
+def iter_columnar_batches(path):
+    """Reads a columnar export (gzipped or not) back as column batches."""
+    with open(path, 'rb') as raw:
+        compressed = raw.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+        raw.seek(0)
+        f = gzip.GzipFile(fileobj=raw, mode='rb') if compressed else raw
+        magic, version = COLUMNAR_HEADER.unpack(f.read(COLUMNAR_HEADER.size))
+        if magic != COLUMNAR_MAGIC or version != COLUMNAR_VERSION:
+            raise ValueError(f"{path} is not a version {COLUMNAR_VERSION} columnar export.")
+        while True:
+            rows, heap_size = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+            if not rows:
+                break
+            columns = {}
+            for name, typecode in (('code', 'i'), ('ends', 'I')) + COLUMN_TYPES[1:]:
+                column = array(typecode)
+                column.frombytes(f.read(rows * column.itemsize))
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                columns[name] = column
+            heap = f.read(heap_size)
+            starts = [0] + columns['ends'][:-1].tolist()
+            names = [heap[start:end].decode('utf-8') for start, end in zip(starts, columns['ends'])]
+            yield (columns['code'], names, columns['cw1'], columns['cw2'], columns['cw3'], columns['exam'],
+                   columns['total'], columns['pct100'], columns['grade'])
@@ -0,0 +1,229 @@
+from bisect import bisect_left
+
+# --- Fuzzy Name Search ---
+#
+# FuzzyNameIndex finds every indexed name within a few edits (Levenshtein
+# distance: insertions, deletions and substitutions) of a misspelled query,
+# without comparing the query against the whole roster.
+#
+# The names are kept sorted, so the names sharing a prefix form a contiguous
+# range found by bisection: the sorted list is a trie with no nodes to store.
+# A search walks that trie depth first, carrying for each prefix one row of
+# the edit-distance table (only the cells within the radius of the
+# diagonal), and drops a prefix once no cell is within the radius. Three
+# things keep the walk to the prefixes near the query's rather than to the
+# names under them:
+#
+#   - Only a character the query has near the current depth can extend a
+#     prefix for free. Those few are looked up by bisection; every other
+#     character gives the same row, computed once for all of them.
+#   - Once a prefix has used up the radius, the rest of a name must be one
+#     of the query's remaining suffixes, which bisection finds directly.
+#   - Ranges of at most LEAF_NAMES names are compared name by name.
+#
+# So the cost follows how many prefixes lie within two edits of the query's,
+# which levels off as the roster grows, instead of how many names share its
+# first name and surname, which does not. On a million generated students a
+# radius-2 search for a misspelled full name takes about 5 ms (see
+# student_bench.py).
+#
+# Adding a name to a sorted list of a million would move them all, so names
+# added after the index is built go into smaller sorted runs. A run is merged
+# into the one before it once it reaches 1/RUN_MERGE_RATIO of that run's
+# size, as in a log-structured merge tree. An add then moves only a few names
+# on average, and a search walks each of the few runs. Build the index in one
+# go where possible (FuzzyNameIndex(names)), so that it starts as a single run.
+#
+# Rosters index each name whole and word by word (see name_keys), so that a
+# misspelled surname alone ('Shearor') still finds 'Alan Shearer'.
+#
+# A BK-tree was the obvious alternative, but in pure Python a radius-2 search
+# visits a tenth of a large tree, and building it costs one distance
+# computation per tree level for each name. Cutting names into segments for
+# a pigeonhole lookup was tried too: every name sharing the query's first
+# name and surname shares a segment with it, so that cost grew with the roster.
+
+MAX_DISTANCE = 2  # Largest search radius: the prefixes a search walks multiply with each further edit
+LEAF_NAMES = 8    # Ranges of at most this many names are compared name by name
+SCAN_NAMES = 256  # Up to this many names are scanned, not bisected, for children that use up the radius
+LAST_CHAR = chr(0x10FFFF)  # No character sorts after it, so no range ends before another character
+RUN_MERGE_RATIO = 4  # A run is merged into the one before once it is at least 1/RUN_MERGE_RATIO its size
+
+
+def name_keys(lowered):
+    """What a lowercase name is indexed under: the whole name and each of its words."""
+    words = lowered.split()
+    return {lowered, *words} if len(words) > 1 else {lowered}
+
+def suggested_distance(query):
+    """
+    A search radius suited to the query's length: no typos in very short
+    queries (which would match nearly anything), one in short words, two beyond.
+    """
+    length = len(query.strip())
+    return 0 if length <= 2 else 1 if length <= 5 else MAX_DISTANCE
+
+def _pattern(query):
+    """Bit mask of the positions of each character of the query, for edit_distance."""
+    masks = {}
+    for i, char in enumerate(query):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    return masks
+
+def edit_distance(query, text, pattern=None):
+    """
+    Levenshtein distance between query and text, computed a whole column at a
+    time with Myers' bit-parallel algorithm (Python integers hold the bits, so
+    any length works). Pass pattern=_pattern(query) to reuse it across texts.
+    """
+    m = len(query)
+    if not m:
+        return len(text)
+    masks = _pattern(query) if pattern is None else pattern
+    vp, vn, score = (1 << m) - 1, 0, m
+    full, last = vp, 1 << (m - 1)
+    for char in text:
+        eq = masks.get(char, 0)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        hp = vn | ~(xh | vp)
+        hn = vp & xh
+        if hp & last:
+            score += 1
+        elif hn & last:
+            score -= 1
+        hp = (hp << 1) | 1
+        vp = ((hn << 1) | ~(xv | hp)) & full
+        vn = hp & xv
+    return score
+
+def _next_row(query, row, depth, char, far):
+    """
+    The edit-distance row of a prefix one character ('char', or None for one
+    found nowhere in the query) longer than the prefix whose row, at 'depth',
+    is given, and its smallest cell. Only cells within far - 1 of the
+    diagonal are computed; every other cell holds far.
+    """
+    m = len(query)
+    first, last = max(1, depth + 2 - far), min(m, depth + far)
+    below = [far] * (m + 1)
+    below[0] = best = left = min(depth + 1, far)
+    if first > 1:
+        left = far
+    for j in range(first, last + 1):
+        cell = row[j - 1] if query[j - 1] == char else row[j - 1] + 1
+        if row[j] < cell:
+            cell = row[j] + 1
+        if left < cell:
+            cell = left + 1
+        if cell > far:
+            cell = far
+        below[j] = left = cell
+        if cell < best:
+            best = cell
+    return below, best
+
+def _range_end(run, prefix, char, lo, hi):
+    """Where the names in run[lo:hi] (all starting with prefix) that go on with char end."""
+    if char == LAST_CHAR:
+        return hi
+    return bisect_left(run, prefix + chr(ord(char) + 1), lo, hi)
+
+
+class FuzzyNameIndex:
+    """
+    Names searchable by edit distance. Names are matched exactly as added
+    (callers lowercase them for case-insensitive search) and are never
+    removed: callers skip names no student holds any more.
+    """
+
+    def __init__(self, names=()):
+        self.names = list(names)
+        self._runs = [sorted(self.names)] if self.names else []  # Sorted runs, each at least RUN_MERGE_RATIO times the next
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name):
+        """Indexes a name (not already present) and returns its position in self.names."""
+        self.names.append(name)
+        runs = self._runs
+        runs.append([name])
+        while len(runs) > 1 and len(runs[-1]) * RUN_MERGE_RATIO >= len(runs[-2]):
+            run = runs.pop()
+            runs[-1] += run
+            runs[-1].sort()  # Two sorted runs: the sort merges them in linear time
+        return len(self.names) - 1
+
+    def _walk(self, run, query, max_distance, pattern, matches):
+        """Adds (distance, name) to matches for every name of one sorted run within max_distance of the query."""
+        m, far = len(query), max_distance + 1
+        stack = [(0, len(run), 0, [min(j, far) for j in range(m + 1)], 0)]
+        while stack:
+            lo, hi, depth, row, best = stack.pop()
+            if len(run[lo]) == depth:
+                # The prefix is itself a name, sorting before every longer one
+                if row[m] <= max_distance:
+                    matches.append((row[m], run[lo]))
+                lo += 1
+                if lo == hi:
+                    continue
+            if best == max_distance:
+                # No edit left: a name below matches only by going on with the rest of the query unchanged
+                rests = [query[j:] for j in range(max(0, depth - max_distance), min(m, depth + max_distance) + 1)
+                         if row[j] == max_distance]
+                if hi - lo <= LEAF_NAMES:
+                    matches.extend((max_distance, name) for name in run[lo:hi] if name[depth:] in rests)
+                    continue
+                prefix = run[lo][:depth]
+                for rest in rests:
+                    at = bisect_left(run, prefix + rest, lo, hi)
+                    if at < hi and run[at] == prefix + rest:
+                        matches.append((max_distance, run[at]))
+                continue
+            if hi - lo <= LEAF_NAMES:
+                for name in run[lo:hi]:
+                    if abs(len(name) - m) <= max_distance:
+                        distance = edit_distance(query, name, pattern)
+                        if distance <= max_distance:
+                            matches.append((distance, name))
+                continue
+            # Only a character the query has near this depth can cost nothing: look those up directly.
+            # Any other character costs an edit wherever it is aligned, so those children share one row
+            near = query[max(0, depth - max_distance):depth + far]
+            prefix = run[lo][:depth]
+            for char in set(near):
+                start = bisect_left(run, prefix + char, lo, hi)
+                if start < hi and run[start][depth] == char:
+                    below, below_best = _next_row(query, row, depth, char, far)
+                    if below_best <= max_distance:
+                        stack.append((start, _range_end(run, prefix, char, start, hi), depth + 1, below, below_best))
+            other, other_best = _next_row(query, row, depth, None, far)
+            if other_best > max_distance:
+                continue
+            if other_best == max_distance and hi - lo <= SCAN_NAMES:
+                rests = [query[j:] for j in range(max(0, depth + 1 - max_distance), min(m, depth + far) + 1)
+                         if other[j] == max_distance]
+                matches.extend((max_distance, name) for name in run[lo:hi]
+                               if name[depth] not in near and name[depth + 1:] in rests)
+                continue
+            while lo < hi:
+                name = run[lo]
+                char = name[depth]
+                end = _range_end(run, prefix, char, lo + 1, hi)
+                if char not in near:
+                    stack.append((lo, end, depth + 1, other, other_best))
+                lo = end
+
+    def search(self, query, max_distance=MAX_DISTANCE):
+        """Returns [(distance, name)] for every name within max_distance edits, closest first."""
+        if not 0 <= max_distance <= MAX_DISTANCE:
+            raise ValueError(f"search radius must be between 0 and {MAX_DISTANCE}")
+        if not query:
+            return []
+        pattern = _pattern(query)
+        matches = []
+        for run in self._runs:
+            self._walk(run, query, max_distance, pattern, matches)
+        matches.sort()
+        return matches
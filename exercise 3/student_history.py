@@ -0,0 +1,105 @@
+from collections import namedtuple
+from student_engine import process_record, format_record_line
+
+# --- Undo / Redo ---
+#
+# Every edit goes through EditHistory.apply, which notes, before applying it,
+# how to put things back: the prior marks-file line of each student it
+# replaces, the codes of the students it adds, and each student it deletes
+# with their position in the roster (see MarksStore.locate). Nothing else
+# about the roster is copied, so an entry costs memory in proportion to the
+# size of the edit, never the roster. Undo and redo are themselves ordinary
+# edits applied (and persisted) through the store.
+#
+# Undoing a delete inserts the very student deleted back at their position,
+# so when several students share a code, the one restored is again the first
+# with it and redoing the delete removes that same student. Positions hold
+# because edits are undone and redone strictly in stack order: the roster is
+# then exactly as it was when the position was noted, apart from the edit.
+#
+# These inverse change sets stand in for snapshots of a persistent, structurally
+# shared roster: the roster is updated in place in typed columns, a database or
+# shards, none of which can share structure between versions. Memory per edit
+# stays proportional to the edit either way, and undo and redo cost as much
+# as the edit did.
+
+UNDO_LIMIT = 100  # Edits kept for undo; older ones are forgotten
+
+# 'puts' are marks-file lines (see format_record_line), 'deletes' student codes
+# and 'inserts' (position, marks-file line) pairs in ascending position
+ChangeSet = namedtuple('ChangeSet', 'puts deletes inserts')
+HistoryEntry = namedtuple('HistoryEntry', 'description forward backward')
+
+
+def _records(lines):
+    records = []
+    for line in lines:
+        record = process_record(line.split(','))
+        if record is None:
+            raise ValueError(f"cannot replay the edit: {line!r} is not a valid marks-file line")
+        records.append(record)
+    return records
+
+
+class EditHistory:
+    """Undo and redo stacks of edits applied to a MarksStore."""
+
+    def __init__(self, store, limit=UNDO_LIMIT):
+        self.store = store
+        self.limit = limit
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def clear(self):
+        """Forgets every edit (e.g. after the roster was reloaded from disk)."""
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def _inverse(self, puts, deletes):
+        """The change set that undoes applying (puts, deletes) to the store as it is now."""
+        put_codes = {record['code'] for record in puts}
+        before = self.store.get_many(put_codes)
+        deleted = sorted(filter(None, self.store.locate(deletes)), key=lambda place: place[0])
+        return ChangeSet(
+            puts=[format_record_line(record) for record in before.values()],  # Replaced: restore
+            deletes=[code for code in put_codes if code not in before],       # Newly added: remove
+            inserts=[(position, format_record_line(record)) for position, record in deleted],  # Deleted: put back
+        )
+
+    def apply(self, puts=(), deletes=(), description="Edit"):
+        """Applies and persists an edit through the store, recording how to undo it."""
+        backward = self._inverse(puts, deletes)
+        forward = ChangeSet([format_record_line(record) for record in puts], list(deletes), [])
+        self.store.apply(puts=puts, deletes=deletes)
+        self.undo_stack.append(HistoryEntry(description, forward, backward))
+        del self.undo_stack[:-self.limit]
+        self.redo_stack.clear()
+
+    def _replay(self, change):
+        positions = [position for position, _ in change.inserts]
+        restored = _records(line for _, line in change.inserts)
+        self.store.apply(puts=_records(change.puts), deletes=change.deletes, inserts=list(zip(positions, restored)))
+
+    def undo(self):
+        """Reverts the latest edit; returns its description, or None if there is nothing to undo."""
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack[-1]
+        self._replay(entry.backward)
+        self.redo_stack.append(self.undo_stack.pop())
+        return entry.description
+
+    def redo(self):
+        """Re-applies the latest undone edit; returns its description, or None."""
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack[-1]
+        self._replay(entry.forward)
+        self.undo_stack.append(self.redo_stack.pop())
+        return entry.description
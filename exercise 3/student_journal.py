@@ -0,0 +1,215 @@
+import os
+import threading
+from student_metrics import METRICS
+from student_saver import replace_file
+
+# --- Journal Format ---
+#
+# One line per mutation, appended to a sidecar file next to the marks file:
+#
+#     P,8439,Jake Hobbs,10,11,10,43     put (add or replace) the first student with this code
+#     D,8439                            delete the first student with this code
+#     I,412,8439,Jake Hobbs,10,11,10,43 insert the student as the 413th in file order
+#     C,2049,1837262                    the lines above are in the base file with this device and inode
+#
+# Entries are not idempotent: when several students share a code, a D replayed
+# twice deletes the next of them too. So compaction records what it folded in.
+# It rotates the journal aside, writes the new base file under a temporary
+# name and, before renaming that into place, appends a C line naming the new
+# file to the rotated journal. A crash after the rename leaves the rotated
+# journal behind, but replay skips every line up to the last C line naming
+# the base file in place. If the rename never happened, no C line names the
+# base file and the rotated journal is replayed in full.
+
+PUT = 'P'
+DELETE = 'D'
+INSERT = 'I'
+COMPACTED = 'C'
+
+JOURNAL_SUFFIX = ".journal"
+COMPACTING_SUFFIX = ".journal.compacting"
+COMPACT_THRESHOLD_BYTES = 256 * 1024  # Fold the journal into the base file past this size
+
+
+def has_pending_edits(base_path):
+    """True if a journal (active or mid-compaction) holds edits not yet folded into the base file."""
+    for suffix in (COMPACTING_SUFFIX, JOURNAL_SUFFIX):
+        try:
+            if os.path.getsize(base_path + suffix):
+                return True
+        except OSError:
+            continue
+    return False
+
+
+class ChangeJournal:
+    """Append-only change log for a marks file, with background compaction."""
+
+    def __init__(self, base_path, threshold=COMPACT_THRESHOLD_BYTES):
+        self.base_path = base_path
+        self.path = base_path + JOURNAL_SUFFIX
+        self.compacting_path = base_path + COMPACTING_SUFFIX
+        self.threshold = threshold
+        self._file = None
+        self._lock = threading.Lock()  # Appends may come from the saver thread while the Tk thread rotates
+        self._compactor = None
+        self.compacted_stat = None  # os.stat of the last base file written by compaction
+
+    # --- Writing ---
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        return self._file
+
+    @staticmethod
+    def entry(puts=(), deletes=(), inserts=()):
+        """
+        The journal text for one mutation. 'puts' are lines in the marks file
+        format, 'deletes' are student codes and 'inserts' are (position, line)
+        pairs.
+        """
+        lines = [f"{PUT},{line}\n" for line in puts]
+        lines += [f"{DELETE},{code}\n" for code in deletes]
+        lines += [f"{INSERT},{position},{line}\n" for position, line in inserts]
+        return ''.join(lines)
+
+    @METRICS.timed('save')
+    def write(self, entries):
+        """Appends entries (see entry) to the journal with a single write and forces them to disk."""
+        with self._lock:
+            f = self._open()
+            f.write(''.join(entries))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, puts=(), deletes=(), inserts=()):
+        """Appends one mutation to the journal and forces it to disk."""
+        self.write([self.entry(puts, deletes, inserts)])
+
+    def size(self):
+        """Current size in bytes of the active journal."""
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def needs_compaction(self):
+        return self.size() >= self.threshold and not self.is_compacting()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def reset(self):
+        """Discards all journal entries (after the base file was fully rewritten)."""
+        self.wait()
+        with self._lock:
+            self._close()
+            for path in (self.path, self.compacting_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # --- Reading ---
+
+    def replay(self):
+        """
+        Yields (op, payload) pairs from any journal files, oldest first: the
+        payload is the list of marks-file fields for PUT, the code for DELETE
+        and (position, fields) for INSERT.
+        Lines a compaction already folded into the base file are skipped, and
+        a torn final line (from a crash mid-append) is ignored.
+        """
+        for path in (self.compacting_path, self.path):
+            try:
+                with open(path, 'r') as f:
+                    lines = self._unfolded(f) if path == self.compacting_path else f
+                    for line in lines:
+                        if not line.endswith('\n'):
+                            break
+                        op, _, payload = line.rstrip('\n').partition(',')
+                        if op == PUT:
+                            yield PUT, payload.split(',')
+                        elif op == DELETE:
+                            try:
+                                yield DELETE, int(payload)
+                            except ValueError:
+                                print(f"Error processing journal entry: {line!r}. Skipping entry.")
+                        elif op == INSERT:
+                            position, _, fields = payload.partition(',')
+                            if position.isdigit():
+                                yield INSERT, (int(position), fields.split(','))
+                            else:
+                                print(f"Error processing journal entry: {line!r}. Skipping entry.")
+            except FileNotFoundError:
+                continue
+
+    def _unfolded(self, lines):
+        """The lines after the last C line naming the base file now in place (all of them if none does)."""
+        try:
+            stat = os.stat(self.base_path)
+            base = f"{COMPACTED},{stat.st_dev},{stat.st_ino}\n"
+        except OSError:
+            base = None
+        unfolded = []
+        for line in lines:
+            if line == base:
+                unfolded.clear()
+            else:
+                unfolded.append(line)
+        return unfolded
+
+    # --- Compaction ---
+
+    def is_compacting(self):
+        return self._compactor is not None and self._compactor.is_alive()
+
+    def compact_async(self, write_base):
+        """
+        Folds the journal into the base file on a background thread.
+
+        The active journal is rotated aside first so that edits made while the
+        compaction runs land in a fresh journal. 'write_base(path)' must write
+        a complete marks file (from a snapshot taken before this call) to 'path'.
+        """
+        if self.is_compacting():
+            return
+        with self._lock:
+            self._close()
+            if os.path.exists(self.compacting_path):
+                # A previous compaction was interrupted; keep its entries in order
+                with open(self.path, 'r') as src, open(self.compacting_path, 'a') as dst:
+                    dst.write(src.read())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.compacting_path)
+
+        # Not a daemon: interpreter exit waits for the new base file to land
+        self._compactor = threading.Thread(target=self._compact, args=(write_base,), name="journal-compactor")
+        self._compactor.start()
+
+    def _compact(self, write_base):
+        try:
+            replace_file(self.base_path, write_base, before_replace=self._note_compacted)
+            os.remove(self.compacting_path)
+        except OSError as e:
+            # The rotated journal is still replayed on load, so nothing is lost
+            print(f"Journal compaction failed: {e}")
+
+    def _note_compacted(self, stat):
+        # Forced to disk before the rename, so a base file that is in place is always named
+        with open(self.compacting_path, 'a') as f:
+            f.write(f"{COMPACTED},{stat.st_dev},{stat.st_ino}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.compacted_stat = stat
+
+    def wait(self):
+        """Blocks until any running compaction has finished."""
+        if self._compactor is not None:
+            self._compactor.join()
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import threading
+import functools
+import contextlib
+
+# --- Latency Instrumentation ---
+#
+# Opt-in timing for the Student Manager: set STUDENT_METRICS=1 in the
+# environment (or METRICS.enabled = True) and every instrumented operation
+# records its latency, from time.perf_counter_ns (a monotonic clock), into a
+# named LatencyHistogram:
+#
+#     with METRICS.phase('parse'):        # time a block
+#         ...
+#
+#     @METRICS.timed('save')              # time every call of a function
+#     def write_marks_file(...): ...
+#
+# While disabled, phase() hands back one shared no-op context manager and a
+# timed() function costs a single attribute check per call, so the hooks can
+# stay in hot code paths.
+
+METRICS_ENV = 'STUDENT_METRICS'
+SUB_BUCKET_BITS = 2                     # 4 buckets per power of two: at most ~25% relative error
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+EXACT_BELOW = 2 * SUB_BUCKETS           # Latencies under 8 ns get a bucket each
+BUCKET_COUNT = 64 * SUB_BUCKETS         # Enough for any 64-bit nanosecond count
+REPORTED_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of latencies in nanoseconds: constant size, O(1)
+    recording, and quantiles accurate to the width of one bucket.
+    """
+
+    __slots__ = ('counts', 'count', 'total_ns', 'min_ns', 'max_ns')
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+
+    @staticmethod
+    def bucket(ns):
+        """Bucket index for a latency: the top SUB_BUCKET_BITS bits below its leading one."""
+        if ns < EXACT_BELOW:
+            return ns
+        bits = ns.bit_length()
+        return (bits - SUB_BUCKET_BITS) * SUB_BUCKETS + ((ns >> (bits - SUB_BUCKET_BITS - 1)) & (SUB_BUCKETS - 1))
+
+    @staticmethod
+    def bucket_bounds(index):
+        """[low, high) range of latencies that fall into bucket 'index'."""
+        if index < EXACT_BELOW:
+            return index, index + 1
+        bits = index // SUB_BUCKETS + SUB_BUCKET_BITS  # Bit length of the latencies in this bucket
+        shift = bits - SUB_BUCKET_BITS - 1
+        low = (SUB_BUCKETS + index % SUB_BUCKETS) << shift
+        return low, low + (1 << shift)
+
+    def record(self, ns):
+        self.counts[self.bucket(ns)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if self.min_ns is None or ns < self.min_ns:
+            self.min_ns = ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def mean(self):
+        return self.total_ns / self.count if self.count else None
+
+    def quantile(self, q):
+        """Approximate q-quantile (0 <= q <= 1) in ns: the middle of the bucket holding it."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index, c in enumerate(self.counts):
+            seen += c
+            if seen > rank:
+                low, high = self.bucket_bounds(index)
+                return min(max((low + high - 1) / 2, self.min_ns), self.max_ns)
+        return self.max_ns
+
+    def to_dict(self):
+        """Summary in milliseconds, plus the raw non-empty buckets (lower bound in ns -> count)."""
+        ms = lambda ns: None if ns is None else ns / 1e6
+        summary = {
+            'count': self.count,
+            'mean_ms': ms(self.mean()),
+            'min_ms': ms(self.min_ns),
+            'max_ms': ms(self.max_ns if self.count else None),
+        }
+        for q in REPORTED_QUANTILES:
+            summary[f"p{q * 100:g}_ms"] = ms(self.quantile(q))
+        summary['buckets'] = {self.bucket_bounds(i)[0]: c for i, c in enumerate(self.counts) if c}
+        return summary
+
+
+class _Timer:
+    """Context manager recording the latency of its block into a Metrics histogram."""
+
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter_ns() - self.start)
+
+
+_NO_TIMER = contextlib.nullcontext()
+
+
+class Metrics:
+    """Registry of named latency histograms, safe to record into from any thread."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, ns):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(ns)
+
+    def phase(self, name):
+        """Context manager timing a block as 'name' (a shared no-op while disabled)."""
+        if not self.enabled:
+            return _NO_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name):
+        """Decorator timing every call of the function as 'name' while enabled."""
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter_ns() - start)
+            return wrapper
+        return decorate
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    def snapshot(self):
+        """Returns {name: summary dict} for every timer recorded so far, sorted by name."""
+        with self._lock:
+            return {name: self.histograms[name].to_dict() for name in sorted(self.histograms)}
+
+    def dump(self, path):
+        """Writes the snapshot as JSON, atomically replacing any previous dump."""
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'written_at': time.time(), 'timers': self.snapshot()}, f, indent=2)
+        os.replace(temp_path, path)
+
+
+# The process-wide registry every instrumented module records into
+METRICS = Metrics(enabled=os.environ.get(METRICS_ENV, '') not in ('', '0'))
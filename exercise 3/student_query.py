@@ -0,0 +1,512 @@
+import re
+import operator
+import functools
+from collections import namedtuple
+from itertools import chain
+from student_table import GRADES, TOTAL_DOMAIN
+from student_engine import MAX_CW_MARK, MAX_EXAM_MARK, PERCENTAGE_BY_TOTAL, GRADE_BY_TOTAL
+
+# NumPy is optional: with it, a query that has to scan the roster is evaluated
+# as whole-column array operations; without it, as one compiled closure per row.
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# --- Query Language ---
+#
+# Filters over student records, for example:
+#
+#     grade in (A, B) and exam >= 80 and name ~ "sc"
+#     not (cw1 = 0 or cw2 = 0 or cw3 = 0)
+#     code in (8439, 2345) or percentage < 40
+#
+# A condition is 'field op value' with op one of = != < <= > >=, 'field in
+# (v, ...)', or 'name ~ text' (case-insensitive substring). Conditions combine
+# with and, or, not and parentheses. Name comparisons ignore case; text with
+# spaces or punctuation goes in single or double quotes.
+#
+# compile_query parses a query once into a Query, which can then test a record
+# dictionary (matches), select rows of a StudentTable (select_rows) or become a
+# SQL WHERE clause (sql_where). Every mark-derived condition is compiled into a
+# lookup table over that field's small range of values, so percentage and
+# grade conditions become sets of total marks; selections then start from the
+# code, name or total-mark index whenever one covers a selective condition.
+
+# Above this share of the roster, scanning beats fetching rows from an index
+# (a vectorized scan is so cheap that only very selective indexes pay off)
+INDEX_MAX_FRACTION = 0.25
+INDEX_MAX_FRACTION_NUMPY = 0.02
+QUERY_CACHE_SIZE = 64      # Compiled queries remembered by compile_query
+
+# Field names (and aliases) -> the mark column each one is a function of, and that column's range
+MARK_FIELDS = {
+    'cw1': 'cw1', 'cw2': 'cw2', 'cw3': 'cw3', 'exam': 'exam',
+    'coursework': 'coursework', 'total_coursework': 'coursework',
+    'total': 'total', 'total_mark': 'total',
+    'percentage': 'total', 'pct': 'total',
+    'grade': 'total',
+}
+COLUMN_DOMAINS = {'cw1': 21, 'cw2': 21, 'cw3': 21, 'exam': MAX_EXAM_MARK + 1,
+                  'coursework': MAX_CW_MARK + 1, 'total': TOTAL_DOMAIN}
+RECORD_KEYS = {'cw1': 'cw1', 'cw2': 'cw2', 'cw3': 'cw3', 'exam': 'exam',
+               'coursework': 'total_coursework', 'total': 'total_mark'}
+FIELDS = ('code', 'name') + tuple(MARK_FIELDS)
+
+OPERATORS = {'=': operator.eq, '!=': operator.ne, '<': operator.lt,
+             '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+COMPARISONS = ('=', '==', '!=', '<', '<=', '>', '>=', '~')
+KEYWORDS = ('and', 'or', 'not', 'in')
+
+TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?(?![\w.]))
+      | (?P<string>"[^"]*"|'[^']*')
+      | (?P<op>==|!=|<=|>=|[=<>~(),])
+      | (?P<word>[^\s"'=<>!~(),]+)
+    )""", re.VERBOSE)
+
+
+class QueryError(ValueError):
+    """A query could not be parsed; the message says what was expected where."""
+
+
+# Parsed and compiled query tree. Conditions on marks are MarkTests: a lookup
+# table with one byte (1 = match) per possible value of a mark column.
+And = namedtuple('And', 'terms')
+Or = namedtuple('Or', 'terms')
+Not = namedtuple('Not', 'term')
+MarkTest = namedtuple('MarkTest', 'column lut')
+CodeTest = namedtuple('CodeTest', 'op values')   # op: a comparison, or 'in' with a frozenset
+NameTest = namedtuple('NameTest', 'op values')   # op: '=' (any of the lowercased values) or '~'
+
+
+# --- Parsing ---
+
+def _tokenize(text):
+    """Splits a query into (kind, text, position) tokens."""
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None:
+            raise QueryError(f"unexpected character {text[position:].lstrip()[:1]!r} at position {position + 1}")
+        kind = match.lastgroup
+        value, start = match.group(kind), match.start(kind)
+        if kind == 'string':
+            value = value[1:-1]
+        elif kind == 'word' and value.lower() in KEYWORDS:
+            kind, value = 'keyword', value.lower()
+        tokens.append((kind, value, start + 1))
+        position = match.end()
+    tokens.append(('end', '', len(text) + 1))
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser: or-expressions of and-expressions of (possibly negated) conditions."""
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.index = 0
+
+    def peek(self):
+        return self.tokens[self.index]
+
+    def take(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            return self.take()
+        return None
+
+    def expect(self, kind, value, what):
+        token = self.accept(kind, value)
+        if token is None:
+            self.fail(what)
+        return token
+
+    def fail(self, what):
+        kind, value, position = self.peek()
+        found = "end of query" if kind == 'end' else repr(value)
+        raise QueryError(f"expected {what} at position {position}, found {found}")
+
+    def parse(self):
+        if self.peek()[0] == 'end':
+            raise QueryError("query is empty")
+        tree = self.parse_or()
+        if self.peek()[0] != 'end':
+            self.fail("'and', 'or' or end of query")
+        return tree
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.accept('keyword', 'or'):
+            terms.append(self.parse_and())
+        return terms[0] if len(terms) == 1 else Or(tuple(terms))
+
+    def parse_and(self):
+        terms = [self.parse_not()]
+        while self.accept('keyword', 'and'):
+            terms.append(self.parse_not())
+        return terms[0] if len(terms) == 1 else And(tuple(terms))
+
+    def parse_not(self):
+        if self.accept('keyword', 'not'):
+            return Not(self.parse_not())
+        if self.accept('op', '('):
+            tree = self.parse_or()
+            self.expect('op', ')', "')'")
+            return tree
+        return self.parse_condition()
+
+    def parse_condition(self):
+        kind, field, position = self.peek()
+        if kind != 'word':
+            self.fail("a field name")
+        field = field.lower()
+        if field not in FIELDS:
+            raise QueryError(f"unknown field {field!r} at position {position} (expected one of {', '.join(FIELDS)})")
+        self.take()
+
+        if self.accept('keyword', 'in'):
+            self.expect('op', '(', "'(' after 'in'")
+            values = [self.parse_value(field)]
+            while self.accept('op', ','):
+                values.append(self.parse_value(field))
+            self.expect('op', ')', "')'")
+            return _condition(field, 'in', values)
+
+        kind, op, position = self.peek()
+        if kind != 'op' or op not in COMPARISONS:
+            self.fail("a comparison (= != < <= > >= ~) or 'in'")
+        self.take()
+        op = '=' if op == '==' else op
+        if op == '~' and field != 'name':
+            raise QueryError(f"'~' (contains) only applies to name, not {field} (position {position})")
+        if op not in ('=', '!=', '~') and field in ('name', 'grade'):
+            raise QueryError(f"{field} can only be compared with =, != or 'in' (position {position})")
+        return _condition(field, op, [self.parse_value(field)])
+
+    def parse_value(self, field):
+        kind, value, position = self.peek()
+        if kind not in ('number', 'string', 'word'):
+            self.fail(f"a value for {field}")
+        self.take()
+        if field == 'name':
+            return value.lower()
+        if field == 'grade':
+            grade = value.strip().upper()
+            if grade not in GRADES:
+                raise QueryError(f"unknown grade {value!r} at position {position} (expected one of {', '.join(GRADES)})")
+            return grade
+        try:
+            return int(value) if field == 'code' else float(value)
+        except ValueError:
+            raise QueryError(f"{field} needs a number, not {value!r} (position {position})") from None
+
+
+# --- Compiling Conditions ---
+
+def _value_of(column, field, value):
+    """What a mark field holds when its column holds 'value' (percentage and grade derive from the total)."""
+    if field in ('percentage', 'pct'):
+        return PERCENTAGE_BY_TOTAL[value]
+    if field == 'grade':
+        return GRADES[GRADE_BY_TOTAL[value]]
+    return value
+
+def _condition(field, op, values):
+    """Compiles one parsed condition into a MarkTest, CodeTest or NameTest."""
+    if field == 'code':
+        return CodeTest('in', frozenset(values)) if op == 'in' else CodeTest(op, values[0])
+    if field == 'name':
+        if op == '~':
+            return NameTest('~', values[0])
+        test = NameTest('=', frozenset(values))
+        return Not(test) if op == '!=' else test
+
+    # Decide the condition once for every value the column can hold
+    column = MARK_FIELDS[field]
+    if op == 'in':
+        accept = set(values).__contains__
+    else:
+        compare, value = OPERATORS[op], values[0]
+        accept = lambda v: compare(v, value)
+    lut = bytes(accept(_value_of(column, field, v)) for v in range(COLUMN_DOMAINS[column]))
+    return MarkTest(column, lut)
+
+
+# --- Record and Row Predicates ---
+
+def _all(tests):
+    return functools.reduce(lambda a, b: lambda x: a(x) and b(x), tests)
+
+def _any(tests):
+    return functools.reduce(lambda a, b: lambda x: a(x) or b(x), tests)
+
+def _closure(tree, leaf):
+    """Combines the closures 'leaf' builds for each condition into one predicate."""
+    if isinstance(tree, And):
+        return _all([_closure(term, leaf) for term in tree.terms])
+    if isinstance(tree, Or):
+        return _any([_closure(term, leaf) for term in tree.terms])
+    if isinstance(tree, Not):
+        test = _closure(tree.term, leaf)
+        return lambda x: not test(x)
+    return leaf(tree)
+
+def _code_test(test, get_code):
+    if test.op == 'in':
+        codes = test.values
+        return lambda x: get_code(x) in codes
+    compare, value = OPERATORS[test.op], test.values
+    return lambda x: compare(get_code(x), value)
+
+def _record_leaf(test):
+    """Closure testing a record dictionary against one condition."""
+    if isinstance(test, MarkTest):
+        lut, key = test.lut, RECORD_KEYS[test.column]
+        return lambda record: lut[record[key]]
+    if isinstance(test, CodeTest):
+        return _code_test(test, operator.itemgetter('code'))
+    if test.op == '~':
+        text = test.values
+        return lambda record: text in record['name'].lower()
+    names = test.values
+    return lambda record: record['name'].lower() in names
+
+def _matching_name_ids(table, test):
+    """Name pool ids of the names a NameTest accepts, found through the table's name indexes."""
+    if test.op == '~':
+        return table.name_ids_matching(test.values, partial=True)
+    return list(chain.from_iterable(table.name_ids_matching(name) for name in test.values))
+
+def _row_leaf(table):
+    """Returns a function building, per condition, a closure over the table's columns that tests a row id."""
+    def leaf(test):
+        if isinstance(test, MarkTest):
+            lut = test.lut
+            if test.column == 'coursework':
+                cw1, cw2, cw3 = table.cw1, table.cw2, table.cw3
+                return lambda row: lut[cw1[row] + cw2[row] + cw3[row]]
+            column = getattr(table, test.column)
+            return lambda row: lut[column[row]]
+        if isinstance(test, CodeTest):
+            return _code_test(test, table.code.__getitem__)
+        name_ids, name_id = frozenset(_matching_name_ids(table, test)), table.name_id
+        return lambda row: name_id[row] in name_ids
+    return leaf
+
+
+# --- Index Selection ---
+
+class _Candidates:
+    """
+    Rows an index offers for (part of) a query: 'estimate' is cheap to know,
+    fetch() materializes the sorted row ids, and 'exact' is True when every
+    one of them is known to match, so they need no re-check.
+    """
+
+    def __init__(self, estimate, fetch, exact=True):
+        self.estimate = estimate
+        self.fetch = fetch
+        self.exact = exact
+
+def _union(row_lists):
+    row_lists = [rows for rows in row_lists if len(rows)]
+    if len(row_lists) == 1:
+        return list(row_lists[0])
+    return sorted(set(chain.from_iterable(row_lists)))
+
+def _plan(tree, table):
+    """Candidates from the code, name or total-mark index for this (sub)query, or None if no index helps."""
+    if isinstance(tree, CodeTest):
+        if tree.op == 'in':
+            codes = tree.values
+        elif tree.op == '=':
+            codes = (tree.values,)
+        else:
+            return None  # Code ranges have no sorted index
+        return _Candidates(len(codes), lambda: _union([table.rows_with_code(code) for code in codes]))
+
+    if isinstance(tree, NameTest):
+        row_lists = [table.rows_with_name_id(name_id) for name_id in _matching_name_ids(table, tree)]
+        return _Candidates(sum(map(len, row_lists)), lambda: _union(row_lists))
+
+    if isinstance(tree, MarkTest) and tree.column == 'total':
+        totals = [t for t, wanted in enumerate(tree.lut) if wanted]
+        histogram, buckets = table.aggregates.histogram, table.aggregates.buckets
+        return _Candidates(sum(histogram[t] for t in totals), lambda: _union([buckets[t] for t in totals]))
+
+    if isinstance(tree, And):
+        # Start from the most selective indexed term; the others re-check its rows
+        plans = [(plan, term) for term in tree.terms if (plan := _plan(term, table)) is not None]
+        if not plans:
+            return None
+        best, best_term = min(plans, key=lambda p: p[0].estimate)
+        rest = [term for term in tree.terms if term is not best_term or not best.exact]
+        if not rest:
+            return best
+        check = _closure(And(tuple(rest)), _row_leaf(table))
+        return _Candidates(best.estimate, lambda: list(filter(check, best.fetch())))
+
+    if isinstance(tree, Or):
+        plans = [_plan(term, table) for term in tree.terms]
+        if any(plan is None for plan in plans):
+            return None  # One unindexed alternative means scanning anyway
+        fetch = lambda: _union([plan.fetch() for plan in plans])
+        return _Candidates(sum(plan.estimate for plan in plans), fetch, all(plan.exact for plan in plans))
+
+    return None
+
+
+# --- Whole-Column Scans ---
+
+def _column(table, name):
+    return np.frombuffer(getattr(table, name), dtype=np.dtype(getattr(table, name).typecode))
+
+def _mask(tree, table):
+    """Evaluates the query over every row at once, as a NumPy boolean array."""
+    if isinstance(tree, And):
+        return functools.reduce(np.logical_and, [_mask(term, table) for term in tree.terms])
+    if isinstance(tree, Or):
+        return functools.reduce(np.logical_or, [_mask(term, table) for term in tree.terms])
+    if isinstance(tree, Not):
+        return ~_mask(tree.term, table)
+    if isinstance(tree, MarkTest):
+        lut = np.frombuffer(tree.lut, dtype=np.uint8).astype(bool)
+        if tree.column == 'coursework':
+            values = _column(table, 'cw1') + _column(table, 'cw2') + _column(table, 'cw3')  # At most 60: no overflow
+        else:
+            values = _column(table, tree.column)
+        return lut[values]
+    if isinstance(tree, CodeTest):
+        codes = _column(table, 'code')
+        if tree.op == 'in':
+            return np.isin(codes, list(tree.values))
+        return OPERATORS[tree.op](codes, tree.values)
+    name_ids = np.array(_matching_name_ids(table, tree), dtype=np.uint32)
+    return np.isin(_column(table, 'name_id'), name_ids)
+
+def _scan(tree, table):
+    if HAS_NUMPY:
+        mask = _mask(tree, table)
+        mask &= np.frombuffer(table.alive, dtype=bool)
+        return np.flatnonzero(mask).tolist()
+    return list(filter(_closure(tree, _row_leaf(table)), table.rows()))
+
+
+# --- Compiled Queries ---
+
+class Query:
+    """A parsed query, compiled once and reusable against records, tables or SQL."""
+
+    def __init__(self, text):
+        self.text = text
+        self.tree = _Parser(text).parse()
+        self.matches = _closure(self.tree, _record_leaf)  # matches(record) -> bool
+
+    def __repr__(self):
+        return f"Query({self.text!r})"
+
+    def select_rows(self, table):
+        """Row ids of the matching students in a StudentTable, in file order."""
+        if not len(table):
+            return []
+        plan = _plan(self.tree, table)
+        max_fraction = INDEX_MAX_FRACTION_NUMPY if HAS_NUMPY else INDEX_MAX_FRACTION
+        if plan is None or plan.estimate > len(table) * max_fraction:
+            return _scan(self.tree, table)
+        rows = plan.fetch()
+        if not plan.exact:
+            rows = list(filter(_closure(self.tree, _row_leaf(table)), rows))
+        return rows
+
+    def sql_where(self):
+        """The query as a SQL condition over the students table, with its parameters."""
+        params = []
+        return _sql(self.tree, params), params
+
+    def may_match(self, min_code, max_code, totals):
+        """
+        False only if no student with a code between min_code and max_code and
+        a total mark in 'totals' can match, e.g. to skip a roster shard
+        without loading it. Conditions it can't decide count as possible.
+        """
+        return _may_match(self.tree, min_code, max_code, frozenset(totals))
+
+
+def _may_match(tree, low, high, totals):
+    if isinstance(tree, And):
+        return all(_may_match(term, low, high, totals) for term in tree.terms)
+    if isinstance(tree, Or):
+        return any(_may_match(term, low, high, totals) for term in tree.terms)
+    if isinstance(tree, CodeTest):
+        if tree.op == 'in':
+            return any(low <= code <= high for code in tree.values)
+        value = tree.values
+        if tree.op == '!=':
+            return not low == high == value
+        return {'=': low <= value <= high, '<': low < value, '<=': low <= value,
+                '>': high > value, '>=': high >= value}[tree.op]
+    if isinstance(tree, MarkTest) and tree.column == 'total':
+        return any(tree.lut[total] for total in totals)
+    return True  # Names, other mark columns and negations are not summarized
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def compile_query(text):
+    """Parses and compiles a query (cached, so repeating a query costs nothing). Raises QueryError."""
+    return Query(text)
+
+
+# --- SQL Translation ---
+
+SQL_COLUMNS = {'cw1': 'cw1', 'cw2': 'cw2', 'cw3': 'cw3', 'exam': 'exam',
+               'coursework': '(cw1 + cw2 + cw3)', 'total': 'total'}
+
+def _sql(tree, params):
+    if isinstance(tree, (And, Or)):
+        joiner = ' AND ' if isinstance(tree, And) else ' OR '
+        return '(' + joiner.join(_sql(term, params) for term in tree.terms) + ')'
+    if isinstance(tree, Not):
+        return f"NOT {_sql(tree.term, params)}"
+    if isinstance(tree, CodeTest):
+        if tree.op == 'in':
+            params.extend(tree.values)
+            return f"code IN ({', '.join('?' * len(tree.values))})"
+        params.append(tree.values)
+        return f"code {tree.op} ?"
+    if isinstance(tree, NameTest):
+        if tree.op == '~':
+            params.append(tree.values)
+            return "instr(name_lower, ?) > 0"
+        params.extend(tree.values)
+        return f"name_lower IN ({', '.join('?' * len(tree.values))})"
+
+    # A lookup table becomes ranges of accepted values, which the total index can serve
+    column = SQL_COLUMNS[tree.column]
+    ranges = []
+    start = None
+    for value, wanted in enumerate(tree.lut + b'\x00'):
+        if wanted and start is None:
+            start = value
+        elif not wanted and start is not None:
+            ranges.append((start, value - 1))
+            start = None
+    if not ranges:
+        return "0"
+    if ranges == [(0, len(tree.lut) - 1)]:
+        return "1"
+    parts = []
+    for low, high in ranges:
+        params.extend((low, high))
+        parts.append(f"{column} BETWEEN ? AND ?")
+    return parts[0] if len(parts) == 1 else '(' + ' OR '.join(parts) + ')'
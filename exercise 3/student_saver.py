@@ -0,0 +1,178 @@
+import os
+import time
+import atexit
+import threading
+
+# --- Write-Behind Saving ---
+#
+# Edits are applied to the in-memory roster at once, but written to disk by a
+# background thread. Each edit is submitted as a 'change' (a journal entry, a
+# snapshot to write out, ...) and the saver waits until edits have stopped
+# arriving for SAVE_DELAY_SECONDS before writing everything pending in one go:
+# a burst of N edits costs one write and one fsync instead of N.
+#
+# During an unbroken burst no edit waits longer than SAVE_MAX_DELAY_SECONDS.
+# A failed write keeps its changes pending and is retried every
+# SAVE_RETRY_SECONDS, and flush() (which close() and interpreter exit call)
+# writes whatever is still pending before returning.
+#
+#     saved      everything submitted is on disk
+#     unsaved    changes are waiting for the quiet period to end
+#     saving     a write is in progress
+#     failed     the last write failed; its changes are still pending
+
+SAVE_DELAY_SECONDS = 0.5        # Quiet period after the latest edit before writing
+SAVE_MAX_DELAY_SECONDS = 3.0    # Longest any edit waits while edits keep arriving
+SAVE_RETRY_SECONDS = 5.0        # Wait before retrying a failed write
+
+SAVED = 'saved'
+UNSAVED = 'unsaved'
+SAVING = 'saving'
+FAILED = 'failed'
+
+
+def replace_file(path, write, before_replace=None):
+    """
+    Atomically replaces path: 'write(temp_path)' writes the new contents under
+    a temporary name, which are forced to disk before being renamed over the
+    old file, so a crash leaves either the old file or the new one, never half
+    of it. Returns the os.stat of the file now in place, which is also passed
+    to 'before_replace' just ahead of the rename, so that anyone watching path
+    knows the new file as its own before it can appear.
+    """
+    temp_path = path + ".tmp"
+    try:
+        write(temp_path)
+        with open(temp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        written = os.stat(temp_path)
+        if before_replace is not None:
+            before_replace(written)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return written
+
+
+class WriteBehindSaver:
+    """
+    Coalesces submitted changes and passes them, oldest first, to 'write' on a
+    background thread. 'write(changes)' must persist the whole list or raise.
+    """
+
+    def __init__(self, write, delay=SAVE_DELAY_SECONDS, max_delay=SAVE_MAX_DELAY_SECONDS,
+                 retry_delay=SAVE_RETRY_SECONDS, name="write-behind"):
+        self._write = write
+        self.delay = delay
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.name = name
+        self._cond = threading.Condition()
+        self._pending = []
+        self._oldest = self._latest = 0.0   # time.monotonic() of the first and last pending submits
+        self._failed_at = None              # When the last write failed (None after a success)
+        self._writing = False
+        self._urgent = False                # A flush is waiting: skip the quiet period
+        self._attempts = 0                  # Writes finished, successfully or not
+        self._closed = False
+        self._thread = None
+        self.error = None                   # Exception from the last write, if it failed
+
+    @property
+    def status(self):
+        with self._cond:
+            if self.error is not None:
+                return FAILED
+            if self._writing:
+                return SAVING
+            return UNSAVED if self._pending else SAVED
+
+    def submit(self, change):
+        """Queues a change for the next write."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write-behind saver is closed")
+            now = time.monotonic()
+            if not self._pending:
+                self._oldest = now
+            self._latest = now
+            self._pending.append(change)
+            if self._thread is None:
+                # A daemon, so that an idle saver never holds up exit; flush() at exit writes what's left
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            self._cond.notify_all()
+
+    def flush(self):
+        """
+        Writes every change submitted so far before returning. Raises the
+        write's exception if that fails (the changes then stay pending).
+        """
+        with self._cond:
+            # A write already under way may not include the latest changes: wait for the one after it
+            target = self._attempts + 1 + self._writing
+            self._urgent = True
+            self._cond.notify_all()
+            while self._pending or self._writing:
+                if self._attempts >= target and self.error is not None:
+                    raise self.error
+                self._cond.wait()
+
+    def close(self):
+        """Flushes pending changes and stops the thread; nothing may be submitted afterwards."""
+        atexit.unregister(self.close)
+        try:
+            self.flush()
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+            if self._thread is not None and self._thread is not threading.current_thread():
+                self._thread.join()
+
+    def _due(self):
+        """Monotonic time at which the pending changes should be written."""
+        if self._urgent:
+            return 0.0
+        if self._failed_at is not None:
+            return self._failed_at + self.retry_delay
+        return min(self._latest + self.delay, self._oldest + self.max_delay)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed and (not self._pending or self._failed_at is not None):
+                        return  # Closed after the final flush, whether or not that worked
+                    if self._pending:
+                        wait = self._due() - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._urgent = False
+                        self._cond.wait()
+                changes, self._pending = self._pending, []
+                self._writing = True
+                self._urgent = False
+
+            try:
+                self._write(changes)
+                error = None
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                self._writing = False
+                self._attempts += 1
+                self.error = error
+                if error is None:
+                    self._failed_at = None
+                else:
+                    # Keep them, ahead of anything submitted meanwhile, for the retry
+                    self._pending[:0] = changes
+                    self._failed_at = time.monotonic()
+                self._cond.notify_all()
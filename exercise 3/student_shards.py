@@ -0,0 +1,512 @@
+import os
+import json
+import operator
+from bisect import bisect_right
+from collections import deque
+from collections.abc import Sequence
+from itertools import accumulate, compress, chain
+from student_table import StudentTable, TOTAL_DOMAIN
+from student_fuzzy import MAX_DISTANCE
+from student_stats import Histogram
+from student_metrics import METRICS
+from student_saver import replace_file, SAVED, UNSAVED, SAVING, FAILED
+from student_journal import JOURNAL_SUFFIX, COMPACTING_SUFFIX
+from student_engine import write_marks_file, format_record_line, process_record
+from student_storage import MarksStore, TextMarksStore, StorageError, MANIFEST_SUFFIX, checked_names, open_store
+
+# --- Sharded Rosters ---
+#
+# A large roster can be split into shard files, each an ordinary marks file
+# (with its own change journal), listed in a JSON manifest:
+#
+#     {"format": "student-shards", "version": 1, "shards": [
+#         {"file": "roster.0000.txt", "low": 1000, "count": 98213,
+#          "min_code": 1000, "max_code": 25310, "total_sum": 10843327,
+#          "histogram": [...], "highest": "2345,Sam Sturtivant,...",
+#          "lowest": "...", "stamp": [...]},
+#         ...]}
+#
+# Each shard owns the student codes from its 'low' up to the next shard's, so
+# every student, and every edit to one, belongs to exactly one shard. Shards
+# are cut either into ranges of about the same number of students or into
+# cohorts: fixed-width blocks of codes (e.g. one per thousand).
+#
+# ShardedMarksStore reads only the manifest when it opens. The count, total
+# sum and a histogram of total marks per shard answer whole-roster summaries,
+# and the stored highest and lowest students answer extremes, without
+# opening a shard. A shard is loaded the first time a query touches it:
+#
+#   code lookups and edits      the one shard owning the code, and only if
+#                               min_code..max_code can hold it
+#   queries                     shards whose codes and totals might match
+#   the record list             shards as their rows are scrolled into view
+#   name searches and ranking   every shard
+#
+# The store's file order is shard order: records() runs through the shards
+# in code order, each in its own file order (a student added later comes at
+# the end of its shard). So where the Text and SQLite stores break ties by
+# position in the roster, here a tie goes to the earliest shard: the split
+# does not keep the order of the roster it was cut from. Ranking is the same
+# in every store (total mark, then code), so it needs no such caveat.
+#
+# Loaded shards stay loaded, so memory follows the working set. The manifest
+# is brought up to date when the store is flushed or closed. Its 'stamp' (the
+# size and mtime of a shard's files) tells a shard written since, for
+# example before a crash, whose figures are then recomputed by loading it.
+
+MANIFEST_FORMAT = 'student-shards'
+MANIFEST_VERSION = 1
+SHARD_ROWS = 100_000  # Students per shard when splitting into ranges of equal size
+
+
+# --- Manifest ---
+
+def shard_entry(table, file, low):
+    """The manifest entry describing a shard's table (without its stamp)."""
+    codes = list(compress(table.code, table.alive))
+    highest, lowest = table.extreme_row(True), table.extreme_row(False)
+    return {
+        'file': file,
+        'low': low,
+        'count': len(table),
+        'min_code': min(codes, default=None),
+        'max_code': max(codes, default=None),
+        'total_sum': table.total_sum(),
+        'histogram': list(table.aggregates.histogram),
+        'highest': None if highest is None else format_record_line(table.record(highest)),
+        'lowest': None if lowest is None else format_record_line(table.record(lowest)),
+    }
+
+def file_stamp(path):
+    """[size, mtime_ns] of a shard file and of its journals (None where missing)."""
+    stamp = []
+    for name in (path, path + JOURNAL_SUFFIX, path + COMPACTING_SUFFIX):
+        try:
+            stat = os.stat(name)
+            stamp.append([stat.st_size, stat.st_mtime_ns])
+        except FileNotFoundError:
+            stamp.append(None)
+    return stamp
+
+def read_manifest(path):
+    """Returns the shard entries of a manifest. Raises StorageError if it isn't one."""
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            manifest = json.load(f)
+        except ValueError as e:
+            raise StorageError(f"{path} is not a shard manifest: {e}") from e
+    if not isinstance(manifest, dict) or manifest.get('format') != MANIFEST_FORMAT or manifest.get('version') != MANIFEST_VERSION:
+        raise StorageError(f"{path} is not a version {MANIFEST_VERSION} shard manifest.")
+    if not manifest.get('shards'):
+        raise StorageError(f"{path} lists no shards.")
+    return manifest['shards']
+
+def write_manifest(path, entries):
+    """Atomically (re)writes a manifest listing the given shard entries, in code order."""
+    def write(temp_path):
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'format': MANIFEST_FORMAT, 'version': MANIFEST_VERSION, 'shards': entries}, f)
+    replace_file(path, write)
+
+
+# --- Splitting a Roster ---
+
+def _code_groups(table, rows=SHARD_ROWS, width=None):
+    """
+    Yields (low, row ids) for each shard: the live rows in code order (file
+    order for equal codes), cut every 'rows' students or at multiples of
+    'width'. Students sharing a code always land in the same shard.
+    """
+    code = table.code
+    ordered = sorted(table.rows(), key=code.__getitem__)
+    start = 0
+    while start < len(ordered):
+        first = code[ordered[start]]
+        if width is not None:
+            low = first // width * width
+            end = bisect_right(ordered, low + width - 1, lo=start, key=code.__getitem__)
+        else:
+            low = first
+            end = min(start + rows, len(ordered))
+            if end < len(ordered):
+                end = bisect_right(ordered, code[ordered[end - 1]], lo=end, key=code.__getitem__)
+        yield low, ordered[start:end]
+        start = end
+
+@METRICS.timed('shard')
+def write_sharded_roster(source, manifest_path, rows=SHARD_ROWS, width=None):
+    """
+    Splits a roster (any file open_store accepts) into shard files next to
+    manifest_path, by ranges of about 'rows' students or, given 'width', by
+    cohorts of codes in blocks of that width. Returns the number of shards.
+    """
+    if not manifest_path.endswith(MANIFEST_SUFFIX):
+        raise ValueError(f"a shard manifest's name must end in {MANIFEST_SUFFIX}")
+    store = open_store(source)
+    try:
+        store.load()
+        table = store.table if isinstance(store, TextMarksStore) else StudentTable(store.records())
+    finally:
+        store.close()
+
+    stem = manifest_path[:-len(MANIFEST_SUFFIX)]
+    # An empty roster still gets one (empty) shard for new students to go to
+    groups = list(_code_groups(table, rows, width)) or [(0, [])]
+    entries = []
+    for number, (low, group) in enumerate(groups):
+        shard = StudentTable(map(table.record, group))
+        path = f"{stem}.{number:04d}.txt"
+        replace_file(path, lambda temp_path: write_marks_file(temp_path, shard))
+        for stale in (path + JOURNAL_SUFFIX, path + COMPACTING_SUFFIX):
+            if os.path.exists(stale):
+                os.remove(stale)  # Left by an earlier roster of the same name: would replay into this one
+        entry = shard_entry(shard, os.path.basename(path), low)
+        entry['stamp'] = file_stamp(path)
+        entries.append(entry)
+    write_manifest(manifest_path, entries)
+    return len(entries)
+
+
+# --- Lazy Views ---
+
+class ConcatenatedView(Sequence):
+    """
+    Several sequences back to back, each fetched by part(i) only when one of
+    its items is first read (which for a roster shard means loading it).
+    """
+
+    def __init__(self, lengths, part):
+        self.starts = list(accumulate(lengths, initial=0))
+        self._part = part
+        self._parts = {}
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def _sequence(self, i):
+        sequence = self._parts.get(i)
+        if sequence is None:
+            sequence = self._parts[i] = self._part(i)
+        return sequence
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            items = []
+            i = bisect_right(self.starts, start) - 1
+            while start < stop:
+                end = min(stop, self.starts[i + 1])
+                if end > start:
+                    items.extend(self._sequence(i)[start - self.starts[i]:end - self.starts[i]])
+                start = end
+                i += 1
+            return items
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        i = bisect_right(self.starts, index) - 1
+        return self._sequence(i)[index - self.starts[i]]
+
+
+class RankedShardView(Sequence):
+    """
+    The students of several shards in rank order (total mark, then code).
+    Each shard's own ranking breaks ties by code, not by file order (see
+    RankIndex), and shards own ascending, disjoint code ranges, so students
+    with equal totals come shard after shard in code order: position i is
+    found from per-shard counts of each total mark, without sorting or
+    merging anything.
+    """
+
+    def __init__(self, stores, descending=True):
+        self.ranked = [store.ranked(descending) for store in stores]
+        self.histograms = [store.table.aggregates.histogram for store in stores]
+        self.totals = list(range(TOTAL_DOMAIN - 1, -1, -1) if descending else range(TOTAL_DOMAIN))
+        # Per shard: where each total's students start in that shard's own ranking
+        self.shard_starts = [list(accumulate((histogram[t] for t in self.totals), initial=0))
+                             for histogram in self.histograms]
+        # Overall: where each total's students start
+        self.starts = [sum(column) for column in zip(*self.shard_starts)] if stores else [0]
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def _item(self, index):
+        k = bisect_right(self.starts, index) - 1
+        offset, total = index - self.starts[k], self.totals[k]
+        for ranked, histogram, starts in zip(self.ranked, self.histograms, self.shard_starts):
+            if offset < histogram[total]:
+                return ranked[starts[k] + offset]
+            offset -= histogram[total]
+        raise IndexError("rank position out of range")
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._item(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("rank position out of range")
+        return self._item(index)
+
+
+# --- Sharded Backend ---
+
+class Shard:
+    """One shard: its file, the codes it owns from 'low' up, its manifest entry, and its store once loaded."""
+
+    __slots__ = ('path', 'low', 'entry', 'store')
+
+    def __init__(self, path, low, entry):
+        self.path = path
+        self.low = low
+        self.entry = entry
+        self.store = None
+
+    def __len__(self):
+        return self.entry['count'] if self.store is None else len(self.store)
+
+    def histogram(self):
+        return self.entry['histogram'] if self.store is None else self.store.table.aggregates.histogram
+
+    def total_sum(self):
+        return self.entry['total_sum'] if self.store is None else self.store.table.total_sum()
+
+    def may_hold(self, code):
+        """False if the manifest shows the (unloaded) shard can't have this code."""
+        entry = self.entry
+        return self.store is not None or (entry['count'] > 0 and entry['min_code'] <= code <= entry['max_code'])
+
+    def may_match(self, query):
+        """False if the manifest shows no student of the (unloaded) shard can match the query."""
+        if self.store is not None:
+            return True
+        entry = self.entry
+        if not entry['count']:
+            return False
+        totals = [total for total, count in enumerate(entry['histogram']) if count]
+        return query.may_match(entry['min_code'], entry['max_code'], totals)
+
+
+class ShardedMarksStore(MarksStore):
+    """A roster split into code-range shards listed in a manifest, each loaded on first use."""
+
+    def __init__(self, path, use_journal=True):
+        self.path = path
+        self.use_journal = use_journal
+        self.shards = []
+        self._lows = []
+        self._changed = False  # Edits made since the manifest was last written
+
+    def load(self):
+        folder = os.path.dirname(self.path)
+        self.shards = [Shard(os.path.join(folder, entry['file']), entry['low'], entry)
+                       for entry in read_manifest(self.path)]
+        self._lows = [shard.low for shard in self.shards]
+        for shard in self.shards:
+            if shard.entry.get('stamp') != file_stamp(shard.path):
+                # Changed since the manifest was written (e.g. edits saved before a crash): recount it
+                self._open(shard)
+                self._changed = True
+
+    def _open(self, shard):
+        """The shard's store, loading the shard if this is the first time it is needed."""
+        if shard.store is None:
+            store = TextMarksStore(shard.path, self.use_journal)
+            with METRICS.phase('shard.load'):
+                store.load()
+            shard.store = store
+        return shard.store
+
+    def _loaded(self):
+        return [shard for shard in self.shards if shard.store is not None]
+
+    def _all(self):
+        return [self._open(shard) for shard in self.shards]
+
+    def _owner(self, code):
+        """The shard owning a code: the last one whose 'low' is at or below it (else the first)."""
+        return self.shards[max(bisect_right(self._lows, code) - 1, 0)]
+
+    # --- Persistence ---
+
+    def write_manifest(self):
+        """Brings the manifest entries of loaded shards up to date (once their edits are on disk)."""
+        for shard in self._loaded():
+            entry = shard_entry(shard.store.table, shard.entry['file'], shard.low)
+            entry['stamp'] = file_stamp(shard.path)
+            shard.entry = entry
+        write_manifest(self.path, [shard.entry for shard in self.shards])
+        self._changed = False
+
+    def flush(self):
+        for shard in self._loaded():
+            shard.store.flush()
+        if self._changed:
+            self.write_manifest()
+
+    def close(self):
+        # Every shard is closed even if one fails; the manifest is only refreshed if all were saved
+        errors = []
+        for shard in self._loaded():
+            try:
+                shard.store.close()
+            except StorageError as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        if self._changed:
+            self.write_manifest()
+
+    def save_status(self):
+        statuses = [shard.store.save_status() for shard in self._loaded()]
+        for status in (FAILED, SAVING, UNSAVED):
+            for found, error in statuses:
+                if found == status:
+                    return found, error
+        return SAVED, None
+
+    # --- Queries ---
+
+    def __len__(self):
+        return sum(map(len, self.shards))
+
+    def get(self, code):
+        shard = self._owner(code)
+        if not shard.may_hold(code):
+            return None
+        return self._open(shard).get(code)
+
+    def get_many(self, codes):
+        by_shard = {}
+        for code in codes:
+            shard = self._owner(code)
+            if shard.may_hold(code):
+                by_shard.setdefault(id(shard), (shard, []))[1].append(code)
+        found = {}
+        for shard, shard_codes in by_shard.values():
+            found.update(self._open(shard).get_many(shard_codes))
+        return found
+
+    def find_name(self, name, partial=False):
+        # Shards are loaded in order only until one holds the name
+        for shard in self.shards:
+            record = self._open(shard).find_name(name, partial)
+            if record is not None:
+                return record
+        return None
+
+    def codes_with_name(self, name):
+        return list(chain.from_iterable(store.codes_with_name(name) for store in self._all()))
+
+    def find_names_fuzzy(self, name, max_distance=MAX_DISTANCE, limit=None):
+        matches = list(chain.from_iterable(store.find_names_fuzzy(name, max_distance, limit) for store in self._all()))
+        matches.sort(key=operator.itemgetter(0))  # Stable: equal distances stay in shard, then file, order
+        return matches if limit is None else matches[:limit]
+
+    def extreme(self, highest=True):
+        """
+        The first student, in shard order, with the highest (or lowest) total:
+        ties go to the lowest codes' shard rather than the pre-split file order.
+        """
+        # Strictly better only, so an earlier shard keeps a tie
+        better = operator.gt if highest else operator.lt
+        best = None
+        for shard in self.shards:
+            if shard.store is not None:
+                record = shard.store.extreme(highest)
+            else:
+                line = shard.entry['highest' if highest else 'lowest']
+                record = None if line is None else process_record(line.split(','))
+            if record is not None and (best is None or better(record['total_mark'], best['total_mark'])):
+                best = record
+        return best
+
+    def summary(self):
+        # Unloaded shards answer from the manifest
+        counts = [0] * TOTAL_DOMAIN
+        for shard in self.shards:
+            counts = list(map(operator.add, counts, shard.histogram()))
+        median = Histogram.from_counts(counts).quantile(0.5)
+        return len(self), sum(shard.total_sum() for shard in self.shards), median
+
+    def records(self):
+        # Only the shards whose rows are read get loaded
+        shards = self.shards
+        return ConcatenatedView([len(shard) for shard in shards], lambda i: self._open(shards[i]).records())
+
+    def ranked(self, descending=True):
+        return RankedShardView(self._all(), descending)
+
+    def select(self, query):
+        parts = [self._open(shard).select(query) for shard in self.shards if shard.may_match(query)]
+        return ConcatenatedView([len(part) for part in parts], parts.__getitem__)
+
+    def export_batches(self):
+        # Loaded shards may change while the batches are consumed, so they are copied now;
+        # the others are read from disk as the export reaches them
+        sources = [shard.path if shard.store is None else shard.store.table.snapshot() for shard in self.shards]
+        return self._export_batches(sources)
+
+    def _export_batches(self, sources):
+        for source in sources:
+            if not isinstance(source, str):
+                yield from source.column_batches()
+                continue
+            store = TextMarksStore(source, self.use_journal)
+            try:
+                store.load()
+                yield from store.table.column_batches()
+            finally:
+                store.close()  # Also when the export stops part-way and closes this generator
+
+    # --- Edits ---
+
+    def locate(self, codes):
+        # Positions are within each code's own shard, which apply routes an insert back to
+        codes = list(codes)
+        by_shard = {}
+        for i, code in enumerate(codes):
+            shard = self._owner(code)
+            if shard.may_hold(code):
+                by_shard.setdefault(id(shard), (shard, []))[1].append(i)
+        found = [None] * len(codes)
+        for shard, indices in by_shard.values():
+            for i, place in zip(indices, self._open(shard).locate([codes[i] for i in indices])):
+                found[i] = place
+        return found
+
+    def apply(self, puts=(), deletes=(), inserts=()):
+        """Applies an edit shard by shard (each shard's part is saved as one unit, in code order)."""
+        puts = list(checked_names(puts))  # Up front, so no shard takes its part of a refused edit
+        inserts = list(inserts)
+        deque(checked_names(record for _, record in inserts), maxlen=0)
+        by_shard = {}
+
+        def part(shard):
+            return by_shard.setdefault(id(shard), (shard, [], [], []))
+
+        for record in puts:
+            part(self._owner(record['code']))[1].append(record)
+        for code in deletes:
+            shard = self._owner(code)
+            if shard.may_hold(code):
+                part(shard)[2].append(code)
+        for position, record in inserts:
+            part(self._owner(record['code']))[3].append((position, record))
+        for shard, shard_puts, shard_deletes, shard_inserts in by_shard.values():
+            self._open(shard).apply(puts=shard_puts, deletes=shard_deletes, inserts=shard_inserts)
+            self._changed = True
+
+    def replace_all(self, records):
+        groups = {id(shard): [] for shard in self.shards}
+        for record in checked_names(records):
+            groups[id(self._owner(record['code']))].append(record)
+        for shard in self.shards:
+            store = shard.store or TextMarksStore(shard.path, self.use_journal)
+            store.replace_all(groups[id(shard)])  # A full rewrite: nothing needs loading first
+            shard.store = store
+        self.write_manifest()
@@ -0,0 +1,224 @@
+from collections import Counter
+from itertools import compress, islice
+from student_table import GRADES
+from student_binary import BinaryMarksFile, is_binary_marks_file
+from student_journal import has_pending_edits
+from student_engine import MAX_EXAM_MARK, MAX_TOTAL_MARK, grade_columns
+
+# NumPy is optional: bincount replaces Counter for large batches when it is installed
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# --- Streaming Statistics ---
+#
+# Every mark is a small non-negative integer, so an exact histogram per field
+# is both the cheapest sketch there is and lossless: mean, variance, median
+# and any percentile can be read off it exactly, and two histograms merge by
+# adding their counts. That makes MarkStatistics a single-pass, constant-memory
+# summary that can be built per chunk or per file and combined afterwards.
+
+# Largest possible value of each tracked field
+FIELD_MAXIMUMS = {
+    'cw1': 20,
+    'cw2': 20,
+    'cw3': 20,
+    'exam': MAX_EXAM_MARK,
+    'total_coursework': 60,
+    'total_mark': MAX_TOTAL_MARK,
+}
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+STATS_BATCH_ROWS = 65536  # Binary records read per batch when streaming a file
+
+
+class Histogram:
+    """Exact, mergeable histogram over the integers 0..size-1."""
+
+    def __init__(self, size):
+        self.counts = [0] * size
+
+    @classmethod
+    def from_counts(cls, counts):
+        histogram = cls(len(counts))
+        histogram.counts = list(counts)
+        return histogram
+
+    def update(self, values):
+        """Adds an iterable (or NumPy array) of values."""
+        if HAS_NUMPY and isinstance(values, np.ndarray):
+            binned = np.bincount(values, minlength=len(self.counts))
+            self.counts = [a + int(b) for a, b in zip(self.counts, binned)]
+            return
+        for value, count in Counter(values).items():
+            self.counts[value] += count
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        return self
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def mean(self):
+        n = self.count
+        return sum(value * c for value, c in enumerate(self.counts)) / n if n else 0.0
+
+    def variance(self):
+        """Population variance."""
+        n = self.count
+        if not n:
+            return 0.0
+        mean = self.mean()
+        return sum(c * (value - mean) ** 2 for value, c in enumerate(self.counts)) / n
+
+    def value_at(self, rank):
+        """The rank-th smallest value (0-based)."""
+        seen = 0
+        for value, c in enumerate(self.counts):
+            seen += c
+            if seen > rank:
+                return value
+        raise IndexError("rank out of range")
+
+    def quantile(self, q):
+        """
+        The q-quantile (0 <= q <= 1), interpolating linearly between order
+        statistics as numpy.percentile does by default. None when empty.
+        Raises ValueError for q outside 0..1.
+        """
+        if not 0 <= q <= 1:
+            raise ValueError(f"quantile must be between 0 and 1, not {q}")
+        n = self.count
+        if not n:
+            return None
+        position = q * (n - 1)
+        low = int(position)
+        low_value = self.value_at(low)
+        if position == low:
+            return float(low_value)
+        high_value = self.value_at(low + 1)
+        return low_value + (high_value - low_value) * (position - low)
+
+
+class MarkStatistics:
+    """Single-pass statistics over student marks, mergeable across chunks and files."""
+
+    def __init__(self):
+        self.histograms = {field: Histogram(maximum + 1) for field, maximum in FIELD_MAXIMUMS.items()}
+        self.grades = Counter()
+
+    @property
+    def count(self):
+        return self.histograms['total_mark'].count
+
+    def add(self, record):
+        """Adds one processed student record."""
+        for field, histogram in self.histograms.items():
+            histogram.counts[record[field]] += 1
+        self.grades[record['grade']] += 1
+
+    def add_columns(self, cw1, cw2, cw3, exam):
+        """
+        Adds a batch of marks given as columns. Rows are validated and graded
+        by grade_columns, so rejected rows are skipped exactly as in process_record.
+        """
+        graded = grade_columns(cw1, cw2, cw3, exam)
+        if HAS_NUMPY:
+            valid = graded.valid
+            columns = {field: np.asarray(column)[valid]
+                       for field, column in (('cw1', cw1), ('cw2', cw2), ('cw3', cw3), ('exam', exam))}
+            columns['total_coursework'] = columns['cw1'] + columns['cw2'] + columns['cw3']
+            grades = np.bincount(graded.grade, minlength=len(GRADES)).tolist()
+        else:
+            valid = graded.valid
+            columns = {field: list(compress(column, valid))
+                       for field, column in (('cw1', cw1), ('cw2', cw2), ('cw3', cw3), ('exam', exam))}
+            columns['total_coursework'] = [a + b + c for a, b, c in zip(columns['cw1'], columns['cw2'], columns['cw3'])]
+            grade_counts = Counter(graded.grade)
+            grades = [grade_counts[i] for i in range(len(GRADES))]
+        columns['total_mark'] = graded.total
+
+        for field, histogram in self.histograms.items():
+            histogram.update(columns[field])
+        for index, count in enumerate(grades):
+            if count:
+                self.grades[GRADES[index]] += count
+
+    def merge(self, other):
+        """Folds another MarkStatistics (e.g. from another chunk or file) into this one."""
+        for field, histogram in self.histograms.items():
+            histogram.merge(other.histograms[field])
+        self.grades.update(other.grades)
+        return self
+
+    @classmethod
+    def from_records(cls, records):
+        stats = cls()
+        for record in records:
+            stats.add(record)
+        return stats
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Streams a roster in one pass. Journal edits not yet folded into a marks
+        file are included: such a file, like a database or a sharded roster, is
+        read through its store (see student_export.roster_batches).
+        """
+        # Imported here: student_export reaches student_storage, which builds on this module
+        from student_export import roster_batches
+
+        stats = cls()
+        if is_binary_marks_file(path) and not has_pending_edits(path):
+            # Read straight from the memory map, so memory stays constant however large the file
+            with BinaryMarksFile(path) as marks:
+                rows = iter(marks)
+                while True:
+                    batch = list(islice(rows, STATS_BATCH_ROWS))
+                    if not batch:
+                        break
+                    stats.add_columns(*([row[i] for row in batch] for i in range(2, 6)))
+        else:
+            for columns in roster_batches(path):
+                stats.add_columns(*columns[2:6])
+        return stats
+
+    def summary(self, percentiles=DEFAULT_PERCENTILES):
+        """
+        Returns a JSON-friendly dict: count, then mean, variance, standard
+        deviation, median and the requested percentiles of each field (and of
+        the overall percentage), plus the grade distribution.
+        """
+        fields = {}
+        for field, histogram in self.histograms.items():
+            fields[field] = self._describe(histogram, percentiles)
+
+        # Percentage is a fixed scaling of the total mark
+        scale = 100 / MAX_TOTAL_MARK
+        total = fields['total_mark']
+        fields['percentage'] = {
+            'mean': total['mean'] * scale,
+            'variance': total['variance'] * scale ** 2,
+            'std_dev': total['std_dev'] * scale,
+            'median': None if total['median'] is None else total['median'] * scale,
+            'percentiles': {p: None if v is None else v * scale for p, v in total['percentiles'].items()},
+        }
+        return {
+            'count': self.count,
+            'fields': fields,
+            'grades': {grade: self.grades.get(grade, 0) for grade in GRADES},
+        }
+
+    @staticmethod
+    def _describe(histogram, percentiles):
+        variance = histogram.variance()
+        return {
+            'mean': histogram.mean(),
+            'variance': variance,
+            'std_dev': variance ** 0.5,
+            'median': histogram.quantile(0.5),
+            'percentiles': {p: histogram.quantile(p / 100) for p in percentiles},
+        }
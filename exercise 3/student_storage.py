@@ -0,0 +1,933 @@
+import os
+import mmap
+import sqlite3
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+from array import array
+from collections.abc import Sequence
+from itertools import islice
+from student_table import StudentTable, GRADE_INDEX, BATCH_ROWS
+from student_journal import ChangeJournal, has_pending_edits
+from student_saver import WriteBehindSaver, replace_file, SAVED
+from student_stats import Histogram
+from student_metrics import METRICS
+from student_fuzzy import FuzzyNameIndex, MAX_DISTANCE, name_keys
+from student_binary import BinaryMarksFile, is_binary_marks_file
+from student_engine import (MAX_TOTAL_MARK, process_record, load_marks_file, replay_journal, write_marks_file,
+                            format_record_line, iter_chunk_columns, iter_records, validate_name)
+
+# --- Storage Backends ---
+#
+# The Student Manager talks to its roster through a MarksStore, which owns
+# both the data and its persistence. Students are addressed by code and passed
+# around as the dictionaries process_record builds. Two backends exist:
+#
+#   TextMarksStore     the marks file (text or binary) plus its change journal,
+#                      loaded whole into a StudentTable and queried in memory
+#   SqliteMarksStore   a local SQLite database in WAL mode; nothing is loaded up
+#                      front and every query, sort and search runs as SQL
+#
+# A roster split into code-range shards (student_shards.py) is served by a
+# third backend, which keeps one TextMarksStore per shard it has loaded.
+#
+# Write failures surface as StorageError whichever backend is in use. The text
+# backend writes behind (see student_saver.py): apply() returns once the table
+# is updated, and its failures are reported through save_status() and flush().
+# Every backend refuses (with StorageError, before changing anything) a name
+# the comma-separated marks file could not hold, so any roster can be exported
+# to it and every edit replayed from its lines (see student_history.py).
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+DATABASE_SUFFIX = ".db"
+MANIFEST_SUFFIX = ".shards.json"  # A sharded roster's manifest (see student_shards.py)
+SQL_PAGE_ROWS = 200         # Rows fetched per query when scrolling a database view
+IMPORT_BATCH_ROWS = 10_000  # Rows inserted per executemany when importing
+LOOKUP_BATCH_KEYS = 500     # Codes or names per "IN (...)" query
+FINGERPRINT_BYTES = 64      # Bytes before the parsed offset compared to tell an append from a rewrite
+OWN_WRITES_REMEMBERED = 8   # Background rewrites poll_changes recognises as the store's own
+
+# What poll_changes found: either the roster must be reloaded from scratch, or
+# 'merged' students were brought in place (None when the backend can't count them)
+ExternalChange = namedtuple('ExternalChange', 'reload merged')
+
+
+def _stat_key(stat):
+    """What identifies one version of a file: its inode, which may be reused, plus size and mtime."""
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class StorageError(IOError):
+    """A backend could not read or persist the roster."""
+
+
+def checked_names(records):
+    """Passes records through, raising StorageError at the first whose name can't be stored."""
+    for record in records:
+        try:
+            validate_name(record['name'])
+        except ValueError as e:
+            raise StorageError(f"Cannot store student {record['code']}: {e}.") from e
+        yield record
+
+
+class MarksStore(ABC):
+    """
+    Interface shared by every storage backend. Queries return record
+    dictionaries (or None); records() and ranked() return lazy sequences
+    suitable for the virtual Treeview.
+    """
+
+    loads_in_background = False  # True if load() is replaced by the app's progressive loader
+
+    def load(self):
+        """Makes the roster ready for queries."""
+
+    def close(self):
+        """Releases files or connections (waiting for any background write)."""
+
+    def flush(self):
+        """Blocks until every applied edit is on disk; raises StorageError if it can't be written."""
+
+    def save_status(self):
+        """(status, error) of the edits applied so far: see the states in student_saver.py."""
+        return SAVED, None
+
+    @abstractmethod
+    def __len__(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, code):
+        """The first student (in file order) with this code."""
+        raise NotImplementedError
+
+    def get_many(self, codes):
+        """Returns {code: record} for those of the codes that exist (as get would find them)."""
+        found = {}
+        for code in codes:
+            record = self.get(code)
+            if record is not None:
+                found[code] = record
+        return found
+
+    @abstractmethod
+    def find_name(self, name, partial=False):
+        """The first student whose name matches, case-insensitively (any substring with partial=True)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def codes_with_name(self, name):
+        """Codes of every student whose name is exactly 'name' (case-sensitive)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_names_fuzzy(self, name, max_distance=MAX_DISTANCE, limit=None):
+        """
+        Returns [(edit distance, record)] for students whose name, or a word of
+        it, is within max_distance edits of 'name' (case-insensitive), closest
+        first and then in file order; at most 'limit' of them.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def extreme(self, highest=True):
+        """The first student (in file order) with the highest (or lowest) total mark."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def summary(self):
+        """Returns (student count, sum of total marks, median total mark or None)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def records(self):
+        """Every student in file order."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def ranked(self, descending=True):
+        """Every student ordered by total mark, ties broken by code."""
+        raise NotImplementedError
+
+    def select(self, query):
+        """The students matching a compiled Query (see student_query.py), in file order."""
+        return [record for record in self.records() if query.matches(record)]
+
+    @abstractmethod
+    def export_batches(self):
+        """
+        Every student in file order as column batches (see StudentTable.column_batches),
+        safe to consume on another thread while the roster keeps changing.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def locate(self, codes):
+        """
+        Where the students apply(deletes=codes) would delete are, one by one
+        (a repeated code finds the next student with it): a list holding a
+        (position, record) pair per code, or None if no student is left to
+        delete. Positions mean something only to apply(inserts=...).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def apply(self, puts=(), deletes=(), inserts=()):
+        """
+        Applies one edit as a unit and persists it: 'puts' are records added or
+        replacing the first student with the same code, 'deletes' are student
+        codes, each deleting the first student with it, and 'inserts' are
+        (position, record) pairs from locate, putting deleted students back
+        where they were. Inserts come last, in the order given: ascending
+        positions restore several students.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def replace_all(self, records):
+        """Replaces the whole roster with the given records and persists it."""
+        raise NotImplementedError
+
+    def poll_changes(self):
+        """
+        Cheaply checks whether another program changed the roster on disk, and
+        brings in what it can without a reload. Returns None when nothing
+        changed, otherwise an ExternalChange.
+        """
+        return None
+
+    def search_index_builder(self):
+        """
+        A function building the indexes that partial and fuzzy name searches
+        need, safe to run on a worker thread, or None if there is nothing (left)
+        to build. Without one, the first such search builds them.
+        """
+        return None
+
+    def install_search_indexes(self, built):
+        """
+        Adopts what a search_index_builder function returned, on the thread
+        that uses the store. Returns False if the roster changed too much
+        meanwhile for it to be used (build again).
+        """
+        return True
+
+
+# --- Text File Backend ---
+
+class TextMarksStore(MarksStore):
+    """The marks file and its change journal, queried through an in-memory StudentTable."""
+
+    loads_in_background = True
+
+    def __init__(self, path, use_journal=True):
+        self.path = path
+        self.use_journal = use_journal
+        self.table = StudentTable()
+        self.journal = ChangeJournal(path)
+        self.saver = WriteBehindSaver(self._write_changes, name="marks-saver")
+        self.binary = False
+        self._mapped = None  # BinaryMarksFile answering get() until the table has loaded in full
+        self._watch = None  # (stat, parsed offset, fingerprint) of the file as last seen
+        self._own_writes = deque(maxlen=OWN_WRITES_REMEMBERED)  # _stat_key of files the saver wrote
+
+    def begin_load(self):
+        """
+        Empties the table ahead of a (full or progressive) load and notes the
+        file's current state, so poll_changes can later parse only what was
+        appended after it. The load itself must stop at load_end().
+        """
+        # Journal entries still waiting to be written would be missing from the replay
+        self.flush()
+        self.table.clear()
+        self.binary = is_binary_marks_file(self.path)
+        self._close_mapped()
+        if self.binary:
+            # A binary file can be searched by code as it is, so lookups work from the start of a load
+            try:
+                self._mapped = BinaryMarksFile(self.path)
+            except ValueError:
+                pass  # A damaged file is reported by the load itself
+        self._watch_file(to_end=True)
+
+    def load_end(self):
+        """Byte at which a load begun by begin_load stops reading a text file; poll_changes parses the rest."""
+        return None if self._watch is None else self._watch[1]
+
+    def _close_mapped(self):
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+
+    def load(self):
+        self.begin_load()
+        try:
+            self.binary = load_marks_file(self.path, self.table, self.load_end())
+        except BaseException:
+            self.abandon_load()
+            raise
+        # Edits made since the last full save live in the change journal
+        self.replay_journal()
+
+    def replay_journal(self):
+        replay_journal(self.table, self.journal)
+        self._close_mapped()  # The table now holds every student, journal edits included
+
+    def abandon_load(self):
+        """
+        Ends a load that failed or was cancelled part-way. Lookups then answer
+        from the students loaded so far, never from the file itself, which
+        would miss the journal's edits.
+        """
+        self._close_mapped()
+
+    def close(self):
+        try:
+            self._close_mapped()
+            self.saver.close()
+        finally:
+            self.journal.wait()
+            self.journal.close()
+
+    def flush(self):
+        self.saver.flush()
+
+    def save_status(self):
+        return self.saver.status, self.saver.error
+
+    def _record(self, row):
+        return None if row is None else self.table.record(row)
+
+    def __len__(self):
+        return len(self.table)
+
+    def get(self, code):
+        row = self.table.find_code(code)
+        if row is None and self._mapped is not None:
+            # Not loaded yet: binary-search the file itself
+            raw = self._mapped.find_code(code)
+            return None if raw is None else process_record([str(field) for field in raw])
+        return self._record(row)
+
+    def find_name(self, name, partial=False):
+        return self._record(self.table.find_name(name, partial))
+
+    def codes_with_name(self, name):
+        return [self.table.code[row] for row in self.table.rows_with_name(name)]
+
+    def find_names_fuzzy(self, name, max_distance=MAX_DISTANCE, limit=None):
+        return [(distance, self.table.record(row))
+                for distance, row in self.table.find_names_fuzzy(name, max_distance, limit)]
+
+    def extreme(self, highest=True):
+        return self._record(self.table.extreme_row(highest))
+
+    def summary(self):
+        # The table keeps a count per total mark, so the median costs O(161), not a sort
+        median = Histogram.from_counts(self.table.aggregates.histogram).quantile(0.5)
+        return len(self.table), self.table.total_sum(), median
+
+    def records(self):
+        return self.table.view()
+
+    def ranked(self, descending=True):
+        # Walks the incrementally maintained ranking; only rows looked at are fetched
+        return self.table.view(self.table.ranked_rows(descending))
+
+    def select(self, query):
+        # Starts from the code, name or total index when one narrows the query down
+        return self.table.view(query.select_rows(self.table))
+
+    def export_batches(self):
+        # A snapshot costs one memcpy per column; the batches are then cut from the copy
+        return self.table.snapshot().column_batches()
+
+    def search_index_builder(self):
+        return self.table.search_index_builder()
+
+    def install_search_indexes(self, built):
+        return self.table.install_search_indexes(built)
+
+    def _put_records(self, records):
+        """Adds each record, or replaces the student with the same code. Returns how many changed anything."""
+        changed = 0
+        for record in records:
+            row = self.table.find_code(record['code'])
+            if row is None:
+                self.table.append(record)
+            elif self.table.record(row) != record:
+                self.table.update(row, record)
+            else:
+                continue
+            changed += 1
+        return changed
+
+    def locate(self, codes):
+        # The position is the student's place among the live rows, which a replayed journal reproduces
+        table, taken, found = self.table, {}, []
+        for code in codes:
+            rows = table.rows_with_code(code)
+            nth = taken[code] = taken.get(code, -1) + 1
+            found.append((table.position(rows[nth]), table.record(rows[nth])) if nth < len(rows) else None)
+        return found
+
+    def apply(self, puts=(), deletes=(), inserts=()):
+        puts = list(checked_names(puts))
+        inserts = list(inserts)
+        deque(checked_names(record for _, record in inserts), maxlen=0)  # Refused before anything changes
+        self._put_records(puts)
+        for code in deletes:  # One at a time, so a repeated code deletes the next student with it
+            row = self.table.find_code(code)
+            if row is not None:
+                self.table.delete(row)
+        for position, record in inserts:
+            self.table.insert(position, record)
+
+        if not self.use_journal:
+            # Each edit queues a copy of the whole roster; a burst of edits writes only the newest
+            self.saver.submit((self.table.snapshot(), self.binary))
+            return
+        self.saver.submit(self.journal.entry([format_record_line(s) for s in puts], deletes,
+                                             [(position, format_record_line(s)) for position, s in inserts]))
+
+        if self.journal.needs_compaction():
+            # Entries still queued would land in the fresh journal as well as in the snapshot
+            self.flush()
+            snapshot = self.table.snapshot()
+            binary = self.binary
+            self.journal.compact_async(lambda path: write_marks_file(path, snapshot, binary=binary))
+
+    def _write_changes(self, changes):
+        """Runs on the saver thread: appends queued journal entries together, or writes the newest snapshot."""
+        if self.use_journal:
+            try:
+                self.journal.write(changes)
+            except OSError as e:
+                raise StorageError(f"Could not write to journal: {self.journal.path}.") from e
+            return
+        snapshot, binary = changes[-1]
+        try:
+            # Noted before the rename, so poll_changes never sees the new file as someone else's
+            replace_file(self.path, lambda path: write_marks_file(path, snapshot, binary=binary),
+                         before_replace=lambda stat: self._own_writes.append(_stat_key(stat)))
+        except OSError as e:
+            raise StorageError(f"Could not write to file: {self.path}.") from e
+
+    def save(self):
+        """Rewrites the whole marks file, folding in (and discarding) the journal."""
+        # Journal writes still in flight could otherwise land after the reset below
+        self.flush()
+        # A running compaction writes the same temporary file and would rename its snapshot over ours
+        self.journal.wait()
+        try:
+            replace_file(self.path, lambda path: write_marks_file(path, self.table, binary=self.binary))
+            # The rewritten file already contains every journaled edit
+            self.journal.reset()
+            self._watch_file()
+        except OSError as e:
+            raise StorageError(f"Could not write to file: {self.path}.") from e
+
+    def replace_all(self, records):
+        records = list(checked_names(records))
+        self.table.clear()
+        for record in records:
+            self.table.append(record)
+        self.save()
+
+    # --- Following Appends ---
+    #
+    # Other programs may append students to the marks file while it is open.
+    # The store remembers how far it has parsed (up to the last complete line)
+    # and the bytes just before that point: if the file has grown and those
+    # bytes are unchanged, only the appended range is parsed; anything else
+    # (a replaced, truncated or rewritten file) calls for a full reload.
+    # Appended lines become rows exactly as a load would make them (a repeated
+    # code is kept as a further row, and lookups find the first), so the live
+    # table always matches a fresh reload. For that no line may be parsed
+    # twice: a load stops where begin_load noted the file ended.
+
+    def _watch_file(self, stat=None, to_end=False):
+        """
+        Records the file as fully parsed up to its last complete line, or with
+        to_end up to its end (a load also takes an unterminated last line).
+        """
+        try:
+            stat = stat or os.stat(self.path)
+            with open(self.path, 'rb') as f:
+                if stat.st_size == 0 or to_end:
+                    offset = stat.st_size
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        offset = mm.rfind(b'\n', 0, stat.st_size) + 1
+                f.seek(max(0, offset - FINGERPRINT_BYTES))
+                fingerprint = f.read(offset - f.tell())
+        except OSError:
+            self._watch = None
+            return
+        self._watch = (stat, offset, fingerprint)
+
+    def _own_write(self, stat):
+        """
+        True if the file now in place is one this store wrote in the background
+        (a journal compaction or a write-behind rewrite). Size and mtime are
+        compared as well as the inode, which the file system may reuse.
+        """
+        key = _stat_key(stat)
+        compacted = self.journal.compacted_stat
+        return key in self._own_writes or (compacted is not None and key == _stat_key(compacted))
+
+    def poll_changes(self):
+        if self._watch is None:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None  # Missing for a moment (e.g. mid-replace): look again next time
+        seen, offset, fingerprint = self._watch
+
+        if self._own_write(stat) and (stat.st_ino, stat.st_size, stat.st_mtime_ns) != (seen.st_ino, seen.st_size, seen.st_mtime_ns):
+            # The file holds exactly the snapshot we wrote, all of it already loaded
+            self._watch_file(stat)
+            seen, offset, fingerprint = self._watch
+        if (stat.st_dev, stat.st_ino) != (seen.st_dev, seen.st_ino):
+            return ExternalChange(reload=True, merged=0)
+        if (stat.st_size, stat.st_mtime_ns) == (seen.st_size, seen.st_mtime_ns):
+            return None
+        if self.binary or stat.st_size <= seen.st_size:
+            return ExternalChange(reload=True, merged=0)
+
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset - len(fingerprint))
+                if f.read(len(fingerprint)) != fingerprint:
+                    return ExternalChange(reload=True, merged=0)
+                end = f.read(stat.st_size - offset).rfind(b'\n') + offset + 1
+        except OSError:
+            return None
+        if end <= offset:
+            return None  # Only part of a line so far; wait for the rest
+
+        merged = 0
+        for columns, errors in iter_chunk_columns(self.path, [(offset, end)], parallel=False):
+            if errors:
+                print(errors, end='')
+            merged += self._merge_columns(columns)
+        self._watch_file(stat)
+        return ExternalChange(reload=False, merged=merged)
+
+    def _merge_columns(self, columns):
+        """Appends parsed columns to the table as a load would. Returns the number of rows added."""
+        self.table.extend_columns(*columns)
+        return len(columns[0])
+
+
+# --- SQLite Backend ---
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    seq     INTEGER PRIMARY KEY,    -- file order: rows keep it when updated
+    code    INTEGER NOT NULL,
+    name    TEXT NOT NULL,
+    name_lower TEXT,                -- name.lower() as Python folds it (COLLATE NOCASE only folds ASCII)
+    cw1     INTEGER NOT NULL,
+    cw2     INTEGER NOT NULL,
+    cw3     INTEGER NOT NULL,
+    exam    INTEGER NOT NULL,
+    total   INTEGER NOT NULL,
+    pct100  INTEGER NOT NULL,       -- percentage in hundredths, exactly as process_record rounds it
+    grade   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS students_code ON students (code);
+CREATE INDEX IF NOT EXISTS students_rank ON students (total, code);
+CREATE INDEX IF NOT EXISTS students_rank_desc ON students (total DESC, code);
+"""
+
+# Databases made before name_lower existed gain it (filled in) when opened
+NAME_LOWER_SCHEMA = """
+DROP INDEX IF EXISTS students_name;
+CREATE INDEX IF NOT EXISTS students_name_lower ON students (name_lower);
+"""
+
+COLUMNS = "code, name, cw1, cw2, cw3, exam, total, pct100, grade"
+ORDER_BY_FILE = "seq"
+ORDER_BY_RANK = {True: "total DESC, code, seq", False: "total, code, seq"}
+STORED_COLUMNS = COLUMNS + ", name_lower"  # What a write sets: the columns plus the folded name
+STORED_VALUES = ", ".join("?" * 10)
+FIRST_WITH_CODE = "(SELECT seq FROM students WHERE code = ? ORDER BY seq LIMIT 1)"
+
+
+def _index_spelling(fuzzy, spellings, name):
+    """
+    Adds a stored name to the fuzzy index under each of its keys (see
+    SqliteMarksStore._fuzzy_index); with fuzzy None, only to 'spellings'.
+    """
+    for key in name_keys(name.lower()):
+        found = spellings.get(key)
+        if found is None:
+            found = spellings[key] = set()
+            if fuzzy is not None:
+                fuzzy.add(key)
+        found.add(name)
+
+def _spelling_index(names):
+    """A FuzzyNameIndex over the keys of the given stored names, and key -> the names it was taken from."""
+    spellings = {}
+    for name in names:
+        _index_spelling(None, spellings, name)
+    # Indexed in one go rather than key by key, which would leave it in many runs
+    return FuzzyNameIndex(spellings), spellings
+
+def _row_to_record(row):
+    code, name, cw1, cw2, cw3, exam, total, pct100, grade = row
+    return {
+        'code': code,
+        'name': name,
+        'cw1': cw1,
+        'cw2': cw2,
+        'cw3': cw3,
+        'exam': exam,
+        'total_coursework': cw1 + cw2 + cw3,
+        'total_mark': total,
+        'percentage': pct100 / 100,
+        'grade': grade,
+    }
+
+def _record_to_row(record):
+    return (record['code'], record['name'], record['cw1'], record['cw2'], record['cw3'], record['exam'],
+            record['total_mark'], round(record['percentage'] * 100), record['grade'], record['name'].lower())
+
+
+class SqliteMarksStore(MarksStore):
+    """Roster kept in a SQLite database; queries are pushed down to indexed SQL."""
+
+    def __init__(self, path):
+        self.path = path
+        self.version = 0  # Bumped on every write, so open views know to refetch
+        self._fuzzy = None           # FuzzyNameIndex over lowercase names and their words (built on first use)
+        self._spellings = {}         # fuzzy index key -> the stored names it was taken from
+        try:
+            self.conn = sqlite3.connect(path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; WAL keeps it consistent
+            self.conn.executescript(SCHEMA)
+            self._add_name_lower()
+            self._data_version = self._read_data_version()
+        except sqlite3.Error as e:
+            raise StorageError(f"Could not open database: {path} ({e}).") from e
+
+    def _add_name_lower(self):
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(students)")]
+        if 'name_lower' not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE students ADD COLUMN name_lower TEXT")
+        if self.conn.execute("SELECT 1 FROM students WHERE name_lower IS NULL LIMIT 1").fetchone():
+            self.conn.create_function('py_lower', 1, str.lower, deterministic=True)
+            with self.conn:
+                self.conn.execute("UPDATE students SET name_lower = py_lower(name) WHERE name_lower IS NULL")
+        self.conn.executescript(NAME_LOWER_SCHEMA)
+
+    def _read_data_version(self):
+        # Changes whenever another connection commits; our own commits leave it alone
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def poll_changes(self):
+        try:
+            data_version = self._read_data_version()
+        except sqlite3.Error as e:
+            raise StorageError(f"Could not read database: {self.path} ({e}).") from e
+        if data_version == self._data_version:
+            return None
+        self._data_version = data_version
+        self.version += 1  # Open views refetch from the database
+        self._fuzzy = None
+        return ExternalChange(reload=False, merged=None)
+
+    def close(self):
+        self.conn.close()
+
+    def _one(self, sql, params=()):
+        row = self.conn.execute(f"SELECT {COLUMNS} FROM students {sql} LIMIT 1", params).fetchone()
+        return None if row is None else _row_to_record(row)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM students").fetchone()[0]
+
+    def get(self, code):
+        return self._one("WHERE code = ? ORDER BY seq", (code,))
+
+    def get_many(self, codes):
+        codes = list(codes)
+        found = {}
+        for start in range(0, len(codes), LOOKUP_BATCH_KEYS):
+            batch = codes[start:start + LOOKUP_BATCH_KEYS]
+            # Descending file order, so the first row with each code is the one kept
+            rows = self.conn.execute(
+                f"SELECT {COLUMNS} FROM students WHERE code IN ({', '.join('?' * len(batch))}) ORDER BY seq DESC", batch)
+            found.update((row[0], _row_to_record(row)) for row in rows)
+        return found
+
+    def find_name(self, name, partial=False):
+        if partial:
+            # A substring can't use the name index; the scan still runs inside SQLite
+            return self._one("WHERE instr(name_lower, ?) > 0 ORDER BY seq", (name.lower(),))
+        return self._one("WHERE name_lower = ? ORDER BY seq", (name.lower(),))
+
+    def codes_with_name(self, name):
+        rows = self.conn.execute(
+            "SELECT code FROM students WHERE name_lower = ? AND name = ? ORDER BY seq", (name.lower(), name))
+        return [code for (code,) in rows]
+
+    def _fuzzy_index(self):
+        """
+        SQL has no edit-distance index, so one is kept in memory over the distinct
+        names, built on first use; names later deleted are left in it and simply
+        find no rows.
+        """
+        if self._fuzzy is None:
+            names = self.conn.execute("SELECT DISTINCT name FROM students")
+            self._fuzzy, self._spellings = _spelling_index(name for (name,) in names)
+        return self._fuzzy
+
+    def search_index_builder(self):
+        if self._fuzzy is not None:
+            return None
+        path, version = self.path, self.version
+
+        def build():
+            # A connection of its own: this one belongs to the thread that opened the store
+            conn = sqlite3.connect(path)
+            try:
+                fuzzy, spellings = _spelling_index(name for (name,) in conn.execute("SELECT DISTINCT name FROM students"))
+            finally:
+                conn.close()
+            return version, fuzzy, spellings
+        return build
+
+    def install_search_indexes(self, built):
+        version, fuzzy, spellings = built
+        if version != self.version:
+            return False  # Written to since the build read the names
+        if self._fuzzy is None:
+            self._fuzzy, self._spellings = fuzzy, spellings
+        return True
+
+    def find_names_fuzzy(self, name, max_distance=MAX_DISTANCE, limit=None):
+        distances = {}
+        for distance, key in self._fuzzy_index().search(name.strip().lower(), max_distance):
+            for spelling in self._spellings[key]:
+                distances.setdefault(spelling, distance)  # Closest key first
+        names = list(distances)
+        matches = []
+        for start in range(0, len(names), LOOKUP_BATCH_KEYS):
+            batch = names[start:start + LOOKUP_BATCH_KEYS]
+            rows = self.conn.execute(
+                f"SELECT seq, {COLUMNS} FROM students WHERE name IN ({', '.join('?' * len(batch))})", batch)
+            matches.extend((distances[row[2]], row[0], _row_to_record(row[1:])) for row in rows)
+        matches.sort(key=lambda match: match[:2])
+        return [(distance, record) for distance, _, record in matches[:limit]]
+
+    def extreme(self, highest=True):
+        return self._one(f"ORDER BY total {'DESC' if highest else 'ASC'}, seq")
+
+    def summary(self):
+        counts = [0] * (MAX_TOTAL_MARK + 1)
+        for total, count in self.conn.execute("SELECT total, COUNT(*) FROM students GROUP BY total"):
+            counts[total] = count
+        histogram = Histogram.from_counts(counts)
+        return histogram.count, sum(total * c for total, c in enumerate(counts)), histogram.quantile(0.5)
+
+    def records(self):
+        return SqlRecordView(self, ORDER_BY_FILE)
+
+    def ranked(self, descending=True):
+        return SqlRecordView(self, ORDER_BY_RANK[descending])
+
+    def select(self, query):
+        where, params = query.sql_where()
+        return SqlRecordView(self, ORDER_BY_FILE, where, params)
+
+    def export_batches(self):
+        return _database_batches(self.path)
+
+    def locate(self, codes):
+        # The position is the row's seq, which an insert can take again
+        taken, found = {}, []
+        for code in codes:
+            nth = taken[code] = taken.get(code, -1) + 1
+            row = self.conn.execute(f"SELECT seq, {COLUMNS} FROM students WHERE code = ? ORDER BY seq LIMIT 1 OFFSET ?",
+                                    (code, nth)).fetchone()
+            found.append(None if row is None else (row[0], _row_to_record(row[1:])))
+        return found
+
+    def _insert_at(self, seq, record):
+        """Inserts a record as row 'seq', first moving that row and every later one up one if it is taken."""
+        if self.conn.execute("SELECT 1 FROM students WHERE seq = ?", (seq,)).fetchone():
+            # Through negative values, as the primary key is checked row by row
+            self.conn.execute("UPDATE students SET seq = -(seq + 1) WHERE seq >= ?", (seq,))
+            self.conn.execute("UPDATE students SET seq = -seq WHERE seq < 0")
+        self.conn.execute(f"INSERT INTO students (seq, {STORED_COLUMNS}) VALUES (?, {STORED_VALUES})",
+                          (seq,) + _record_to_row(record))
+
+    @METRICS.timed('save')
+    def apply(self, puts=(), deletes=(), inserts=()):
+        puts = list(checked_names(puts))
+        inserts = list(inserts)
+        deque(checked_names(record for _, record in inserts), maxlen=0)  # Refused before anything changes
+        try:
+            with self.conn:  # One transaction per edit
+                for record in puts:
+                    row = _record_to_row(record)
+                    updated = self.conn.execute(
+                        f"UPDATE students SET ({STORED_COLUMNS}) = ({STORED_VALUES}) WHERE seq = {FIRST_WITH_CODE}",
+                        row + (record['code'],))
+                    if not updated.rowcount:
+                        self.conn.execute(f"INSERT INTO students ({STORED_COLUMNS}) VALUES ({STORED_VALUES})", row)
+                self.conn.executemany(f"DELETE FROM students WHERE seq = {FIRST_WITH_CODE}",
+                                      [(code,) for code in deletes])
+                for seq, record in inserts:
+                    self._insert_at(seq, record)
+            if self._fuzzy is not None:
+                for record in puts + [record for _, record in inserts]:
+                    _index_spelling(self._fuzzy, self._spellings, record['name'])
+        except sqlite3.Error as e:
+            raise StorageError(f"Could not write to database: {self.path} ({e}).") from e
+        finally:
+            self.version += 1
+
+    @METRICS.timed('save')
+    def replace_all(self, records):
+        records = checked_names(records)  # A bad name rolls the whole import back
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM students")
+                while True:
+                    batch = [_record_to_row(record) for record in islice(records, IMPORT_BATCH_ROWS)]
+                    if not batch:
+                        break
+                    self.conn.executemany(f"INSERT INTO students ({STORED_COLUMNS}) VALUES ({STORED_VALUES})", batch)
+        except sqlite3.Error as e:
+            raise StorageError(f"Could not write to database: {self.path} ({e}).") from e
+        finally:
+            self.version += 1
+            self._fuzzy = None
+
+
+def _database_batches(path, batch_rows=BATCH_ROWS):
+    """Reads a database as column batches over a connection of its own (so from any thread)."""
+    conn = sqlite3.connect(path)
+    try:
+        cursor = conn.execute(f"SELECT {COLUMNS} FROM students ORDER BY seq")
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            code, names, cw1, cw2, cw3, exam, total, pct100, grade = zip(*rows)
+            yield (array('i', code), list(names), array('B', cw1), array('B', cw2), array('B', cw3), array('B', exam),
+                   array('B', total), array('H', pct100), array('B', map(GRADE_INDEX.__getitem__, grade)))
+    finally:
+        conn.close()
+
+
+class SqlRecordView(Sequence):
+    """Lazy sequence of records (optionally filtered) in a fixed SQL order, fetched a page at a time."""
+
+    def __init__(self, store, order_by, where=None, params=(), page_rows=SQL_PAGE_ROWS):
+        self.store = store
+        self.order_by = order_by
+        self.where = f"WHERE {where}" if where else ""
+        self.params = tuple(params)
+        self.page_rows = page_rows
+        self._version = None
+        self._length = 0
+        self._page_start = None
+        self._page = []
+
+    def _sync(self):
+        if self._version != self.store.version:
+            self._version = self.store.version
+            self._length = self.store.conn.execute(f"SELECT COUNT(*) FROM students {self.where}", self.params).fetchone()[0]
+            self._page_start = None
+
+    def __len__(self):
+        self._sync()
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("record view index out of range")
+        start = index - index % self.page_rows
+        if start != self._page_start:
+            rows = self.store.conn.execute(
+                f"SELECT {COLUMNS} FROM students {self.where} ORDER BY {self.order_by} LIMIT ? OFFSET ?",
+                self.params + (self.page_rows, start))
+            self._page = [_row_to_record(row) for row in rows]
+            self._page_start = start
+        return self._page[index - start]
+
+
+# --- Opening and Importing ---
+
+def is_sqlite_file(path):
+    """True if the file starts with the SQLite database header."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except OSError:
+        return False
+
+def is_sharded_roster(path):
+    """True if path names a shard manifest rather than a marks file."""
+    return path.endswith(MANIFEST_SUFFIX)
+
+def open_store(path, use_journal=True):
+    """
+    Opens the right backend for path: a SQLite database (by content or .db
+    suffix), a sharded roster's manifest, or a marks file.
+    """
+    if path.endswith(DATABASE_SUFFIX) or is_sqlite_file(path):
+        return SqliteMarksStore(path)
+    if is_sharded_roster(path):
+        from student_shards import ShardedMarksStore  # student_shards builds on this module
+        return ShardedMarksStore(path, use_journal)
+    return TextMarksStore(path, use_journal)
+
+def roster_records(path):
+    """
+    Streams every student of a roster on disk in file order, as the app would
+    show it. A marks file without pending journal edits is parsed as it
+    streams; anything else (journal edits to replay, a database or a sharded
+    roster) is read through its store.
+    """
+    if not is_sqlite_file(path) and not is_sharded_roster(path) and not has_pending_edits(path):
+        yield from iter_records(path)
+        return
+
+    store = open_store(path)
+    try:
+        store.load()
+        yield from store.records()
+    finally:
+        store.close()
+
+def import_marks_file(source, database):
+    """
+    One-shot import of a marks file (text or binary, plus any pending journal
+    edits) into a SQLite database, replacing its contents. Returns the number
+    of students imported.
+    """
+    marks = TextMarksStore(source)
+    try:
+        marks.load()
+        store = SqliteMarksStore(database)
+        try:
+            store.replace_all(marks.records())
+            return len(store)
+        finally:
+            store.close()
+    finally:
+        marks.close()
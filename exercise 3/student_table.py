@@ -0,0 +1,1090 @@
+import os
+import sys
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+from collections.abc import Sequence
+from itertools import accumulate, compress, islice
+from student_fuzzy import FuzzyNameIndex, MAX_DISTANCE, name_keys
+
+# Grading schemes are shared with the maths quiz (exercise 1). The shared folder
+# goes last on the path, so nothing in it can shadow a module of this one.
+SHARED_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "shared"))
+if SHARED_DIR not in sys.path:
+    sys.path.append(SHARED_DIR)
+from student_grading import get_scheme
+
+# NumPy is optional: when it is installed, whole-column scans run as vectorized
+# array operations over zero-copy views of the columns below. Without it the
+# same scans fall back to the C-level iterators in 'itertools'.
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# --- Column Layout ---
+
+# Grades are stored as indices into the scheme's grades, best first (see student_grading)
+GRADING_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grading_schemes.json")
+GRADING_SCHEME = 'student-marks'
+SCHEME = get_scheme(GRADING_SCHEME, GRADING_CONFIG)
+GRADES = SCHEME.grades
+GRADE_INDEX = {grade: i for i, grade in enumerate(GRADES)}
+
+# Deleted rows are left as tombstones and squeezed out in bulk once they make
+# up a large share of the table, so a delete never shifts every later row.
+COMPACT_MIN_DEAD = 1024
+LIVE_BLOCK_ROWS = 1024  # Rows per live count kept by LiveRows
+
+# Total marks run from 0 to 160, small enough to keep one counter per value
+TOTAL_DOMAIN = 161
+
+# Rank keys pack (code, row) into one unsigned 64-bit integer so that a plain
+# sorted array orders equal totals by code; the bias makes negative codes sort first
+CODE_BIAS = 1 << 31
+ROW_MASK = (1 << 32) - 1
+
+# The code index is an open-addressing hash table kept at most this full
+CODE_INDEX_MIN_SLOTS = 8
+CODE_INDEX_MAX_LOAD = 2 / 3
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15  # Fibonacci hashing: spreads runs of consecutive codes
+
+# The name indexes are open-addressing hash tables of pool ids kept at most this full
+NAME_INDEX_MIN_SLOTS = 8
+NAME_INDEX_MAX_LOAD = 2 / 3
+
+# Length of the name fragments kept in the substring index
+NGRAM = 3
+
+# A partial find_name whose rarest trigram is held by more names than this
+# first scans rows in file order, for at most PARTIAL_SCAN_SPAN times the
+# rows per holder: a common fragment turns up long before that
+PARTIAL_SCAN_MIN_NAMES = 64
+PARTIAL_SCAN_SPAN = 4
+
+# Rows per batch handed out by StudentTable.column_batches
+BATCH_ROWS = 50_000
+
+COLUMNS = ('code', 'name_id', 'cw1', 'cw2', 'cw3', 'exam', 'total', 'pct100', 'grade')
+
+
+def name_ngrams(lowered):
+    """Returns the set of NGRAM-character fragments of an already-lowercased name."""
+    return {lowered[i:i + NGRAM] for i in range(len(lowered) - NGRAM + 1)}
+
+
+def _index_ngrams(ngram_ids, name_id, lowered):
+    """Adds a name id to the trigram index; ids arrive in increasing order, so each posting array stays sorted."""
+    for gram in name_ngrams(lowered):
+        ids = ngram_ids.get(gram)
+        if ids is None:
+            ngram_ids[gram] = array('I', (name_id,))
+        else:
+            ids.append(name_id)
+
+
+def _index_fuzzy(fuzzy, fuzzy_ids, name_id, lowered):
+    """Adds a name id to the edit-distance index under each of the name's keys (with fuzzy None, only to fuzzy_ids)."""
+    for key in name_keys(lowered):
+        ids = fuzzy_ids.get(key)
+        if ids is None:
+            ids = fuzzy_ids[key] = []
+            if fuzzy is not None:
+                fuzzy.add(key)
+        ids.append(name_id)
+
+def _build_fuzzy(names):
+    """The edit-distance index over the keys of a list of pooled names, and key -> name ids."""
+    fuzzy_ids = {}
+    for name_id, name in enumerate(names):
+        _index_fuzzy(None, fuzzy_ids, name_id, name.lower())
+    # Indexed in one go rather than key by key, which would leave it in many runs
+    return FuzzyNameIndex(fuzzy_ids), fuzzy_ids
+
+
+# Name search indexes built off the table's thread (see StudentTable.search_index_builder):
+# they cover the first 'count' names of 'pool', the name pool list they were built from
+SearchIndexes = namedtuple('SearchIndexes', 'pool count ngram_ids fuzzy fuzzy_ids')
+
+
+class StudentTable:
+    """
+    Columnar, array-backed store for student records.
+
+    Each field lives in its own typed 'array' column and names are interned
+    in a single string pool, so a roster costs a fraction of the equivalent
+    list of dictionaries. Rows are addressed by an integer row id; records go
+    in and come out as the same dictionaries that process_record builds.
+
+    Measured with memory_usage on a million generated students: the columns
+    and alive flags take about 18 bytes per student, the code index 6-12 and
+    the mark aggregates 4, some 30 bytes in all. Names cost more than the
+    rest together: a distinct name is a str object (49 bytes plus one per
+    ASCII character), an 8-byte pool slot, a 6-12 byte intern index slot and
+    a 4-byte first-row entry, about 85 bytes for a 15-character name. So a
+    loaded roster comes to roughly 115-125 bytes per student.
+
+    Lookups go through indexes that every mutation keeps in step: code -> row,
+    lowercase name -> name ids, and, once a search first needs them, a
+    trigram index over the name pool for partial, case-insensitive name
+    search and an edit-distance index for misspelled names.
+    """
+
+    def __init__(self, records=()):
+        self.clear()
+        for record in records:
+            self.append(record)
+
+    def clear(self):
+        """Removes every record and releases the name pool."""
+        self.code = array('i')
+        self.name_id = array('I')
+        self.cw1 = array('B')
+        self.cw2 = array('B')
+        self.cw3 = array('B')
+        self.exam = array('B')
+        self.total = array('B')     # 0-160 fits in a single byte
+        self.pct100 = array('H')    # Percentage in hundredths (exact for 2 d.p.)
+        self.grade = array('B')     # Index into GRADES
+        self.alive = bytearray()    # 1 = live row, 0 = tombstone
+        self.names = []             # Interned name pool
+        self._name_ids = NameIndex(self.names)  # lowercase name -> pool ids (also interns exact names)
+        self._live = 0
+        self._clear_indexes()
+
+    def __len__(self):
+        return self._live
+
+    def __bool__(self):
+        return self._live > 0
+
+    def __iter__(self):
+        return self.records()
+
+    # --- Name Pool ---
+
+    def _intern(self, name):
+        """Returns the pool id for a name, adding it to the pool if new."""
+        name_id = len(self.names)
+        lowered = name.lower()
+        found = self._name_ids.setdefault(name, lowered, name_id)
+        if found != name_id:
+            return found
+        self.names.append(name)
+        self._index_name(name_id, lowered)
+        return name_id
+
+    # --- Indexes ---
+
+    def _clear_indexes(self):
+        self.aggregates = MarkAggregates()
+        self._rank = None           # RankIndex (built on first ranking query)
+        self._code_rows = CodeIndex(self.code)  # code -> row
+        self._code_extras = {}      # code -> live rows beyond the first (files may repeat a code)
+        self._name_first = array('i')  # name id -> first live row holding it, or -1
+        self._name_more = {}        # name id -> sorted live rows, for names held by more than one
+        self._ngram_ids = None      # trigram -> sorted array of name ids (built on first use)
+        self._fuzzy = None          # FuzzyNameIndex over lowercase names and their words (built on first use)
+        self._fuzzy_ids = {}        # fuzzy index key -> name ids of the names it was taken from
+
+    def _index_name(self, name_id, lowered):
+        """Adds a newly interned name (given lowercased) to the row, trigram and fuzzy indexes."""
+        self._name_first.append(-1)
+        if self._fuzzy is not None:
+            _index_fuzzy(self._fuzzy, self._fuzzy_ids, name_id, lowered)
+        if self._ngram_ids is not None:
+            _index_ngrams(self._ngram_ids, name_id, lowered)
+
+    def _ngram_index(self):
+        """
+        Returns the trigram index, building it over the whole name pool the first
+        time a partial search needs it so that bulk loads do not pay for it.
+        """
+        if self._ngram_ids is None:
+            self._ngram_ids = {}
+            for name_id, name in enumerate(self.names):
+                _index_ngrams(self._ngram_ids, name_id, name.lower())
+        return self._ngram_ids
+
+    def _fuzzy_index(self):
+        """Returns the edit-distance index over the name pool, building it on first use."""
+        if self._fuzzy is None:
+            self._fuzzy, self._fuzzy_ids = _build_fuzzy(self.names)
+        return self._fuzzy
+
+    def search_index_builder(self):
+        """
+        Returns a function that builds the trigram and edit-distance indexes
+        over the name pool as it is now, or None if both are built already.
+        The function only reads names already pooled, so it may run on a
+        worker thread while the table keeps changing; hand what it returns to
+        install_search_indexes on the table's own thread. Searching before
+        then builds the indexes in place.
+        """
+        if self._ngram_ids is not None and self._fuzzy is not None:
+            return None
+        pool, count = self.names, len(self.names)
+
+        def build():
+            ngram_ids, names = {}, pool[:count]
+            for name_id, name in enumerate(names):
+                _index_ngrams(ngram_ids, name_id, name.lower())
+            return SearchIndexes(pool, count, ngram_ids, *_build_fuzzy(names))
+        return build
+
+    def install_search_indexes(self, built):
+        """
+        Adopts indexes from a search_index_builder function, first adding the
+        names pooled since it started. Returns False, adopting nothing, if the
+        pool has been rebuilt (cleared or compacted) in the meantime.
+        """
+        if built.pool is not self.names:
+            return False
+        added = [(name_id, self.names[name_id].lower()) for name_id in range(built.count, len(self.names))]
+        if self._ngram_ids is None:
+            for name_id, lowered in added:
+                _index_ngrams(built.ngram_ids, name_id, lowered)
+            self._ngram_ids = built.ngram_ids
+        if self._fuzzy is None:
+            for name_id, lowered in added:
+                _index_fuzzy(built.fuzzy, built.fuzzy_ids, name_id, lowered)
+            self._fuzzy, self._fuzzy_ids = built.fuzzy, built.fuzzy_ids
+        return True
+
+    def _index_row(self, row):
+        code = self.code[row]
+        # With repeated codes the index points at the first one in file order
+        indexed = self._code_rows.add(code, row)
+        if indexed is not None and indexed != row:
+            self._code_extras[code] = self._code_extras.get(code, 0) + 1
+        self._index_name_row(self.name_id[row], row)
+        self.aggregates.add(row, self.total[row])
+        if self._rank is not None:
+            self._rank.add(row, code, self.total[row])
+
+    def _unindex_row(self, row):
+        code = self.code[row]
+        extras = self._code_extras.pop(code, 0)
+        if extras > 1:
+            self._code_extras[code] = extras - 1
+        if self._code_rows.get(code) == row:
+            del self._code_rows[code]
+            # Only a repeated code needs the column scanned for the next live row holding it
+            if extras:
+                self._code_rows[code] = self._scan_code(code, skip=row)
+        self._unindex_name_row(self.name_id[row], row)
+        self.aggregates.remove(row, self.total[row])
+        if self._rank is not None:
+            self._rank.remove(row, code, self.total[row])
+
+    def _index_appended(self, start):
+        """
+        Indexes the rows from 'start' on, which were just appended: having the
+        highest row ids yet, they go at the end of every row-sorted index.
+        """
+        stop = len(self.alive)
+        add_code, extras = self._code_rows.add, self._code_extras
+        name_first, name_more = self._name_first, self._name_more
+        for row, code, name_id in zip(range(start, stop), self.code[start:], self.name_id[start:]):
+            if add_code(code, row) is not None:
+                extras[code] = extras.get(code, 0) + 1
+            first = name_first[name_id]
+            if first < 0:
+                name_first[name_id] = row
+            else:
+                rows = name_more.get(name_id)
+                if rows is None:
+                    rows = name_more[name_id] = array('i', (first,))
+                rows.append(row)
+        totals = self.total[start:]
+        self.aggregates.extend(start, totals)
+        if self._rank is not None:
+            for row, code, total in zip(range(start, stop), self.code[start:], totals):
+                self._rank.add(row, code, total)
+
+    def _index_name_row(self, name_id, row):
+        # Most names belong to one student, so only shared names get an array of rows
+        first = self._name_first[name_id]
+        if first < 0:
+            self._name_first[name_id] = row
+            return
+        rows = self._name_more.get(name_id)
+        if rows is None:
+            rows = self._name_more[name_id] = array('i', (first,))
+        insort(rows, row)
+        self._name_first[name_id] = rows[0]
+
+    def _unindex_name_row(self, name_id, row):
+        rows = self._name_more.get(name_id)
+        if rows is None:
+            self._name_first[name_id] = -1
+            return
+        del rows[bisect_left(rows, row)]
+        self._name_first[name_id] = rows[0]
+        if len(rows) == 1:
+            del self._name_more[name_id]
+
+
+    # --- Row Access ---
+
+    def append(self, record):
+        """Adds a processed record as a new row and returns its row id."""
+        self.code.append(record['code'])
+        self.name_id.append(self._intern(record['name']))
+        self.cw1.append(record['cw1'])
+        self.cw2.append(record['cw2'])
+        self.cw3.append(record['cw3'])
+        self.exam.append(record['exam'])
+        self.total.append(record['total_mark'])
+        self.pct100.append(round(record['percentage'] * 100))
+        self.grade.append(GRADE_INDEX[record['grade']])
+        self.alive.append(1)
+        self._live += 1
+        row = len(self.alive) - 1
+        self._index_row(row)
+        return row
+
+    def extend_columns(self, code, names, cw1, cw2, cw3, exam, total, pct100, grade):
+        """
+        Appends a batch of rows given as parallel columns (typed arrays with the
+        same typecodes as this table, plus a list of names), e.g. as produced by
+        a parallel loader worker.
+        """
+        start = len(self.alive)
+        self.code.extend(code)
+        # Sized for every distinct name being new, so the name index does not regrow part-way
+        self._name_ids.reserve(len(self._name_ids) + len(set(names)))
+        self.name_id.extend(map(self._intern, names))
+        self.cw1.extend(cw1)
+        self.cw2.extend(cw2)
+        self.cw3.extend(cw3)
+        self.exam.extend(exam)
+        self.total.extend(total)
+        self.pct100.extend(pct100)
+        self.grade.extend(grade)
+        self.alive.extend(b'\x01' * len(code))
+        self._live += len(code)
+        self._index_appended(start)
+
+    def _column_values(self, record):
+        """A processed record's value for each of COLUMNS (interning its name)."""
+        return (record['code'], self._intern(record['name']), record['cw1'], record['cw2'], record['cw3'],
+                record['exam'], record['total_mark'], round(record['percentage'] * 100), GRADE_INDEX[record['grade']])
+
+    def update(self, row, record):
+        """Overwrites the row in place with a processed record."""
+        self._unindex_row(row)
+        for column, value in zip(COLUMNS, self._column_values(record)):
+            getattr(self, column)[row] = value
+        self._index_row(row)
+
+    def insert(self, position, record):
+        """
+        Adds a processed record as the position-th live row in file order (at
+        the end if position is past it), e.g. to put a deleted student back
+        where they were, and returns its row id. A tombstone just before the
+        row now at that position is reused; without one every later row moves
+        up one and the table is compacted to rebuild its indexes.
+        """
+        if position >= self._live:
+            return self.append(record)
+        after = self.row_sequence()[position]
+        values = self._column_values(record)
+        self._live += 1
+        if after and not self.alive[after - 1]:
+            row = after - 1
+            for column, value in zip(COLUMNS, values):
+                getattr(self, column)[row] = value
+            self.alive[row] = 1
+            self._index_row(row)
+            return row
+        for column, value in zip(COLUMNS, values):
+            getattr(self, column).insert(after, value)
+        self.alive.insert(after, 1)
+        self.compact()  # Squeezes out every tombstone, so row ids are now positions
+        return position
+
+    def delete(self, row):
+        """Deletes a single row (see delete_many)."""
+        self.delete_many([row])
+
+    def delete_many(self, rows):
+        """
+        Marks rows as deleted. Row ids of the remaining rows stay valid until the
+        table decides to compact, which happens at most once per call.
+        """
+        for row in rows:
+            if self.alive[row]:
+                self.alive[row] = 0
+                self._live -= 1
+                self._unindex_row(row)
+        if self.dead_count() >= max(COMPACT_MIN_DEAD, self._live):
+            self.compact()
+
+    def record(self, row):
+        """Materializes one row as a student dictionary."""
+        cw1, cw2, cw3 = self.cw1[row], self.cw2[row], self.cw3[row]
+        return {
+            'code': self.code[row],
+            'name': self.names[self.name_id[row]],
+            'cw1': cw1,
+            'cw2': cw2,
+            'cw3': cw3,
+            'exam': self.exam[row],
+            'total_coursework': cw1 + cw2 + cw3,
+            'total_mark': self.total[row],
+            'percentage': self.pct100[row] / 100,
+            'grade': GRADES[self.grade[row]]
+        }
+
+    def name(self, row):
+        """Returns the name stored in a row without building the full record."""
+        return self.names[self.name_id[row]]
+
+    def rows(self):
+        """Iterates over the ids of live rows in insertion (file) order."""
+        return compress(range(len(self.alive)), self.alive)
+
+    def records(self):
+        """Iterates over live rows as student dictionaries, in file order."""
+        return map(self.record, self.rows())
+
+    def row_sequence(self):
+        """
+        Live row ids as a random-access sequence: a plain range when there are
+        no tombstones, otherwise a LiveRows over the current alive flags.
+        """
+        if not self.dead_count():
+            return range(len(self.alive))
+        return LiveRows(self.alive)
+
+    def column_batches(self, batch_rows=BATCH_ROWS):
+        """
+        Yields the live rows in file order as column batches (the tuples
+        extend_columns takes), batch_rows at a time. Each column is sliced in C;
+        only the names are gathered one by one.
+        """
+        names = self.names
+        for start in range(0, len(self.alive), batch_rows):
+            alive = self.alive[start:start + batch_rows]
+            columns = [getattr(self, column)[start:start + batch_rows] for column in COLUMNS]
+            if alive.count(0):
+                columns = [array(column.typecode, compress(column, alive)) for column in columns]
+            columns[1] = list(map(names.__getitem__, columns[1]))
+            yield tuple(columns)
+
+    def view(self, rows=None):
+        """Returns a lazy sequence of records for the given row ids (default: all, in file order)."""
+        return RecordView(self, self.row_sequence() if rows is None else rows)
+
+    def position(self, row):
+        """How many live rows come before a row in file order."""
+        return self.alive.count(1, 0, row)
+
+    def memory_usage(self):
+        """
+        Bytes held by the table, by part: 'columns' (the typed columns and
+        alive flags), 'indexes' (the code index and mark aggregates) and
+        'names' (the pooled strings and their pool, intern and first-row
+        slots). The rank and name search indexes are left out.
+        """
+        names = self.names
+        return {
+            'columns': sum(sys.getsizeof(getattr(self, column)) for column in COLUMNS) + sys.getsizeof(self.alive),
+            'indexes': sys.getsizeof(self._code_rows.rows) + sum(map(sys.getsizeof, self.aggregates.buckets)),
+            'names': (sys.getsizeof(names) + sum(map(sys.getsizeof, names)) + sys.getsizeof(self._name_ids.ids)
+                      + sys.getsizeof(self._name_first) + sum(map(sys.getsizeof, self._name_more.values()))),
+        }
+
+    def dead_count(self):
+        """Number of tombstoned rows still occupying space in the columns."""
+        return len(self.alive) - self._live
+
+    # --- Lookup ---
+
+    def find_code(self, code):
+        """Returns the row id of the student with this code, or None."""
+        return self._code_rows.get(code)
+
+    def _scan_code(self, code, skip=None):
+        """Finds the first live row with this code by scanning the code column."""
+        start = 0
+        while True:
+            try:
+                row = self.code.index(code, start)
+            except ValueError:
+                return None
+            if self.alive[row] and row != skip:
+                return row
+            start = row + 1
+
+    def _matching_name_ids(self, query, partial):
+        """Name ids whose (lowercased) name equals or contains the query."""
+        if not partial:
+            return self._name_ids.find(query)
+        if len(query) < NGRAM:
+            # Too short for the trigram index: scan the (deduplicated) name pool
+            return [i for i, name in enumerate(self.names) if query in name.lower()]
+
+        # Every match holds the query's rarest trigram: checking just those names
+        # never touches the longer postings of its common trigrams
+        names = self.names
+        return [i for i in self._rarest_posting(query) if query in names[i].lower()]
+
+    def _rarest_posting(self, query):
+        """The name ids holding the query's least common trigram (the query has at least NGRAM characters)."""
+        index = self._ngram_index()
+        return min((index.get(gram, ()) for gram in name_ngrams(query)), key=len)
+
+    def _scan_name(self, query, stop):
+        """First live row before 'stop' whose lowercased name contains the query, or None."""
+        names, name_id = self.names, self.name_id
+        for row in compress(range(min(stop, len(self.alive))), self.alive):
+            if query in names[name_id[row]].lower():
+                return row
+        return None
+
+    def find_name(self, name, partial=False):
+        """
+        Returns the first row (in file order) whose name matches, or None.
+        Matching is case-insensitive; with partial=True any substring matches.
+        A partial search costs about len(self)/k row checks for a fragment that
+        k names hold, and at most the names holding its rarest trigram.
+        """
+        query = name.lower()
+        if partial:
+            if len(query) < NGRAM:
+                return self._scan_name(query, len(self.alive))
+            candidates = self._rarest_posting(query)
+            if len(candidates) > PARTIAL_SCAN_MIN_NAMES:
+                row = self._scan_name(query, PARTIAL_SCAN_SPAN * len(self.alive) // len(candidates))
+                if row is not None:
+                    return row
+            names = self.names
+            matches = (i for i in candidates if query in names[i].lower())
+        else:
+            matches = self._name_ids.find(query)
+        first = None
+        for name_id in matches:
+            row = self._name_first[name_id]
+            if row >= 0 and (first is None or row < first):
+                first = row
+        return first
+
+    def rows_with_name(self, name):
+        """Returns every live row whose name is exactly 'name' (case-sensitive)."""
+        name_id = next((i for i in self._name_ids.find(name.lower()) if self.names[i] == name), None)
+        if name_id is None:
+            return []
+        return list(self.rows_with_name_id(name_id))
+
+    def find_names_fuzzy(self, query, max_distance=MAX_DISTANCE, limit=None):
+        """
+        Returns [(distance, row)] for live rows whose name, or one word of it, is
+        within max_distance edits of the query (case-insensitive), closest first
+        and then in file order, keeping at most 'limit' of them. Catches
+        misspellings that find_name misses.
+        """
+        distances = {}
+        for distance, key in self._fuzzy_index().search(query.strip().lower(), max_distance):
+            for name_id in self._fuzzy_ids[key]:
+                distances.setdefault(name_id, distance)  # Closest key first
+        matches = [(distance, row) for name_id, distance in distances.items()
+                   for row in self.rows_with_name_id(name_id)]
+        matches.sort()
+        return matches if limit is None else matches[:limit]
+
+    def name_ids_matching(self, query, partial=False):
+        """Name pool ids whose name equals (or, with partial=True, contains) the lowercase query."""
+        return list(self._matching_name_ids(query, partial))
+
+    def rows_with_name_id(self, name_id):
+        """Sorted live rows holding one pooled name (do not modify the result)."""
+        rows = self._name_more.get(name_id)
+        if rows is not None:
+            return rows
+        first = self._name_first[name_id]
+        return (first,) if first >= 0 else ()
+
+    def rows_with_code(self, code):
+        """Every live row with this code, in file order (more than one only if the file repeats it)."""
+        row = self._code_rows.get(code)
+        if row is None:
+            return []
+        rows = [row]
+        extras = self._code_extras.get(code, 0)
+        while extras:
+            row = self.code.index(code, row + 1)
+            if self.alive[row]:
+                rows.append(row)
+                extras -= 1
+        return rows
+
+    # --- Aggregates and Scans ---
+
+    def total_sum(self):
+        """Sum of total marks over all live rows (maintained incrementally)."""
+        return self.aggregates.total_sum
+
+    def extreme_row(self, highest=True):
+        """
+        Returns the row with the highest (or lowest) total mark, taking the
+        first such row in file order on ties, or None if the table is empty.
+        """
+        return self.aggregates.extreme_row(highest)
+
+    def rank_index(self):
+        """Returns the ranking index, building it on first use (like the trigram index)."""
+        if self._rank is None:
+            self._rank = RankIndex.build(self.rows(), self.code, self.total)
+        return self._rank
+
+    def rank_page(self, offset=0, limit=20, descending=True):
+        """
+        Returns one page of row ids ranked by total mark (ties by code), e.g.
+        rank_page(0, 20) for the top 20 students, without sorting the roster.
+        """
+        return self.rank_index().page(offset, limit, descending)
+
+    def ranked_rows(self, descending=True):
+        """Returns a lazy sequence of every row id in rank order."""
+        return RankedRows(self.rank_index(), descending)
+
+    def sorted_rows(self, reverse=False):
+        """
+        Returns live row ids fully sorted by total mark (stable for equal marks,
+        so ties keep their file order). Prefer rank_page/ranked_rows for views.
+        """
+        if HAS_NUMPY:
+            rows = np.fromiter(self.rows(), dtype=np.int64, count=self._live)
+            totals = np.frombuffer(self.total, dtype=np.uint8)[rows]
+            if reverse:
+                # Negate instead of reversing so ties keep their file order
+                order = np.argsort(-totals.astype(np.int16), kind='stable')
+            else:
+                order = np.argsort(totals, kind='stable')
+            return rows[order].tolist()
+        return sorted(self.rows(), key=self.total.__getitem__, reverse=reverse)
+
+    # --- Maintenance ---
+
+    def snapshot(self):
+        """
+        Returns a read-only copy of the rows for use off the Tk thread (for
+        example when writing the file in the background). Columns are copied
+        with a single memcpy each; the lookup indexes are not carried over.
+        """
+        copy = StudentTable()
+        for column in COLUMNS:
+            old = getattr(self, column)
+            setattr(copy, column, array(old.typecode, old))
+        copy.alive = bytearray(self.alive)
+        copy.names = list(self.names)
+        copy._live = self._live
+        return copy
+
+    def compact(self):
+        """Squeezes tombstones out of every column and rebuilds the name pool and indexes."""
+        keep = self.alive
+        for column in COLUMNS:
+            old = getattr(self, column)
+            setattr(self, column, array(old.typecode, compress(old, keep)))
+
+        # Re-interning only the surviving names also rebuilds the name indexes
+        old_names = self.names
+        self.names = []
+        self._name_ids = NameIndex(self.names)
+        self._clear_indexes()
+        self.name_id = array('I', (self._intern(old_names[i]) for i in self.name_id))
+        self.alive = bytearray(b'\x01') * self._live
+        self._index_appended(0)
+
+
+class CodeIndex:
+    """
+    Hash table from student code to row id, for the code lookups every menu
+    action starts with.
+
+    A dict would cost over 100 bytes per student (the table slot plus a boxed
+    int for each code and row); here a single typed array of row ids is
+    probed linearly, 4 bytes per slot and 6-12 bytes per student: codes are
+    not stored but read from the table's code column when a probe lands on
+    them. Deletions shift the rest of the probe run back rather than leaving
+    markers, so lookups never slow down as students come and go.
+    """
+
+    def __init__(self, codes):
+        self.codes = codes  # The table's code column (the table builds a new index when it replaces it)
+        self._allocate(CODE_INDEX_MIN_SLOTS)
+
+    def _allocate(self, slots):
+        self.rows = array('i', [-1]) * slots   # -1 = empty slot
+        self.mask = slots - 1
+        self.shift = 64 - slots.bit_length() + 1
+        self.limit = int(slots * CODE_INDEX_MAX_LOAD)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _home(self, code):
+        return ((code * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+
+    def _slot(self, code):
+        """The slot holding this code, or the empty slot that ends its probe run."""
+        codes, rows, mask = self.codes, self.rows, self.mask
+        i = ((code * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+        while rows[i] >= 0 and codes[rows[i]] != code:
+            i = (i + 1) & mask
+        return i
+
+    def get(self, code):
+        """Row id for the code, or None."""
+        row = self.rows[self._slot(code)]
+        return row if row >= 0 else None
+
+    def __setitem__(self, code, row):
+        i = self._slot(code)
+        if self.rows[i] < 0:
+            i = self._claim(code, i)
+        self.rows[i] = row
+
+    def add(self, code, row):
+        """
+        Maps code (already stored at 'row' in the code column) to row unless it
+        already maps to an earlier row, and returns the row it mapped to before
+        (None if it was absent).
+        """
+        codes, rows, mask = self.codes, self.rows, self.mask
+        i = ((code * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+        while True:
+            held = rows[i]
+            if held < 0:
+                break
+            if codes[held] == code:
+                if row < held:
+                    rows[i] = row
+                return held
+            i = (i + 1) & mask
+        i = self._claim(code, i)
+        self.rows[i] = row
+        return None
+
+    def _claim(self, code, i):
+        """Counts a new code about to go in empty slot i (growing the table first if it is full); returns its slot."""
+        if self.count >= self.limit:
+            self._grow()
+            i = self._slot(code)
+        self.count += 1
+        return i
+
+    def __delitem__(self, code):
+        codes, rows, mask = self.codes, self.rows, self.mask
+        i = self._slot(code)
+        if rows[i] < 0:
+            raise KeyError(code)
+        # Move back any later entry of the run whose home slot the gap would cut it off from
+        j = i
+        while True:
+            j = (j + 1) & mask
+            if rows[j] < 0:
+                break
+            home = self._home(codes[rows[j]])
+            if (home <= i < j) or (i < j < home) or (j < home <= i):
+                rows[i] = rows[j]
+                i = j
+        rows[i] = -1
+        self.count -= 1
+
+    def _grow(self):
+        old_rows, count = self.rows, self.count
+        self._allocate(2 * len(old_rows))
+        codes, rows, mask, shift = self.codes, self.rows, self.mask, self.shift
+        # Every code is distinct, so each one just takes the first free slot from its home
+        for row in old_rows:
+            if row >= 0:
+                i = ((codes[row] * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> shift
+                while rows[i] >= 0:
+                    i = (i + 1) & mask
+                rows[i] = row
+        self.count = count
+
+
+class NameIndex:
+    """
+    Hash index from lowercase name to the pool ids of the names folding to
+    it, serving both interning (exact names) and case-insensitive lookups.
+
+    A dict from name to id costs around 100 bytes per name (its slot and a
+    boxed int), and a lowercase dict as much again plus a lowered copy of
+    each name. Here the table is a single typed array of pool ids probed
+    linearly, 4 bytes per slot: keys are not stored but recomputed from the
+    pool when a probe lands on them. Names only leave the pool when the
+    table compacts, which builds a new index, so entries are never deleted.
+    """
+
+    def __init__(self, names):
+        self.names = names  # The pool itself, shared with the table
+        self._allocate(NAME_INDEX_MIN_SLOTS)
+
+    def _allocate(self, slots):
+        self.ids = array('i', [-1]) * slots   # -1 = empty slot
+        self.mask = slots - 1
+        self.limit = int(slots * NAME_INDEX_MAX_LOAD)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def find(self, lowered):
+        """Every pool id whose name lowercases to 'lowered', in no particular order."""
+        ids, names, mask = self.ids, self.names, self.mask
+        found = []
+        i = hash(lowered) & mask
+        while True:
+            name_id = ids[i]
+            if name_id < 0:
+                return found
+            if names[name_id].lower() == lowered:
+                found.append(name_id)
+            i = (i + 1) & mask
+
+    def setdefault(self, name, lowered, name_id):
+        """
+        Returns the pool id holding exactly 'name', or adds name_id (the id it
+        is about to get) and returns that. Every spelling of a lowercase name
+        lies on the same probe run, so one probe serves the lookup and the insert.
+        """
+        if self.count >= self.limit:
+            self._grow()
+        ids, names, mask = self.ids, self.names, self.mask
+        i = hash(lowered) & mask
+        while True:
+            held = ids[i]
+            if held < 0:
+                break
+            if names[held] == name:
+                return held
+            i = (i + 1) & mask
+        ids[i] = name_id
+        self.count += 1
+        return name_id
+
+    def reserve(self, count):
+        """Grows the table once, ahead of a bulk load, so that it holds 'count' ids without growing again."""
+        slots = len(self.ids)
+        while int(slots * NAME_INDEX_MAX_LOAD) < count:
+            slots *= 2
+        if slots > len(self.ids):
+            self._grow(slots)
+
+    def _grow(self, slots=None):
+        old_ids, count = self.ids, self.count
+        self._allocate(slots or 2 * len(old_ids))
+        ids, mask, names = self.ids, self.mask, self.names
+        for name_id in old_ids:
+            if name_id < 0:
+                continue
+            i = hash(names[name_id].lower()) & mask
+            while ids[i] >= 0:
+                i = (i + 1) & mask
+            ids[i] = name_id
+        self.count = count
+
+
+class MarkAggregates:
+    """
+    Class-wide aggregates over the total-mark column, updated on every add,
+    delete and update so that the summary bar and the highest/lowest queries
+    never scan the roster.
+
+    Besides a running sum, it keeps a count per possible total (0-160) and,
+    for each total, the sorted row ids holding it; the extremes are then the
+    first non-empty bucket from either end, which costs at most TOTAL_DOMAIN
+    steps however large the roster is.
+    """
+
+    def __init__(self):
+        self.total_sum = 0
+        self.count = 0
+        self.histogram = [0] * TOTAL_DOMAIN
+        self.buckets = [array('I') for _ in range(TOTAL_DOMAIN)]  # 4 bytes per row
+
+    def add(self, row, total):
+        self.total_sum += total
+        self.count += 1
+        self.histogram[total] += 1
+        insort(self.buckets[total], row)
+
+    def extend(self, first_row, totals):
+        """Adds rows first_row, first_row + 1, ... with these totals, all after every row already held."""
+        self.total_sum += sum(totals)
+        self.count += len(totals)
+        histogram, buckets = self.histogram, self.buckets
+        for row, total in enumerate(totals, first_row):
+            histogram[total] += 1
+            buckets[total].append(row)
+
+    def remove(self, row, total):
+        self.total_sum -= total
+        self.count -= 1
+        self.histogram[total] -= 1
+        bucket = self.buckets[total]
+        del bucket[bisect_left(bucket, row)]
+
+    def extreme_total(self, highest=True):
+        """Highest (or lowest) total mark present, or None when empty."""
+        totals = range(TOTAL_DOMAIN - 1, -1, -1) if highest else range(TOTAL_DOMAIN)
+        return next((t for t in totals if self.histogram[t]), None)
+
+    def extreme_row(self, highest=True):
+        """First row in file order holding the highest (or lowest) total."""
+        total = self.extreme_total(highest)
+        return None if total is None else self.buckets[total][0]
+
+    def average(self):
+        """Mean total mark, or 0 when empty."""
+        return self.total_sum / self.count if self.count else 0
+
+
+class RankIndex:
+    """
+    Incrementally maintained ranking of rows by total mark, ties broken by
+    student code.
+
+    Rows are bucketed by total (0-160); each bucket is a sorted array of packed
+    (code, row) keys. A page at any offset is found by skipping whole buckets
+    by their length and slicing into the first partially used one, so it
+    costs O(TOTAL_DOMAIN + limit), and an edit only touches one or two buckets.
+    """
+
+    def __init__(self):
+        self.buckets = [array('Q') for _ in range(TOTAL_DOMAIN)]
+        self.count = 0
+
+    @classmethod
+    def build(cls, rows, codes, totals):
+        """Builds the index in one pass over the given rows (sorting each bucket once)."""
+        grouped = [[] for _ in range(TOTAL_DOMAIN)]
+        for row in rows:
+            grouped[totals[row]].append(cls.key(codes[row], row))
+        index = cls()
+        for total, keys in enumerate(grouped):
+            keys.sort()
+            index.buckets[total] = array('Q', keys)
+            index.count += len(keys)
+        return index
+
+    @staticmethod
+    def key(code, row):
+        return (code + CODE_BIAS) << 32 | row
+
+    def add(self, row, code, total):
+        insort(self.buckets[total], self.key(code, row))
+        self.count += 1
+
+    def remove(self, row, code, total):
+        bucket = self.buckets[total]
+        del bucket[bisect_left(bucket, self.key(code, row))]
+        self.count -= 1
+
+    def page(self, offset=0, limit=20, descending=True):
+        """Row ids at rank positions [offset, offset + limit)."""
+        rows = []
+        totals = range(TOTAL_DOMAIN - 1, -1, -1) if descending else range(TOTAL_DOMAIN)
+        for total in totals:
+            bucket = self.buckets[total]
+            if offset >= len(bucket):
+                offset -= len(bucket)
+                continue
+            rows.extend(key & ROW_MASK for key in bucket[offset:offset + limit - len(rows)])
+            offset = 0
+            if len(rows) >= limit:
+                break
+        return rows
+
+
+class RankedRows(Sequence):
+    """Lazy, always-current sequence of row ids in rank order over a RankIndex."""
+
+    def __init__(self, rank, descending=True):
+        self.rank = rank
+        self.descending = descending
+
+    def __len__(self):
+        return self.rank.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            positions = range(*index.indices(len(self)))
+            if not positions:
+                return []
+            # One page covering every position asked for, whichever way the slice steps
+            low = min(positions[0], positions[-1])
+            page = self.rank.page(low, abs(positions[-1] - positions[0]) + 1, self.descending)
+            return [page[i - low] for i in positions]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("rank position out of range")
+        return self.rank.page(index, 1, self.descending)[0]
+
+
+class LiveRows(Sequence):
+    """
+    The live row ids of a table at one moment, in file order. Rather than a
+    list of every row id (some 40 bytes each), it keeps a copy of the alive
+    flags (one byte per row) and a running live count per LIVE_BLOCK_ROWS
+    rows, so indexing finds the block by bisection and scans only that block.
+    """
+
+    def __init__(self, alive):
+        self.alive = bytes(alive)
+        self.ends = array('I', accumulate(self.alive.count(1, start, start + LIVE_BLOCK_ROWS)
+                                          for start in range(0, len(self.alive), LIVE_BLOCK_ROWS)))
+
+    def __len__(self):
+        return self.ends[-1] if self.ends else 0
+
+    def _rows_from(self, index):
+        """Iterates over the live row ids from the index-th one on."""
+        block = bisect_right(self.ends, index)
+        start = block * LIVE_BLOCK_ROWS
+        skip = index - (self.ends[block - 1] if block else 0)
+        return islice(compress(range(start, len(self.alive)), memoryview(self.alive)[start:]), skip, None)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step < 0:
+                return [self[i] for i in range(start, stop, step)]
+            return list(islice(self._rows_from(start), 0, max(0, stop - start), step))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        return next(self._rows_from(index))
+
+    def __iter__(self):
+        return compress(range(len(self.alive)), self.alive)
+
+
+class RecordView(Sequence):
+    """
+    Read-only sequence of student dictionaries over a list of row ids. Records
+    are only materialized when indexed, so a view over a million rows is cheap
+    to create and to hand to a virtual-scrolling display.
+    """
+
+    def __init__(self, table, rows):
+        self.table = table
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.table.record(row) for row in self.rows[index]]
+        return self.table.record(self.rows[index])
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The exercise modules import each other as top-level modules, so the tests
+# run with the exercise folder on the path, as the app and CLI do.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,13 @@
+from student_engine import format_record_line, process_record
+
+
+def record(code, name, cw1=10, cw2=10, cw3=10, exam=50):
+    """A student record as process_record makes it."""
+    return process_record([str(code), name, str(cw1), str(cw2), str(cw3), str(exam)])
+
+
+def write_marks(tmp_path, records, name='marks.txt'):
+    """Writes a text marks file holding the records and returns its path."""
+    path = tmp_path / name
+    path.write_text(f"{len(records)}\n" + "".join(format_record_line(r) + "\n" for r in records))
+    return str(path)
@@ -0,0 +1,50 @@
+import pytest
+from student_engine import chunk_boundaries, iter_column_batches
+
+LINES = [b'3\n', b'1001,Ann Lee,10,10,10,50\n', b'1002,Bob Ray,11,12,13,60\n',
+         b'1003,Cy Moss,5,5,5,40\n']
+LINE_ENDS = [sum(map(len, LINES[:i + 1])) for i in range(len(LINES))]
+
+
+@pytest.fixture
+def marks_path(tmp_path):
+    path = tmp_path / 'marks.txt'
+    path.write_bytes(b''.join(LINES))
+    return str(path)
+
+
+def check_contiguous(bounds, first, last):
+    assert bounds[0][0] == first and bounds[-1][1] == last
+    for (_, stop), (start, _) in zip(bounds, bounds[1:]):
+        assert stop == start
+
+
+@pytest.mark.parametrize('chunk_bytes', [1, 7, 30, 1 << 20])
+def test_chunks_cover_every_line_after_the_count(marks_path, chunk_bytes):
+    bounds = chunk_boundaries(marks_path, chunk_bytes)
+    check_contiguous(bounds, LINE_ENDS[0], LINE_ENDS[-1])
+    assert all(stop in LINE_ENDS for _, stop in bounds)
+
+
+@pytest.mark.parametrize('chunk_bytes', [1, 7, 30, 1 << 20])
+def test_chunks_stop_at_the_end_bound(marks_path, chunk_bytes):
+    end = LINE_ENDS[2]
+    bounds = chunk_boundaries(marks_path, chunk_bytes, end=end)
+    check_contiguous(bounds, LINE_ENDS[0], end)
+
+
+def test_chunks_never_pass_an_end_inside_a_line(marks_path):
+    end = LINE_ENDS[2] + 5  # A line still being appended
+    bounds = chunk_boundaries(marks_path, 4, end=end)
+    assert bounds[-1][1] == end
+    assert all(stop <= end for _, stop in bounds)
+
+
+def test_end_inside_the_count_line(marks_path):
+    assert chunk_boundaries(marks_path, 4, end=1) == []
+
+
+def test_batch_progress_never_passes_one(marks_path):
+    end = LINE_ENDS[2] + 5
+    fractions = [batch[-1] for batch in iter_column_batches(marks_path, batch_bytes=4, end=end)]
+    assert fractions and all(0 <= f <= 1 for f in fractions)
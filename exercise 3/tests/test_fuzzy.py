@@ -0,0 +1,37 @@
+import random
+import pytest
+from student_fuzzy import FuzzyNameIndex, MAX_DISTANCE, edit_distance
+
+
+def brute_force(names, query, max_distance):
+    return sorted((d, name) for name in names if (d := edit_distance(query, name)) <= max_distance)
+
+
+@pytest.mark.parametrize('alphabet', ['ab', 'abc', 'abcdef '])
+def test_search_finds_exactly_the_names_within_reach(alphabet):
+    rng = random.Random(len(alphabet))
+    names = list({''.join(rng.choices(alphabet, k=rng.randrange(1, 12))) for _ in range(600)})
+    # Some names indexed up front, the rest added one by one into smaller runs
+    index = FuzzyNameIndex(names[:len(names) // 2])
+    for name in names[len(names) // 2:]:
+        index.add(name)
+    for _ in range(40):
+        query = ''.join(rng.choices(alphabet, k=rng.randrange(1, 12)))
+        for max_distance in range(MAX_DISTANCE + 1):
+            assert index.search(query, max_distance) == brute_force(names, query, max_distance)
+
+
+def test_surname_typos_on_a_roster_sharing_long_prefixes():
+    rng = random.Random(5)
+    names = sorted({f"{first} {last}{''.join(rng.choices('abcdefghij', k=3))}"
+                    for first in ('ann', 'bo') for last in ('lee', 'leeds', 'ray') for _ in range(300)})
+    index = FuzzyNameIndex(names)
+    for name in rng.sample(names, 30):
+        typo = name[:-2] + name[-1]
+        assert index.search(typo) == brute_force(names, typo, MAX_DISTANCE)
+
+
+def test_radius_is_bounded():
+    with pytest.raises(ValueError):
+        FuzzyNameIndex(['ann']).search('ann', MAX_DISTANCE + 1)
+    assert FuzzyNameIndex(['ann']).search('') == []
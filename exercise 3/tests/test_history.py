@@ -0,0 +1,112 @@
+import pytest
+from student_history import EditHistory
+from student_shards import write_sharded_roster
+from student_storage import import_marks_file, open_store
+from helpers import record, write_marks
+
+# Student 1001 appears twice, as marks files may repeat a code
+ROSTER = [record(1001, 'Ann Lee'), record(1002, 'Bob Ray'), record(1001, 'Cat Lee', exam=70), record(2001, 'Di Kent')]
+
+
+@pytest.fixture(params=['text', 'rewrite', 'sqlite', 'shards'])
+def reopen(request, tmp_path):
+    """A function (re)opening the roster through one backend, closing the store it opened before."""
+    path = write_marks(tmp_path, ROSTER)
+    if request.param == 'sqlite':
+        path = str(tmp_path / 'marks.db')
+        import_marks_file(write_marks(tmp_path, ROSTER, name='source.txt'), path)
+    elif request.param == 'shards':
+        path = str(tmp_path / 'roster.shards.json')
+        write_sharded_roster(write_marks(tmp_path, ROSTER, name='source.txt'), path, width=1000)
+    opened = []
+
+    def open_roster():
+        if opened:
+            opened.pop().close()
+        store = open_store(path, use_journal=request.param != 'rewrite')
+        store.load()
+        opened.append(store)
+        return store
+
+    yield open_roster
+    if opened:
+        opened.pop().close()
+
+
+def names(store):
+    return [r['name'] for r in store.records()]
+
+
+def without(store, *removed):
+    return [name for name in names(store) if name not in removed]
+
+
+def test_undoing_a_delete_restores_the_student_in_place(reopen):
+    store = reopen()
+    history = EditHistory(store)
+    original = names(store)
+    history.apply(deletes=[1001], description="Delete")
+    assert names(store) == without(store, 'Ann Lee') != original
+
+    assert history.undo() == "Delete"
+    assert names(store) == original
+    assert store.get(1001)['name'] == 'Ann Lee'
+    assert names(reopen()) == original
+
+
+def test_redo_deletes_the_same_student_again(reopen):
+    store = reopen()
+    history = EditHistory(store)
+    deleted = without(store, 'Ann Lee')
+    history.apply(deletes=[1001])
+    for _ in range(2):
+        history.undo()
+        history.redo()
+        assert names(store) == deleted
+    assert names(reopen()) == deleted
+
+
+def test_undoing_a_delete_of_both_duplicates(reopen):
+    store = reopen()
+    history = EditHistory(store)
+    original = [(r['name'], r['exam']) for r in store.records()]
+    history.apply(deletes=[1001, 1001])
+    assert names(store) == ['Bob Ray', 'Di Kent']
+    history.undo()
+    assert [(r['name'], r['exam']) for r in store.records()] == original
+    assert [(r['name'], r['exam']) for r in reopen().records()] == original
+
+
+def test_undoing_an_update_leaves_the_duplicate_alone(reopen):
+    store = reopen()
+    history = EditHistory(store)
+    original = {r['name']: r['exam'] for r in store.records()}
+    history.apply(puts=[record(1001, 'Ann Lee', exam=99)])
+    assert {r['name']: r['exam'] for r in store.records()} == dict(original, **{'Ann Lee': 99})
+    history.undo()
+    assert {r['name']: r['exam'] for r in store.records()} == original
+    history.redo()
+    assert {r['name']: r['exam'] for r in reopen().records()} == dict(original, **{'Ann Lee': 99})
+
+
+def test_a_run_of_edits_undone_and_redone_in_order(reopen):
+    store = reopen()
+    history = EditHistory(store)
+    states = [names(store)]
+    history.apply(puts=[record(1003, 'Eve Hart')])
+    states.append(names(store))
+    history.apply(deletes=[1001])
+    states.append(names(store))
+    history.apply(deletes=[1001])
+    states.append(names(store))
+    history.apply(puts=[record(1002, 'Bob Rae')], deletes=[2001])
+    states.append(names(store))
+    assert len(set(map(tuple, states))) == len(states)
+
+    for state in reversed(states[:-1]):
+        history.undo()
+        assert names(store) == state
+    for state in states[1:]:
+        history.redo()
+        assert names(store) == state
+    assert names(reopen()) == states[-1]
@@ -0,0 +1,124 @@
+import os
+import threading
+import student_journal
+import student_saver
+from student_journal import ChangeJournal
+from student_storage import TextMarksStore
+from helpers import record, write_marks
+
+ROSTER = [record(1001, 'Ann Lee'), record(1002, 'Bob Ray'), record(1001, 'Ann Lee', exam=70)]
+
+
+def roster(path):
+    store = TextMarksStore(path)
+    try:
+        store.load()
+        return [(r['code'], r['name'], r['exam']) for r in store.records()]
+    finally:
+        store.close()
+
+
+def edit_and_compact(path):
+    """Deletes the first student 1001 and renames 1002, then folds the journal into the base file."""
+    store = TextMarksStore(path)
+    store.load()
+    store.apply(deletes=[1001])
+    store.journal.threshold = 0  # The next edit compacts
+    store.apply(puts=[record(1002, 'Bob Rae')])
+    store.close()
+
+EDITED = [(1002, 'Bob Rae', 50), (1001, 'Ann Lee', 70)]
+
+
+def test_replay_applies_edits_on_top_of_the_base_file(tmp_path):
+    path = write_marks(tmp_path, ROSTER)
+    store = TextMarksStore(path)
+    store.load()
+    store.apply(puts=[record(1003, 'Cy Moss'), record(1002, 'Bob Rae')], deletes=[1001])
+    store.close()
+    assert os.path.getsize(path + student_journal.JOURNAL_SUFFIX)
+    assert roster(path) == [(1002, 'Bob Rae', 50), (1001, 'Ann Lee', 70), (1003, 'Cy Moss', 50)]
+
+
+def test_compaction_folds_the_journal_into_the_base_file(tmp_path):
+    path = write_marks(tmp_path, ROSTER)
+    edit_and_compact(path)
+    assert not os.path.exists(path + student_journal.COMPACTING_SUFFIX)
+    assert not os.path.exists(path + student_journal.JOURNAL_SUFFIX) or \
+        not os.path.getsize(path + student_journal.JOURNAL_SUFFIX)
+    assert roster(path) == EDITED
+
+
+def test_journal_left_after_the_rename_is_not_replayed_again(tmp_path, monkeypatch):
+    path = write_marks(tmp_path, ROSTER)
+    real_remove = os.remove
+
+    def crash_on_cleanup(name):
+        if name.endswith(student_journal.COMPACTING_SUFFIX):
+            raise OSError("crashed before the folded journal was removed")
+        real_remove(name)
+
+    monkeypatch.setattr(student_journal.os, 'remove', crash_on_cleanup)
+    edit_and_compact(path)
+    monkeypatch.undo()
+    assert os.path.getsize(path + student_journal.COMPACTING_SUFFIX)
+    # Replaying D,1001 again would delete the second student 1001 as well
+    assert roster(path) == EDITED
+
+
+def test_journal_is_replayed_when_the_new_base_never_landed(tmp_path, monkeypatch):
+    path = write_marks(tmp_path, ROSTER)
+
+    real_replace = os.replace
+
+    def crash_on_rename(source, target):
+        if target == path:
+            raise OSError("crashed before the rename")
+        real_replace(source, target)
+
+    monkeypatch.setattr(student_saver.os, 'replace', crash_on_rename)
+    edit_and_compact(path)
+    monkeypatch.undo()
+    assert os.path.getsize(path + student_journal.COMPACTING_SUFFIX)
+    assert roster(path) == EDITED
+
+
+def test_interrupted_compaction_then_a_later_one(tmp_path, monkeypatch):
+    path = write_marks(tmp_path, ROSTER)
+    real_remove = os.remove
+    monkeypatch.setattr(student_journal.os, 'remove',
+                        lambda name: None if name.endswith(student_journal.COMPACTING_SUFFIX) else real_remove(name))
+    edit_and_compact(path)
+    store = TextMarksStore(path)
+    store.load()
+    store.journal.threshold = 0
+    store.apply(deletes=[1001])  # Appended to the left-over journal, then compacted again
+    store.close()
+    monkeypatch.undo()
+    assert roster(path) == [(1002, 'Bob Rae', 50)]
+
+
+def test_save_waits_for_a_running_compaction(tmp_path):
+    path = write_marks(tmp_path, ROSTER)
+    store = TextMarksStore(path)
+    store.load()
+    started, release = threading.Event(), threading.Event()
+
+    def slow_stale_write(temp_path):
+        started.set()
+        release.wait(5)
+        write_marks(tmp_path, ROSTER[:1], name=os.path.basename(temp_path))
+
+    store.apply(deletes=[1002])
+    store.flush()
+    store.journal.compact_async(slow_stale_write)
+    started.wait(5)
+    threading.Timer(0.2, release.set).start()
+    store.apply(puts=[record(1004, 'Di Kent')])
+    store.save()
+    store.close()
+    assert roster(path) == [(1001, 'Ann Lee', 50), (1001, 'Ann Lee', 70), (1004, 'Di Kent', 50)]
+
+
+def test_entry_lines():
+    assert ChangeJournal.entry(['1001,Ann Lee,10,10,10,50'], [1002]) == "P,1001,Ann Lee,10,10,10,50\nD,1002\n"
@@ -0,0 +1,79 @@
+import random
+import pytest
+import student_query
+from student_query import QueryError, compile_query
+from student_storage import SqliteMarksStore
+from student_table import StudentTable
+from helpers import record
+
+QUERIES = [
+    "grade in (A, B) and exam >= 80",
+    "not (cw1 = 0 or cw2 = 0 or cw3 = 0)",
+    "code in (1003, 1017, 1017, 4000) or percentage < 40",
+    "name ~ 'lee' and total > 70",
+    "name = 'ann lee' or name = \"Bo Ray\"",
+    "coursework >= 45 and not grade = F",
+    "code >= 1100 and code < 1150",
+    "code != 1005 and pct >= 62.5",
+    "total_mark = 100",
+    "name ~ ray or code = 1040",
+]
+
+
+@pytest.fixture(scope='module')
+def students():
+    rng = random.Random(7)
+    names = ['Ann Lee', 'Bo Ray', 'Cal Leeds', 'Dee Murray', 'Eve Hart', 'Fin Oakley']
+    # Codes repeat now and then, as marks files may repeat them
+    return [record(1000 + rng.randrange(180), rng.choice(names), rng.randrange(21), rng.randrange(21),
+                   rng.randrange(21), rng.randrange(101)) for _ in range(300)]
+
+
+@pytest.fixture(scope='module')
+def table(students):
+    table = StudentTable(students)
+    for row in range(0, 300, 7):
+        table.delete(row)  # Tombstones must never be selected
+    return table
+
+
+def expected_rows(query, table):
+    return [row for row in table.rows() if query.matches(table.record(row))]
+
+
+@pytest.mark.parametrize('text', QUERIES)
+def test_index_plans_match_the_record_test(text, table):
+    query = compile_query(text)
+    assert query.select_rows(table) == expected_rows(query, table)
+
+
+@pytest.mark.parametrize('text', QUERIES)
+def test_scans_match_the_record_test(text, table):
+    query = compile_query(text)
+    assert student_query._scan(query.tree, table) == expected_rows(query, table)
+
+
+@pytest.mark.parametrize('text', QUERIES)
+def test_sql_matches_the_record_test(text, students, tmp_path):
+    store = SqliteMarksStore(str(tmp_path / 'marks.db'))
+    try:
+        store.replace_all(students)
+        query = compile_query(text)
+        assert list(store.select(query)) == [r for r in students if query.matches(r)]
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize('text', QUERIES)
+def test_may_match_never_rules_out_a_match(text, students):
+    query = compile_query(text)
+    for low in range(1000, 1180, 30):
+        group = [r for r in students if low <= r['code'] < low + 30]
+        if any(map(query.matches, group)):
+            assert query.may_match(low, low + 29, {r['total_mark'] for r in group})
+
+
+@pytest.mark.parametrize('text', ["exam >", "grade in (A,", "name < 'x'", "height = 3", "exam = 5 5"])
+def test_malformed_queries_are_refused(text):
+    with pytest.raises(QueryError):
+        compile_query(text)
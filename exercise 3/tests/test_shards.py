@@ -0,0 +1,54 @@
+import pytest
+from student_shards import ShardedMarksStore, write_sharded_roster
+from helpers import record, write_marks
+
+ROSTER = [(1005, 'Eve Hart', 50), (1001, 'Ann Lee', 50), (2002, 'Bob Ray', 70),
+          (2001, 'Cy Moss', 50), (3001, 'Di Kent', 70), (3003, 'Fay Lowe', 30)]
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    source = write_marks(tmp_path, [record(code, name, exam=exam) for code, name, exam in ROSTER])
+    manifest = str(tmp_path / 'roster.shards.json')
+    assert write_sharded_roster(source, manifest, width=1000) == 3
+    store = ShardedMarksStore(manifest)
+    store.load()
+    yield store
+    store.close()
+
+
+def loaded(store):
+    return [shard.store is not None for shard in store.shards]
+
+
+def test_a_code_lookup_loads_only_its_shard(sharded):
+    assert sharded.get(2001)['name'] == 'Cy Moss'
+    assert loaded(sharded) == [False, True, False]
+    assert sharded.get(2500) is None
+    assert sharded.get(9999) is None  # Past the last shard's highest code: nothing is loaded
+    assert loaded(sharded) == [False, True, False]
+
+
+def test_edits_go_to_the_shard_owning_each_code(sharded):
+    sharded.apply(puts=[record(3002, 'Gus Pike'), record(1001, 'Ann Lee', exam=90)], deletes=[2002])
+    assert loaded(sharded) == [True, True, True]
+    assert [r['code'] for r in sharded.shards[2].store.records()] == [3001, 3003, 3002]
+    assert sharded.shards[0].store.get(1001)['exam'] == 90
+    assert sharded.get(2002) is None
+    sharded.close()
+
+    reopened = ShardedMarksStore(sharded.path)
+    reopened.load()
+    try:
+        assert [r['code'] for r in reopened.records()] == [1001, 1005, 2001, 3001, 3003, 3002]
+        assert reopened.summary()[0] == 6
+    finally:
+        reopened.close()
+
+
+def test_ranking_breaks_ties_by_code_across_shards(sharded):
+    descending = [(100, 2002), (100, 3001), (80, 1001), (80, 1005), (80, 2001), (60, 3003)]
+    assert [(r['total_mark'], r['code']) for r in sharded.ranked()] == descending
+    ascending = sharded.ranked(descending=False)
+    assert [(r['total_mark'], r['code']) for r in ascending] == sorted(descending)
+    assert [r['code'] for r in ascending[1:4]] == [1001, 1005, 2001]
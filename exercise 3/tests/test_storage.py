@@ -0,0 +1,21 @@
+from student_binary import write_binary_marks_file
+from student_storage import TextMarksStore
+from helpers import record
+
+
+def test_cancelled_load_stops_answering_from_the_file(tmp_path):
+    path = str(tmp_path / 'marks.bin')
+    write_binary_marks_file(path, [record(1001, 'Ann Lee'), record(1002, 'Bob Ray')])
+    store = TextMarksStore(path)
+    store.load()
+    store.apply(deletes=[1001])
+    store.close()
+
+    store = TextMarksStore(path)
+    try:
+        store.begin_load()
+        assert store.get(1002)['name'] == 'Bob Ray'  # Served from the file while loading
+        store.abandon_load()
+        assert store.get(1001) is None and store.get(1002) is None
+    finally:
+        store.close()
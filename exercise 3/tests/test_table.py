@@ -0,0 +1,55 @@
+import random
+import pytest
+from student_table import StudentTable
+from helpers import record
+
+
+def codes(table):
+    return [r['code'] for r in table.records()]
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_insert_puts_a_deleted_row_back_in_place(compact):
+    table = StudentTable(record(code, f"Student {code}") for code in (5, 3, 5, 1))
+    row = table.rows_with_code(5)[0]
+    position, deleted = table.position(row), table.record(row)
+    table.delete(row)
+    if compact:
+        table.compact()  # No tombstone left to reuse
+    table.insert(position, deleted)
+    assert codes(table) == [5, 3, 5, 1]
+    assert table.rows_with_code(5) == [table.find_code(5), table.rows_with_code(5)[1]]
+    assert table.record(table.find_code(5)) == deleted
+    assert table.find_name('student 5') == table.find_code(5)
+    assert table.extreme_row() == table.find_code(5)
+
+
+def test_insert_past_the_end_appends():
+    table = StudentTable([record(1, 'Ann Lee')])
+    table.insert(7, record(2, 'Bob Ray'))
+    assert codes(table) == [1, 2]
+
+
+def test_code_index_survives_growth_deletes_and_compaction():
+    table = StudentTable(record(code % 700, f"Student {code}") for code in range(1000))
+    for code in range(0, 700, 3):
+        table.delete(table.find_code(code))
+    table.compact()
+    for code in range(700):
+        rows = table.rows_with_code(code)
+        assert [table.record(row)['code'] for row in rows] == [code] * len(rows)
+        assert table.find_code(code) == (rows[0] if rows else None)
+        assert len(rows) == (code < 300) + (code % 3 != 0)
+
+
+def test_partial_name_search_finds_the_first_match_in_file_order():
+    rng = random.Random(3)
+    first, last = ['Ann', 'Bo', 'Cal', 'Dee', 'Eve'], ['Lee', 'Ray', 'Leeds', 'Murray', 'Hart']
+    table = StudentTable(record(code, f"{rng.choice(first)} {rng.choice(last)} {rng.randrange(50)}")
+                         for code in range(3000))
+    for row in range(0, 3000, 3):
+        table.delete(row)
+    fragments = ['ann', 'ay', 'e', 'lee', 'murray 4', 'DS 1', 'bo ray 49', 'zed', 'n l', 'x']
+    for fragment in fragments:
+        expected = next((row for row in table.rows() if fragment.lower() in table.name(row).lower()), None)
+        assert table.find_name(fragment, partial=True) == expected, fragment
@@ -0,0 +1,103 @@
+import tkinter as tk
+from tkinter import ttk
+from student_metrics import METRICS
+
+# --- Virtual Scrolling ---
+#
+# A ttk.Treeview keeps every inserted row alive inside Tk, so inserting a whole
+# roster is slow and memory-hungry. VirtualTreeview instead keeps a small pool
+# of item "slots" (one per visible row plus OVERSCAN) and refills their values
+# from a Python sequence as the scrollbar moves. Only slots whose values
+# actually changed are touched, so refreshing after an edit is a cheap diff.
+
+OVERSCAN = 2            # Extra slots below the visible window
+WHEEL_UNITS = 3         # Rows scrolled per mouse-wheel notch
+
+
+class VirtualTreeview:
+    """Drives a Treeview and its scrollbar as a window onto a (possibly huge) sequence."""
+
+    def __init__(self, tree, scrollbar, overscan=OVERSCAN):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.overscan = overscan
+        self.source = []
+        self.render_row = tuple
+        self.first = 0
+        self.slots = []          # Treeview item ids, top to bottom
+        self.slot_values = []    # Values currently shown in each slot
+
+        scrollbar.configure(command=self._on_scrollbar)
+        tree.bind('<Configure>', lambda e: self.refresh())
+        tree.bind('<MouseWheel>', self._on_wheel)
+        tree.bind('<Button-4>', lambda e: self.scroll_by(-WHEEL_UNITS))
+        tree.bind('<Button-5>', lambda e: self.scroll_by(WHEEL_UNITS))
+
+    def set_source(self, source, render_row, keep_position=False):
+        """
+        Shows a new sequence. 'render_row(item)' turns one element into the
+        tuple of column values. With keep_position the scroll offset is kept
+        (e.g. after an edit), otherwise the view returns to the top.
+        """
+        self.source = source
+        self.render_row = render_row
+        if not keep_position:
+            self.first = 0
+        self.refresh()
+
+    def visible_rows(self):
+        """Number of rows that fit in the Treeview's current height."""
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        # One row's worth of height is taken by the heading
+        return max(1, self.tree.winfo_height() // row_height - 1)
+
+    def scroll_to(self, first):
+        self.first = first
+        self.refresh()
+
+    def scroll_by(self, rows):
+        self.scroll_to(self.first + rows)
+        return 'break'
+
+    @METRICS.timed('render')
+    def refresh(self):
+        """Re-renders the visible window, updating only slots whose values changed."""
+        total = len(self.source)
+        visible = self.visible_rows()
+        self.first = max(0, min(self.first, total - visible))
+        count = max(0, min(total - self.first, visible + self.overscan))
+
+        values = [self.render_row(self.source[self.first + i]) for i in range(count)]
+
+        # Grow or shrink the slot pool to match the window
+        while len(self.slots) < count:
+            self.slots.append(self.tree.insert('', tk.END, values=()))
+            self.slot_values.append(None)
+        if len(self.slots) > count:
+            self.tree.delete(*self.slots[count:])
+            del self.slots[count:]
+            del self.slot_values[count:]
+
+        for i, new in enumerate(values):
+            if self.slot_values[i] != new:
+                self.tree.item(self.slots[i], values=new)
+                self.slot_values[i] = new
+
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    # --- Event Handlers ---
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.scroll_to(int(float(amount) * len(self.source)))
+        elif action == 'scroll':
+            step = self.visible_rows() if unit == 'pages' else 1
+            self.scroll_by(int(amount) * step)
+
+    def _on_wheel(self, event):
+        # Windows reports multiples of 120 per notch, macOS small raw deltas
+        notches = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self.scroll_by(-notches * WHEEL_UNITS)
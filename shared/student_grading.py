@@ -0,0 +1,80 @@
+import json
+import functools
+from collections import namedtuple
+
+# --- Grading Schemes ---
+#
+# A grading scheme names the lowest percentage that earns each grade, plus the
+# grade for everything below. Schemes live in a JSON config, keyed by name:
+#
+#     "student-marks": {"boundaries": {"A": 70, "B": 60, "C": 50, "D": 40}, "otherwise": "F"}
+#
+# Marks are integers, so a scheme is compiled once per maximum score into a
+# GradeTable holding the grade of every possible score: grading a score is
+# then one index, table.grade[score] (or table.index[score] for its position
+# in scheme.grades, best first).
+#
+# This module is shared by the exercises, each of which keeps its own config
+# next to it: the Student Manager (exercise 3) grades totals out of 160 by
+# its 'student-marks' scheme, the maths quiz (exercise 1) scores out of 100
+# by 'math-quiz'.
+
+# grade: score -> grade name; index: score -> position in the scheme's grades (one byte each)
+GradeTable = namedtuple('GradeTable', 'grades grade index')
+
+
+class GradingScheme:
+    """Named grade boundaries (lowest percentage per grade), compiled into lookup tables on demand."""
+
+    def __init__(self, name, boundaries, otherwise):
+        self.name = name
+        # Highest boundary first, so the first one a percentage reaches is its grade
+        self.boundaries = tuple(sorted(boundaries.items(), key=lambda item: -item[1]))
+        self.otherwise = otherwise
+        self.grades = tuple(grade for grade, _ in self.boundaries) + (otherwise,)
+        self._tables = {}  # max_score -> GradeTable
+
+    def __repr__(self):
+        return f"GradingScheme({self.name!r})"
+
+    def grade(self, percentage):
+        """The grade for any percentage (use a compiled table for integer scores)."""
+        for grade, lowest in self.boundaries:
+            if percentage >= lowest:
+                return grade
+        return self.otherwise
+
+    def compile(self, max_score):
+        """The GradeTable for integer scores 0..max_score, graded as score / max_score * 100 percent."""
+        table = self._tables.get(max_score)
+        if table is None:
+            grades = [self.grade(score / max_score * 100) for score in range(max_score + 1)]
+            index = {grade: i for i, grade in enumerate(self.grades)}
+            table = self._tables[max_score] = GradeTable(self.grades, tuple(grades), bytes(index[grade] for grade in grades))
+        return table
+
+
+def _parse_scheme(name, spec):
+    try:
+        boundaries, otherwise = spec['boundaries'], spec['otherwise']
+    except (TypeError, KeyError) as e:
+        raise ValueError(f"grading scheme {name!r} needs 'boundaries' and 'otherwise'") from e
+    if not isinstance(boundaries, dict) or not all(isinstance(lowest, (int, float)) for lowest in boundaries.values()):
+        raise ValueError(f"grading scheme {name!r}: 'boundaries' must map each grade to its lowest percentage")
+    if otherwise in boundaries or len(boundaries) + 1 > 256:
+        raise ValueError(f"grading scheme {name!r}: grades must be distinct (at most 256)")
+    return GradingScheme(name, boundaries, otherwise)
+
+@functools.lru_cache(maxsize=None)
+def load_schemes(path):
+    """Reads every scheme in a config file: {name: GradingScheme}. Raises ValueError if one is malformed."""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return {name: _parse_scheme(name, spec) for name, spec in config.items()}
+
+def get_scheme(name, path):
+    """The named scheme from the config file (read once)."""
+    schemes = load_schemes(path)
+    if name not in schemes:
+        raise ValueError(f"no grading scheme named {name!r} in {path} (found {', '.join(schemes)})")
+    return schemes[name]